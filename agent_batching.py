@@ -0,0 +1,92 @@
+# agent_batching.py
+import asyncio
+import json
+import re
+from typing import Dict, List, Optional
+
+from agent_config import Settings, log
+from agent_helpers import a_chat, extract_json_from_response
+from agent_metrics import count
+
+ITEM_MARKER = "### ITEM"
+_BATCH_INSTRUCTIONS = (
+    "\n\nYou will receive {n} numbered items. Follow the instructions above for each item on its own, as if it were "
+    "the only one. Answer with one block per item, in order, each starting with a line `" + ITEM_MARKER + " <number>` "
+    "followed by the answer for that item only. Write nothing before the first block."
+)
+# "### ITEM 3", "**ITEM 3:**", "ITEM 3" on a line of their own.
+_ITEM_LINE = re.compile(r"^[ \t]*(?:#+[ \t]*)?\**[ \t]*ITEM[ \t]+(\d+)[ \t]*\**[ \t]*:?[ \t]*\**[ \t]*$", re.IGNORECASE | re.MULTILINE)
+
+
+def format_batch(system: str, items: List[str]) -> List[Dict[str, str]]:
+    """The messages of one multi-item request: `system` plus the answer format, and the numbered items."""
+    return [{"role": "system", "content": system + _BATCH_INSTRUCTIONS.format(n=len(items))},
+            {"role": "user", "content": "\n\n".join(f"{ITEM_MARKER} {i}\n{item}" for i, item in enumerate(items, 1))}]
+
+
+def parse_batch(raw: str, n: int) -> Dict[int, str]:
+    """
+    The answers found in a multi-item response, by 0-based item index. Blocks headed by an item
+    line are read first; a JSON object keyed by item number or a list of `n` strings is accepted
+    too. Missing, empty and out-of-range items are simply absent.
+    """
+    answers: Dict[int, str] = {}
+    headers = list(_ITEM_LINE.finditer(raw))
+    for header, following in zip(headers, headers[1:] + [None]):
+        index = int(header.group(1)) - 1
+        text = raw[header.end():following.start() if following else len(raw)].strip()
+        if 0 <= index < n and text and index not in answers: answers[index] = text
+    if answers or not ("{" in raw or "[" in raw): return answers
+    json_str = extract_json_from_response(raw)
+    try:
+        data = json.loads(json_str) if json_str else None
+    except json.JSONDecodeError:
+        return {}
+    if isinstance(data, dict):
+        data = data.get("items", data.get("results", data))
+    if isinstance(data, list) and len(data) == n:
+        return {i: str(v).strip() for i, v in enumerate(data) if isinstance(v, (str, int, float)) and str(v).strip()}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if str(key).strip().isdigit() and isinstance(value, str) and value.strip() and 0 < int(key) <= n:
+                answers[int(key) - 1] = value.strip()
+    return answers
+
+
+async def a_chat_batch(system: str, items: List[str], model: Optional[str] = None, temp: float = 0.5, max_tokens: int = 1024,
+                       task: Optional[str] = None, batch_size: Optional[int] = None) -> List[str]:
+    """
+    Answers homogeneous chat calls -- one `system` prompt, one user message per item, up to
+    `max_tokens` each -- in as few requests as possible.
+
+    Items are sent `batch_size` at a time (default `PROMPT_BATCH_SIZE`, fewer if the combined
+    completion would exceed `PROMPT_BATCH_MAX_TOKENS`) as one numbered multi-item prompt, and
+    the groups run concurrently. Items whose answer cannot be parsed out of the response are
+    asked again on their own, so the result is never worse than separate calls. Returns one
+    answer per item, in order; like `a_chat`, a failed answer starts with "Error:".
+    """
+    if not items: return []
+    size = Settings.PROMPT_BATCH_SIZE if batch_size is None else batch_size
+    size = max(1, min(size, Settings.PROMPT_BATCH_MAX_TOKENS // max(1, max_tokens)))
+    groups = [items[i:i + size] for i in range(0, len(items), size)]
+    answers = await asyncio.gather(*(_answer_group(system, group, model, temp, max_tokens, task) for group in groups))
+    return [answer for group in answers for answer in group]
+
+
+async def _answer_group(system: str, items: List[str], model: Optional[str], temp: float, max_tokens: int, task: Optional[str]) -> List[str]:
+    def single(item: str):
+        return a_chat([{"role": "system", "content": system}, {"role": "user", "content": item}], model=model, temp=temp, max_tokens=max_tokens, task=task)
+
+    if len(items) == 1: return [await single(items[0])]
+    # A few tokens per item for its header line.
+    raw = await a_chat(format_batch(system, items), model=model, temp=temp, max_tokens=(max_tokens + 8) * len(items), task=task)
+    parsed = parse_batch(raw, len(items)) if not raw.startswith("Error:") else {}
+    missing = [i for i in range(len(items)) if i not in parsed]
+    count("prompt_batches", task=task or "", outcome="complete" if not missing else "partial" if parsed else "failed")
+    count("prompt_batch_items", len(parsed), task=task or "", result="batched")
+    if missing:
+        log.debug(f"Batched {task or 'chat'} request answered {len(parsed)}/{len(items)} items; asking for the rest one by one.")
+        count("prompt_batch_items", len(missing), task=task or "", result="fallback")
+        for i, answer in zip(missing, await asyncio.gather(*(single(items[i]) for i in missing))):
+            parsed[i] = answer
+    return [parsed[i] for i in range(len(items))]
@@ -0,0 +1,103 @@
+# agent_budget.py
+import time
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Optional
+
+
+class RunBudget:
+    """
+    Time and cost limits of one research run, and what it has spent so far.
+
+    Tracks wall-clock time against a deadline, chat and embedding tokens (as reported by the
+    API) and page fetches. A limit of 0 or None is off. `pressure()` is the largest fraction
+    used of any limit; the pipeline sheds low-value work as it rises and moves on to synthesis
+    before it reaches 1, so a report is still written from the evidence gathered so far.
+
+    The budget of the running pipeline is found through a context variable (see `use_budget`),
+    so the shared API helpers can charge the run that made the call without it being threaded
+    through every signature.
+    """
+    def __init__(self, deadline_seconds: Optional[float] = None, max_chat_tokens: Optional[int] = None,
+                 max_embedding_tokens: Optional[int] = None, max_fetches: Optional[int] = None):
+        self.deadline_seconds = deadline_seconds or None
+        self.max_chat_tokens = max_chat_tokens or None
+        self.max_embedding_tokens = max_embedding_tokens or None
+        self.max_fetches = max_fetches or None
+        self.started_at = time.monotonic()
+        self.chat_tokens = 0
+        self.embedding_tokens = 0
+        self.fetches = 0
+
+    @classmethod
+    def from_config(cls, config) -> "RunBudget":
+        return cls(config.deadline_seconds, config.max_chat_tokens, config.max_embedding_tokens, config.max_fetches)
+
+    @property
+    def limited(self) -> bool:
+        return any((self.deadline_seconds, self.max_chat_tokens, self.max_embedding_tokens, self.max_fetches))
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def fractions(self) -> Dict[str, float]:
+        """Fraction used of every active limit."""
+        used = {"time": (self.elapsed, self.deadline_seconds), "chat_tokens": (self.chat_tokens, self.max_chat_tokens),
+                "embedding_tokens": (self.embedding_tokens, self.max_embedding_tokens), "fetches": (self.fetches, self.max_fetches)}
+        return {name: spent / limit for name, (spent, limit) in used.items() if limit}
+
+    def pressure(self) -> float:
+        return max(self.fractions().values(), default=0.0)
+
+    def reserve_fetches(self, wanted: int) -> int:
+        """Charges up to `wanted` page fetches and returns how many may be made."""
+        allowed = wanted if self.max_fetches is None else max(0, min(wanted, self.max_fetches - self.fetches))
+        self.fetches += allowed
+        return allowed
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Spending, limits and pressure, for progress events and job status."""
+        return {
+            "elapsed_seconds": round(self.elapsed, 1), "deadline_seconds": self.deadline_seconds,
+            "chat_tokens": self.chat_tokens, "max_chat_tokens": self.max_chat_tokens,
+            "embedding_tokens": self.embedding_tokens, "max_embedding_tokens": self.max_embedding_tokens,
+            "fetches": self.fetches, "max_fetches": self.max_fetches,
+            "pressure": round(self.pressure(), 3),
+        }
+
+
+_current_budget: ContextVar[Optional[RunBudget]] = ContextVar("run_budget", default=None)
+
+
+def use_budget(budget: Optional[RunBudget]) -> Token:
+    """Makes `budget` the current run's budget in this context (and tasks created from it)."""
+    return _current_budget.set(budget)
+
+
+def reset_budget(token: Token):
+    _current_budget.reset(token)
+
+
+def current_budget() -> Optional[RunBudget]:
+    return _current_budget.get()
+
+
+def budget_pressure() -> float:
+    """Pressure on the current run's budget; 0 outside a run or without limits."""
+    budget = _current_budget.get()
+    return budget.pressure() if budget is not None else 0.0
+
+
+def reserve_fetches(wanted: int) -> int:
+    budget = _current_budget.get()
+    return budget.reserve_fetches(wanted) if budget is not None else wanted
+
+
+def charge_chat_tokens(tokens: Optional[int]):
+    budget = _current_budget.get()
+    if budget is not None and tokens: budget.chat_tokens += tokens
+
+
+def charge_embedding_tokens(tokens: Optional[int]):
+    budget = _current_budget.get()
+    if budget is not None and tokens: budget.embedding_tokens += tokens
@@ -0,0 +1,207 @@
+# agent_cassette.py
+import asyncio
+import functools
+import hashlib
+import json
+import threading
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from agent_config import Settings, log
+from agent_metrics import count
+
+MODES = ("off", "record", "replay", "record_missing")
+# Response headers worth keeping: the rest (dates, request ids, rate-limit counters) would only bloat the index.
+_KEPT_HEADERS = ("content-type", "retry-after", "retry-after-ms", "x-encoding")
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode for a request the cassette has no recording of."""
+
+
+@dataclass
+class Interaction:
+    """A recorded response: status, the headers that matter and the (uncompressed) body."""
+    status: int
+    headers: Dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get("content-type", "").lower()
+
+    def text(self) -> str:
+        return self.body.decode(self.headers.get("x-encoding") or "utf-8", errors="replace")
+
+
+class Cassette:
+    """
+    Records the external interactions of research runs (searches, page fetches, chat and
+    embedding requests) and plays them back without the network.
+
+    A cassette is a directory: `index.jsonl` has one line per recorded response (request key,
+    occurrence, kind, a readable summary of the request, status, headers and body digest), and
+    `blobs/` holds the bodies, zlib-compressed and named by the SHA-256 of their content, so
+    a page fetched by many runs or an identical API answer is stored once.
+
+    Requests are keyed by their kind and content (URL, query, or API path and JSON body, never
+    credentials). The n-th identical request of a process gets the n-th recorded response (or
+    the last one), so repeated calls replay the way they were recorded.
+
+    Modes: `record` always uses the network and starts a new recording (bodies already in
+    `blobs/` are reused); `replay` never uses it and raises `CassetteMiss` for unknown requests;
+    `record_missing` replays what it has and records the rest. Transient failures (429 and 5xx) are never recorded.
+    """
+    def __init__(self, path: str, mode: str = "record_missing"):
+        if mode not in MODES or mode == "off":
+            raise ValueError(f"Unknown cassette mode {mode!r}; use one of {', '.join(MODES[1:])}.")
+        self.path, self.mode = Path(path), mode
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / "blobs").mkdir(exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Optional[Dict[str, Any]]]] = {}
+        self._seen: Dict[str, int] = {}
+        self._load()
+
+    def _load(self):
+        index = self.path / "index.jsonl"
+        if not index.exists(): return
+        if self.mode == "record":
+            index.unlink()  # a new recording: appending to the old index would only pile up superseded entries
+            return
+        for line in index.read_text(encoding="utf-8").splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut short by an interrupted run
+            slots = self._entries.setdefault(entry["key"], [])
+            slots.extend([None] * (entry["seq"] + 1 - len(slots)))
+            slots[entry["seq"]] = entry
+
+    @staticmethod
+    def key(kind: str, *parts: Any) -> str:
+        digest = hashlib.sha256(kind.encode())
+        for part in parts:
+            digest.update(b"\x00" + (part if isinstance(part, bytes) else str(part).encode()))
+        return digest.hexdigest()
+
+    def __len__(self) -> int:
+        return sum(1 for slots in self._entries.values() for entry in slots if entry)
+
+    def _recorded(self, key: str, seq: int) -> Optional[Dict[str, Any]]:
+        slots = self._entries.get(key, [])
+        exact = slots[seq] if seq < len(slots) else None
+        # `record_missing` records further occurrences; `replay` reuses the last one it has.
+        if exact is not None or self.mode == "record_missing": return exact
+        return next((entry for entry in reversed(slots) if entry), None)
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.path / "blobs" / digest[:2] / f"{digest}.zz"
+
+    def _read(self, entry: Dict[str, Any]) -> Interaction:
+        body = zlib.decompress(self._blob_path(entry["body"]).read_bytes()) if entry["body"] else b""
+        return Interaction(entry["status"], dict(entry["headers"]), body)
+
+    def _write(self, key: str, seq: int, kind: str, request: str, interaction: Interaction):
+        digest = hashlib.sha256(interaction.body).hexdigest() if interaction.body else ""
+        if digest:
+            blob = self._blob_path(digest)
+            if not blob.exists():
+                blob.parent.mkdir(exist_ok=True)
+                tmp = blob.with_suffix(".tmp")
+                tmp.write_bytes(zlib.compress(interaction.body, 6))
+                tmp.replace(blob)
+        entry = {"key": key, "seq": seq, "kind": kind, "request": request, "status": interaction.status,
+                 "headers": {k: v for k, v in interaction.headers.items() if k in _KEPT_HEADERS}, "body": digest}
+        with self._lock:
+            with (self.path / "index.jsonl").open("a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            slots = self._entries.setdefault(key, [])
+            slots.extend([None] * (seq + 1 - len(slots)))
+            slots[seq] = entry
+
+    async def through(self, kind: str, parts: Tuple[Any, ...], request: str,
+                      live: Callable[[], Awaitable[Interaction]]) -> Interaction:
+        """
+        The response to a request: replayed from the cassette, or obtained from `live()` (and
+        recorded), depending on the mode. `parts` identify the request; `request` describes it
+        in the index.
+        """
+        key = self.key(kind, *parts)
+        with self._lock:
+            seq = self._seen.get(key, 0)
+            self._seen[key] = seq + 1
+        if self.mode != "record":
+            entry = self._recorded(key, seq)
+            if entry is not None:
+                count("cassette_requests", kind=kind, outcome="replayed")
+                return await asyncio.to_thread(self._read, entry)
+            if self.mode == "replay":
+                count("cassette_requests", kind=kind, outcome="missing")
+                raise CassetteMiss(f"No recording of {kind} request {request[:120]!r} in {self.path}")
+        interaction = await live()
+        if interaction.status != 429 and interaction.status < 500:
+            await asyncio.to_thread(self._write, key, seq, kind, request, interaction)
+            count("cassette_requests", kind=kind, outcome="recorded")
+        return interaction
+
+
+@functools.lru_cache(maxsize=None)
+def _transport_class() -> type:
+    """Defines the httpx transport on first use (httpx comes with openai, which is imported lazily too)."""
+    import httpx
+
+    class CassetteTransport(httpx.AsyncBaseTransport):
+        """httpx transport for the Azure OpenAI clients that records and replays API requests through a cassette."""
+        def __init__(self, cassette: Cassette, kind: str):
+            self.cassette, self.kind = cassette, kind
+            self._inner = httpx.AsyncHTTPTransport()
+
+        async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+            body = await request.aread()
+            # The path names the deployment and operation; the host and api-key header are left out of the key.
+            path = request.url.path
+
+            async def live() -> Interaction:
+                response = await self._inner.handle_async_request(request)
+                try:
+                    content = await response.aread()
+                finally:
+                    await response.aclose()
+                return Interaction(response.status_code, {k.lower(): v for k, v in response.headers.items() if k.lower() in _KEPT_HEADERS}, content)
+
+            interaction = await self.cassette.through(self.kind, (request.method, path, body), f"{request.method} {path}", live)
+            return httpx.Response(interaction.status, headers=interaction.headers, content=interaction.body, request=request)
+
+        async def aclose(self):
+            await self._inner.aclose()
+
+    return CassetteTransport
+
+
+def cassette_transport(cassette: Cassette, kind: str):
+    """An httpx transport that sends the requests of an API client (`kind`: 'chat' or 'embedding') through `cassette`."""
+    return _transport_class()(cassette, kind)
+
+
+_cassette: Optional[Cassette] = None
+_configured = False
+
+
+def use_cassette(path: Optional[str], mode: str = "record_missing") -> Optional[Cassette]:
+    """Routes the process's network I/O through the cassette at `path` (None or mode 'off' = straight to the network)."""
+    global _cassette, _configured
+    _cassette = Cassette(path, mode) if path and mode != "off" else None
+    _configured = True
+    if _cassette is not None:
+        log.info(f"Cassette {_cassette.path} in {mode} mode ({len(_cassette)} recorded responses).")
+    return _cassette
+
+
+def current_cassette() -> Optional[Cassette]:
+    """The process's cassette; configured from `CASSETTE_DIR`/`CASSETTE_MODE` on first use unless `use_cassette` was called."""
+    if not _configured:
+        use_cassette(Settings.CASSETTE_DIR, Settings.CASSETTE_MODE)
+    return _cassette
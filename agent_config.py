@@ -1,9 +1,63 @@
 # agent_config.py
 import os
+import json
 import logging
-import dotenv
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Tuple
 
-dotenv.load_dotenv()
+
+def _load_dotenv():
+    """
+    Loads the nearest `.env` (searching up from this file's directory, as `dotenv.load_dotenv()`
+    does) into the environment before `Settings` reads it. python-dotenv is imported only when
+    there is a file to load, and variables already set in the environment win.
+    """
+    for directory in (Path(__file__).resolve().parent, *Path(__file__).resolve().parents[1:]):
+        if (directory / ".env").is_file():
+            import dotenv
+            dotenv.load_dotenv(directory / ".env")
+            return
+
+_load_dotenv()
+
+
+# Kinds of chat call the pipeline makes; model routes name these (or a call site, see `agent_tracing.current_phase`).
+CHAT_TASKS = ("queries", "outline", "plan", "agent_summary", "hyde", "cluster_label",
+              "section", "review", "revision", "title", "abstract", "pdf_extract")
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """
+    A chat deployment that serves some kinds of call instead of the run's main chat model.
+
+    `tasks` are `CHAT_TASKS` names or call sites. A routed call is made with the route's own
+    limits -- completion tokens capped at `max_tokens`, a per-request `timeout` and
+    `max_retries`, at most `max_concurrency` requests in flight in the process (0 / None =
+    the client's defaults, no cap) -- and is retried on the main model if it fails. Prices
+    (per 1,000 tokens) turn the route's token counts into a cost in the run metrics.
+    """
+    name: str
+    deployment: str
+    tasks: Tuple[str, ...] = ()
+    max_tokens: int = 0
+    timeout: float = 0.0
+    max_retries: Optional[int] = None
+    max_concurrency: int = 0
+    prompt_cost_per_1k: float = 0.0
+    completion_cost_per_1k: float = 0.0
+
+
+def parse_model_routes(spec: Optional[str]) -> Tuple[ModelRoute, ...]:
+    """
+    Model routes from JSON, inline or in the file `spec` names:
+    `{"fast": {"deployment": "gpt-4o-mini", "tasks": ["hyde", "cluster_label"], "timeout": 15}}`.
+    """
+    if not spec or not spec.strip(): return ()
+    text = spec if spec.lstrip().startswith("{") else Path(spec).read_text(encoding="utf-8")
+    return tuple(ModelRoute(name=name, **{**options, "tasks": tuple(options.get("tasks", ()))})
+                 for name, options in json.loads(text).items())
 
 # --------------------------------------------------------------------------- #
 #  Configuration
@@ -22,19 +76,77 @@ class Settings:
     CLIENT_MAX_RETRIES         = 3    # Number of retries for API calls
     EMBEDDING_BATCH_SIZE       = 16   # Azure's limit for text-embedding-ada-002
 
-    # --- SEARCH ---
+    # --- EMBEDDING PROVIDERS (see agent_embeddings.py) ---
+    EMBEDDING_PROVIDER         = os.getenv("EMBEDDING_PROVIDER", "azure")  # 'azure' or 'local' (CPU, no network)
+    PRESCREEN_EMBEDDING_PROVIDER = os.getenv("PRESCREEN_EMBEDDING_PROVIDER", "")  # drops redundant chunks before embedding them; '' = off
+    PRESCREEN_DUPLICATE_SIMILARITY = float(os.getenv("PRESCREEN_DUPLICATE_SIMILARITY", "0.9"))  # cosine similarity above which a chunk is redundant
+    LOCAL_EMBEDDING_DIM        = int(os.getenv("LOCAL_EMBEDDING_DIM", "1024"))  # hashed dimensions when no LSA model is set
+    LOCAL_EMBEDDING_MODEL      = os.getenv("LOCAL_EMBEDDING_MODEL", "")  # .npz written by `python -m agent_embeddings`
+
+    # --- HTTP & CACHES (shared by every run in the process) ---
+    HTTP_MAX_CONNECTIONS       = int(os.getenv("HTTP_MAX_CONNECTIONS", "64"))
+    HTTP_MAX_CONNECTIONS_PER_HOST = 8
+    CONTENT_CACHE_SIZE         = int(os.getenv("CONTENT_CACHE_SIZE", "2000"))
+    SEARCH_CACHE_SIZE          = int(os.getenv("SEARCH_CACHE_SIZE", "5000"))
+
+    # --- HEDGED REQUESTS (a duplicate of a chat call or page download that outlives its call site's p95; see agent_hedging.py) ---
+    HEDGE_REQUESTS             = os.getenv("HEDGE_REQUESTS", "0").lower() in ("1", "true", "yes")
+    HEDGE_QUANTILE             = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+    HEDGE_WINDOW               = 200  # recent latencies kept per call site
+    HEDGE_MIN_SAMPLES          = 20   # no hedging before a call site has this many
+    HEDGE_MIN_DELAY_SECONDS    = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "1.0"))
+    HEDGE_BUDGET_FRACTION      = float(os.getenv("HEDGE_BUDGET_FRACTION", "0.05"))  # hedges per request, process-wide
+    HEDGE_BUDGET_BURST         = 10
+
+    # --- CPU-BOUND WORK (kept off the event loop; see agent_executor.py) ---
+    PARSE_EXECUTOR             = os.getenv("PARSE_EXECUTOR", "process")  # HTML/PDF parsing: 'process', 'thread' or 'inline'
+    COMPUTE_EXECUTOR           = os.getenv("COMPUTE_EXECUTOR", "thread") # NumPy/scikit-learn work and chunking
+    CPU_PROCESS_WORKERS        = int(os.getenv("CPU_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+    CPU_THREAD_WORKERS         = int(os.getenv("CPU_THREAD_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+    LOOP_LAG_THRESHOLD_MS      = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250"))  # report event-loop stalls longer than this; 0 = off
+
+    # --- TRACING (see agent_tracing.py) ---
+    TRACE_ENABLED              = os.getenv("TRACE", "0").lower() in ("1", "true", "yes")
+    TRACE_DIR                  = os.getenv("TRACE_DIR", "")  # if set, every traced run writes a Chrome trace here
+
+    # --- RECORD / REPLAY (see agent_cassette.py) ---
+    CASSETTE_DIR               = os.getenv("CASSETTE_DIR", "")  # unset = network I/O is not recorded
+    CASSETTE_MODE              = os.getenv("CASSETTE_MODE", "record_missing")  # 'record', 'replay' or 'record_missing'
+
+    # --- SEARCH (see agent_search.py) ---
+    SEARCH_BACKEND             = os.getenv("SEARCH_BACKEND", "searxng")  # 'searxng' (web) or 'local' (a directory of documents)
     SEARX_URL                  = os.getenv("SEARX_URL", "http://127.0.0.1:8080/search?q=")
+    LOCAL_SEARCH_DIR           = os.getenv("LOCAL_SEARCH_DIR", "")    # HTML, text and PDF files searched by the 'local' backend
+    LOCAL_SEARCH_INDEX         = os.getenv("LOCAL_SEARCH_INDEX", "")  # index file; default: a hidden file in LOCAL_SEARCH_DIR
+    LOCAL_SEARCH_AUTO_INDEX    = os.getenv("LOCAL_SEARCH_AUTO_INDEX", "1").lower() in ("1", "true", "yes")  # update the index on first use
     SEARCH_RESULTS             = int(os.getenv("SEARCH_RESULTS", "8"))
     TOP_K_RESULTS_PER_SECTION  = int(os.getenv("TOP_K_RESULTS_PER_SECTION", "12"))
+    MMR_LAMBDA                 = float(os.getenv("MMR_LAMBDA", "0.7"))  # 1.0 = pure relevance, 0.0 = pure diversity
+    MMR_CANDIDATE_POOL         = 4    # MMR re-ranks the top (pool * top_k) chunks by similarity
 
     # --- PIPELINE ---
     MAX_CYCLES                 = int(os.getenv("MAX_CYCLES", "5"))
     CHUNK_SENTENCES            = 4
     MAX_PAGE_CHARS             = 40_000
     MAX_EMBED_CHARS            = 8_191
-    MAX_ABSTRACT_CONTEXT_CHARS = 10_000
     PDF_MIN_TEXT_LENGTH_FALLBACK = 250
 
+    # --- RUN BUDGETS (per run; 0 = no limit) ---
+    RUN_DEADLINE_SECONDS       = float(os.getenv("RUN_DEADLINE_SECONDS", "0"))
+    RUN_MAX_CHAT_TOKENS        = int(os.getenv("RUN_MAX_CHAT_TOKENS", "0"))
+    RUN_MAX_EMBEDDING_TOKENS   = int(os.getenv("RUN_MAX_EMBEDDING_TOKENS", "0"))
+    RUN_MAX_FETCHES            = int(os.getenv("RUN_MAX_FETCHES", "0"))
+    BUDGET_DEGRADE_FRACTION    = 0.5  # past this share of any budget: no exploration, reflexion or speculative drafts; smaller top-k
+    BUDGET_RESEARCH_FRACTION   = 0.75 # past this share research stops, leaving the rest for synthesis
+
+    # --- PROMPT BUDGETS (tokens, counted with the deployment's tokenizer) ---
+    TOKENIZER_ENCODING         = os.getenv("TOKENIZER_ENCODING", "o200k_base") # used when the deployment name is not a known model
+    CHARS_PER_TOKEN_ESTIMATE   = 4    # fallback when no tokenizer is available
+    SYNTHESIS_CONTEXT_TOKENS   = int(os.getenv("SYNTHESIS_CONTEXT_TOKENS", "6000"))
+    REFLEXION_EVIDENCE_TOKENS  = int(os.getenv("REFLEXION_EVIDENCE_TOKENS", "2000"))
+    OUTLINE_CONTEXT_TOKENS     = int(os.getenv("OUTLINE_CONTEXT_TOKENS", "2500"))
+    ABSTRACT_CONTEXT_TOKENS    = int(os.getenv("ABSTRACT_CONTEXT_TOKENS", "2500"))
+
     # --- ANALYSIS & AGENT BEHAVIOR ---
     PCA_COMPONENTS             = int(os.getenv("PCA_COMPONENTS", "10"))
     N_CLUSTERS                 = int(os.getenv("N_CLUSTERS", "8"))
@@ -43,6 +155,11 @@ class Settings:
     DIMINISHING_RETURNS_THRESHOLD = 0.005
     DIMINISHING_RETURNS_WINDOW = 2
     MAX_REFLEXION_LOOPS        = 2
+    # Draft sections in the background once their topic's coverage stops improving, while research continues.
+    ENABLE_SPECULATIVE_SYNTHESIS = os.getenv("ENABLE_SPECULATIVE_SYNTHESIS", "false").lower() == "true"
+    SPECULATIVE_SATURATION_CYCLES = int(os.getenv("SPECULATIVE_SATURATION_CYCLES", "2"))
+    SPECULATIVE_COVERAGE_EPSILON = 0.01  # coverage rise per cycle below which a topic counts as not improving
+    SPECULATIVE_MIN_EVIDENCE_OVERLAP = 0.75  # Jaccard overlap of retrieved chunk ids needed to keep a draft
     # WHAT: Adds a flag to enable/disable the latent topic discovery feature. 
     # WHY: This allows for easy comparison between the baseline agent and the more advanced version for educational purposes.
     ENABLE_EXPLORATION         = os.getenv("ENABLE_EXPLORATION", "true").lower() == "true" 
@@ -50,23 +167,147 @@ class Settings:
     N_CLUSTERS                 = int(os.getenv("N_CLUSTERS", "8"))
     NOVELTY_ALPHA              = 0.65    
 
+    # --- REPORT CACHE (near-duplicate questions are served from, or warm-started by, earlier runs) ---
+    REPORT_CACHE_DIR           = os.getenv("REPORT_CACHE_DIR")  # unset = cache disabled
+    REPORT_CACHE_SIMILARITY    = float(os.getenv("REPORT_CACHE_SIMILARITY", "0.95"))  # cosine similarity of query embeddings
+    REPORT_CACHE_TTL_HOURS     = float(os.getenv("REPORT_CACHE_TTL_HOURS", "168"))  # older reports only seed a refresh
+    REPORT_CACHE_MAX_ENTRIES   = 500
+
+    # --- KNOWLEDGE CORPUS (pages processed by earlier runs, reused without a web round trip) ---
+    CORPUS_DIR                 = os.getenv("CORPUS_DIR")  # unset = corpus disabled
+    CORPUS_MAX_AGE_DAYS        = float(os.getenv("CORPUS_MAX_AGE_DAYS", "30"))  # older pages are fetched again
+    CORPUS_TOP_K               = int(os.getenv("CORPUS_TOP_K", "8"))  # stored chunks recalled per search action
+    CORPUS_MIN_SIMILARITY      = float(os.getenv("CORPUS_MIN_SIMILARITY", "0.3"))
+
+    # --- JOB QUEUE (MCP server) ---
+    JOB_WORKERS                = int(os.getenv("JOB_WORKERS", "2"))      # pipelines running at once
+    JOB_MAX_QUEUED_PER_CLIENT  = int(os.getenv("JOB_MAX_QUEUED_PER_CLIENT", "5"))
+    JOB_MEMORY_LIMIT_MB        = int(os.getenv("JOB_MEMORY_LIMIT_MB", "0"))  # no new pipeline starts above this RSS; 0 = no limit
+    JOB_RESULT_TTL             = 3600 # seconds a finished job's result is kept
+
     # --- LOGGING & UI ---
     LOG_LEVEL                  = os.getenv("LOG_LEVEL", "INFO").upper()
-    OUTPUT_STYLE               = "summary" # 'detailed', 'summary', or 'progress'
+    OUTPUT_STYLE               = "summary" # 'detailed', 'summary', 'progress' or 'quiet' (no console UI)
     AGENT_SUMMARY_MODEL        = os.getenv("AGENT_SUMMARY_MODEL", "gpt-4o")
 
+    # --- PROMPT BATCHING (small homogeneous calls answered by one multi-item request; see agent_batching.py) ---
+    PROMPT_BATCH_SIZE          = int(os.getenv("PROMPT_BATCH_SIZE", "8"))  # items per request; 1 = one call per item
+    # Completion tokens per batched request. One long completion is slower than parallel short ones, so the default
+    # batches short answers (cluster labels) only; raise it to batch HyDE documents (512 tokens each) under rate limits.
+    PROMPT_BATCH_MAX_TOKENS    = int(os.getenv("PROMPT_BATCH_MAX_TOKENS", "512"))
+
+    # --- MODEL ROUTING (lightweight calls on faster deployments; see `ModelRoute` and agent_routing.py) ---
+    MODEL_ROUTES               = parse_model_routes(os.getenv("MODEL_ROUTES"))  # JSON, or a path to a JSON file
+    CHAT_PROMPT_COST_PER_1K    = float(os.getenv("CHAT_PROMPT_COST_PER_1K", "0"))      # main chat model prices, for
+    CHAT_COMPLETION_COST_PER_1K = float(os.getenv("CHAT_COMPLETION_COST_PER_1K", "0")) # the per-route cost metrics
+
+
+def _from_settings(name: str):
+    """A dataclass field whose default is read from `Settings` when the config is created, not at import."""
+    return field(default_factory=lambda: getattr(Settings, name))
+
+
+@dataclass(frozen=True)
+class RunConfig:
+    """
+    Immutable configuration for a single research run.
+
+    `Settings` keeps what is shared by the whole process (endpoints, keys, clients, caches);
+    everything that shapes one run -- models, cycles, thresholds and limits -- lives here and is
+    passed to `ResearchPipeline` and its components. Runs with different configs (e.g. a fast
+    shallow tier next to a deep one) can therefore share one process without touching globals.
+
+    Unspecified fields take the current `Settings` value, so `RunConfig(max_cycles=2)` is a
+    complete config; use `dataclasses.replace` to derive variants.
+    """
+    # --- MODELS ---
+    chat_model: str                       = _from_settings("AZURE_DEPLOYMENT")
+    agent_summary_model: str              = _from_settings("AGENT_SUMMARY_MODEL")
+    model_routes: Tuple[ModelRoute, ...]  = _from_settings("MODEL_ROUTES")  # chat tasks served by other deployments
+    embedding_model: Optional[str]        = _from_settings("AZURE_EMBEDDING_DEPLOYMENT")
+    embedding_provider: str               = _from_settings("EMBEDDING_PROVIDER")  # embeds everything the run compares
+    prescreen_embedding_provider: str     = _from_settings("PRESCREEN_EMBEDDING_PROVIDER")
+    prescreen_duplicate_similarity: float = _from_settings("PRESCREEN_DUPLICATE_SIMILARITY")
+
+    # --- SEARCH & RETRIEVAL ---
+    search_results: int                   = _from_settings("SEARCH_RESULTS")
+    top_k_results_per_section: int        = _from_settings("TOP_K_RESULTS_PER_SECTION")
+    mmr_lambda: float                     = _from_settings("MMR_LAMBDA")
+    mmr_candidate_pool: int               = _from_settings("MMR_CANDIDATE_POOL")
+    corpus_top_k: int                     = _from_settings("CORPUS_TOP_K")
+    corpus_min_similarity: float          = _from_settings("CORPUS_MIN_SIMILARITY")
+
+    # --- PIPELINE ---
+    prompt_batch_size: int                = _from_settings("PROMPT_BATCH_SIZE")  # HyDE documents and cluster labels per chat call
+    max_cycles: int                       = _from_settings("MAX_CYCLES")
+    chunk_sentences: int                  = _from_settings("CHUNK_SENTENCES")
+
+    # --- RUN BUDGETS (0 = no limit; see `agent_budget.RunBudget`) ---
+    deadline_seconds: float               = _from_settings("RUN_DEADLINE_SECONDS")
+    max_chat_tokens: int                  = _from_settings("RUN_MAX_CHAT_TOKENS")
+    max_embedding_tokens: int             = _from_settings("RUN_MAX_EMBEDDING_TOKENS")
+    max_fetches: int                      = _from_settings("RUN_MAX_FETCHES")
+    budget_degrade_fraction: float        = _from_settings("BUDGET_DEGRADE_FRACTION")
+    budget_research_fraction: float       = _from_settings("BUDGET_RESEARCH_FRACTION")
+
+    # --- PROMPT BUDGETS (tokens) ---
+    synthesis_context_tokens: int         = _from_settings("SYNTHESIS_CONTEXT_TOKENS")
+    reflexion_evidence_tokens: int        = _from_settings("REFLEXION_EVIDENCE_TOKENS")
+    outline_context_tokens: int           = _from_settings("OUTLINE_CONTEXT_TOKENS")
+    abstract_context_tokens: int          = _from_settings("ABSTRACT_CONTEXT_TOKENS")
+
+    # --- ANALYSIS & AGENT BEHAVIOR ---
+    pca_components: int                   = _from_settings("PCA_COMPONENTS")
+    n_clusters: int                       = _from_settings("N_CLUSTERS")
+    novelty_alpha: float                  = _from_settings("NOVELTY_ALPHA")
+    novelty_top_k: int                    = _from_settings("NOVELTY_TOP_K")
+    diminishing_returns_threshold: float  = _from_settings("DIMINISHING_RETURNS_THRESHOLD")
+    diminishing_returns_window: int       = _from_settings("DIMINISHING_RETURNS_WINDOW")
+    max_reflexion_loops: int              = _from_settings("MAX_REFLEXION_LOOPS")
+    enable_exploration: bool              = _from_settings("ENABLE_EXPLORATION")
+    enable_speculative_synthesis: bool    = _from_settings("ENABLE_SPECULATIVE_SYNTHESIS")
+    speculative_saturation_cycles: int    = _from_settings("SPECULATIVE_SATURATION_CYCLES")
+    speculative_coverage_epsilon: float   = _from_settings("SPECULATIVE_COVERAGE_EPSILON")
+    speculative_min_evidence_overlap: float = _from_settings("SPECULATIVE_MIN_EVIDENCE_OVERLAP")
+
+    # --- UI & DIAGNOSTICS ---
+    output_style: str                     = _from_settings("OUTPUT_STYLE")
+    trace: bool                           = _from_settings("TRACE_ENABLED")  # record timing spans (see `agent_tracing`)
+
+    def __post_init__(self):
+        if self.output_style not in ("detailed", "summary", "progress", "quiet"):
+            raise ValueError(f"output_style must be 'detailed', 'summary', 'progress' or 'quiet', got {self.output_style!r}")
+        if not 0.0 <= self.mmr_lambda <= 1.0:
+            raise ValueError(f"mmr_lambda must be within [0, 1], got {self.mmr_lambda}")
+        if self.max_cycles < 1:
+            raise ValueError(f"max_cycles must be at least 1, got {self.max_cycles}")
+        routed = [task for route in self.model_routes for task in route.tasks]
+        if len(routed) != len(set(routed)):
+            raise ValueError(f"each chat task may be routed to one deployment only, got {sorted(routed)}")
+        if not 0.0 < self.budget_degrade_fraction <= self.budget_research_fraction <= 1.0:
+            raise ValueError("budget fractions must satisfy 0 < budget_degrade_fraction <= budget_research_fraction <= 1, "
+                             f"got {self.budget_degrade_fraction} and {self.budget_research_fraction}")
+
+
 SCRIPT_VERSION = "4.2.3"
 
 # --------------------------------------------------------------------------- #
 #  Logging
 # --------------------------------------------------------------------------- #
 log_format = "%(asctime)s | %(name)-22s | %(levelname)-8s | %(message)s"
-logging.basicConfig(level=getattr(logging, Settings.LOG_LEVEL), format=log_format)
-logging.getLogger("httpx").setLevel(logging.WARNING)
-logging.getLogger("httpcore").setLevel(logging.WARNING)
-logging.getLogger("anyio").setLevel(logging.WARNING)
 log = logging.getLogger("deep-research")
 
+def configure_logging():
+    """
+    Installs the console log handler and levels. Called by the entry points (CLI, batch mode,
+    MCP server) rather than on import, so applications embedding the package keep their own
+    logging configuration.
+    """
+    logging.basicConfig(level=getattr(logging, Settings.LOG_LEVEL), format=log_format)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("httpcore").setLevel(logging.WARNING)
+    logging.getLogger("anyio").setLevel(logging.WARNING)
+
 
 # --------------------------------------------------------------------------- #
 #  Prompts
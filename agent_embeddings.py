@@ -0,0 +1,213 @@
+# agent_embeddings.py
+import abc
+import argparse
+import asyncio
+import functools
+import hashlib
+import re
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from agent_config import Settings, log
+from agent_executor import run_cpu
+from agent_metrics import count, observe
+from agent_tracing import span
+
+_TOKEN = re.compile(r"\w+")
+
+
+class EmbeddingProvider(abc.ABC):
+    """
+    Turns texts into embedding vectors for one embedding space.
+
+    `model_id` names the space: embeddings are only comparable within one, and caches, the
+    corpus and the report cache key their entries by it. `embed` takes any number of texts,
+    batches them as the backend needs and returns one vector (or None on failure) per text.
+    """
+    name = "embeddings"
+    model_id: Optional[str] = None
+
+    @abc.abstractmethod
+    async def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        ...
+
+
+class AzureEmbeddings(EmbeddingProvider):
+    """An Azure OpenAI embedding deployment, in concurrent requests of `EMBEDDING_BATCH_SIZE` texts."""
+    name = "azure"
+
+    def __init__(self, model: Optional[str] = None):
+        self.model_id = model
+
+    async def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        from agent_helpers import a_embed_batch
+        size = Settings.EMBEDDING_BATCH_SIZE
+        batches = await asyncio.gather(*(a_embed_batch(texts[i:i + size], model=self.model_id) for i in range(0, len(texts), size)))
+        return [emb for batch in batches for emb in batch]
+
+
+# --------------------------------------------------------------------------- #
+#  Local embeddings (CPU, no network)
+# --------------------------------------------------------------------------- #
+@functools.lru_cache(maxsize=1 << 18)
+def _token_hash(token: str) -> int:
+    # crc32 is stable across processes, unlike hash(); words repeat, so the cache makes it nearly free.
+    return zlib.crc32(token.encode())
+
+
+def _hashed_terms(texts: List[str], n_features: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Unigrams and bigrams of each text hashed into `n_features` signed buckets, as COO (rows, columns, signs)."""
+    rows, hashes = [], []
+    for row, text in enumerate(texts):
+        tokens = _TOKEN.findall(text[:Settings.MAX_EMBED_CHARS].lower())
+        terms = [_token_hash(t) for t in tokens] + [_token_hash(f"{a} {b}") for a, b in zip(tokens, tokens[1:])]
+        hashes.extend(terms)
+        rows.extend([row] * len(terms))
+    hashes = np.asarray(hashes, dtype=np.uint32)
+    signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+    return np.asarray(rows, dtype=np.int64), (hashes % n_features).astype(np.int64), signs
+
+
+def _sublinear(counts: np.ndarray) -> np.ndarray:
+    return np.sign(counts) * np.log1p(np.abs(counts))
+
+
+def _hashing_embed(texts: List[str], n_features: int) -> np.ndarray:
+    """L2-normalized, sublinearly scaled term-frequency vectors in `n_features` hashed dimensions."""
+    rows, cols, signs = _hashed_terms(texts, n_features)
+    counts = np.bincount(rows * n_features + cols, weights=signs, minlength=len(texts) * n_features)
+    matrix = _sublinear(counts.reshape(len(texts), n_features)).astype(np.float32)
+    return _normalized(matrix)
+
+
+def _lsa_embed(texts: List[str], n_features: int, idf: np.ndarray, components: np.ndarray) -> np.ndarray:
+    """Hashed TF-IDF vectors projected onto the fitted SVD components (latent semantic analysis)."""
+    from scipy.sparse import csr_matrix
+    rows, cols, signs = _hashed_terms(texts, n_features)
+    counts = csr_matrix((signs, (rows, cols)), shape=(len(texts), n_features), dtype=np.float32)
+    counts.sum_duplicates()
+    counts.data = _sublinear(counts.data) * idf[counts.indices]
+    return _normalized(np.asarray(counts @ components, dtype=np.float32))
+
+
+def _normalized(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+class LocalEmbeddings(EmbeddingProvider):
+    """
+    Embeddings computed on the CPU, with no network round trip, in one vectorized batch.
+
+    Without a model file, a text's embedding is its hashed (signed) unigram and bigram
+    frequencies in `dim` dimensions: near-duplicate and lexically similar texts get high cosine
+    similarity, which suits redundancy checks. With a model fitted by `fit_lsa_model` (TF-IDF
+    weights and an SVD projection learned from a document collection), embeddings are dense
+    latent-semantic vectors that also relate texts sharing topics but not words.
+    """
+    name = "local"
+
+    def __init__(self, dim: Optional[int] = None, model_path: Optional[str] = None):
+        self.model_path = model_path
+        if model_path:
+            data = Path(model_path).read_bytes()
+            with np.load(model_path) as model:
+                self.n_features = int(model["n_features"])
+                self.idf, self.components = model["idf"].astype(np.float32), model["components"].astype(np.float32)
+            self.dim = self.components.shape[1]
+            self.model_id = f"local-lsa-{self.dim}-{hashlib.sha1(data).hexdigest()[:12]}"
+        else:
+            self.dim = self.n_features = dim or Settings.LOCAL_EMBEDDING_DIM
+            self.model_id = f"local-hashing-{self.dim}"
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        """Embeddings of `texts` as a (len(texts), dim) float32 array, computed in the calling thread."""
+        if not texts: return np.zeros((0, self.dim), dtype=np.float32)
+        if self.model_path: return _lsa_embed(texts, self.n_features, self.idf, self.components)
+        return _hashing_embed(texts, self.n_features)
+
+    async def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        if not texts: return []
+        count("local_embedding_inputs", len(texts), model=self.model_id)
+        start = time.perf_counter()
+        with span("embed.local", "cpu", model=self.model_id, texts=len(texts)):
+            matrix = await run_cpu("compute", self.embed_sync, texts)
+        observe("local_embedding_seconds", time.perf_counter() - start, model=self.model_id)
+        return matrix.tolist()
+
+
+def fit_lsa_model(texts: Iterable[str], out_path: str, dim: int = 256, n_features: int = 1 << 16) -> Path:
+    """
+    Fits a `LocalEmbeddings` model on a document collection: IDF weights of the hashed terms
+    and the top `dim` right singular vectors of the TF-IDF matrix (randomized SVD). Writes it
+    to `out_path` (.npz).
+    """
+    from scipy.sparse import csr_matrix
+    from sklearn.utils.extmath import randomized_svd
+    texts = [t for t in texts if t and t.strip()]
+    if len(texts) <= dim:
+        raise ValueError(f"Need more than {dim} documents to fit {dim} components, got {len(texts)}.")
+    rows, cols, signs = _hashed_terms(texts, n_features)
+    counts = csr_matrix((signs, (rows, cols)), shape=(len(texts), n_features), dtype=np.float32)
+    counts.sum_duplicates()
+    document_frequency = np.bincount(counts.indices, minlength=n_features)
+    idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+    counts.data = _sublinear(counts.data) * idf[counts.indices]
+    _, _, vt = randomized_svd(counts, n_components=dim, random_state=42)
+    out = Path(out_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with out.open("wb") as f:
+        np.savez(f, n_features=n_features, idf=idf, components=vt.T.astype(np.float32))
+    return out
+
+
+def _local_provider(model: Optional[str] = None) -> LocalEmbeddings:
+    return LocalEmbeddings(model_path=Settings.LOCAL_EMBEDDING_MODEL or None)
+
+
+# name -> factory(azure deployment) of the provider. Add others with `register_embedding_provider`.
+EMBEDDING_PROVIDERS: Dict[str, Callable[[Optional[str]], EmbeddingProvider]] = {"azure": AzureEmbeddings, "local": _local_provider}
+
+_providers: Dict[Tuple[str, Optional[str]], EmbeddingProvider] = {}
+
+
+def register_embedding_provider(name: str, factory: Callable[[Optional[str]], EmbeddingProvider]):
+    EMBEDDING_PROVIDERS[name] = factory
+    for key in [key for key in _providers if key[0] == name]: del _providers[key]
+
+
+def get_embedding_provider(name: str, model: Optional[str] = None) -> EmbeddingProvider:
+    """The process's provider `name` ('azure' uses deployment `model`); created on first use and shared by runs."""
+    if name not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown embedding provider {name!r}; available: {', '.join(EMBEDDING_PROVIDERS)}.")
+    key = (name, model if name == "azure" else None)
+    if key not in _providers:
+        _providers[key] = EMBEDDING_PROVIDERS[name](model)
+    return _providers[key]
+
+
+if __name__ == "__main__":
+    from agent_config import configure_logging
+    from agent_executor import shutdown_executors
+    from agent_search import DOCUMENT_SUFFIXES, _read_document, _walk
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Fits a local LSA embedding model (LOCAL_EMBEDDING_MODEL) on a directory of HTML, text and PDF documents.")
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("out", type=Path, help="Model file to write (.npz).")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimensions (default: 256).")
+    parser.add_argument("--features", type=int, default=1 << 16, help="Hashed term buckets (default: 65536).")
+    args = parser.parse_args()
+    try:
+        start = time.perf_counter()
+        paths = [str(path) for path, _ in _walk(args.directory.resolve())]
+        texts = [text for _, text in map(_read_document, paths)]
+        log.info(f"Read {len(texts)} documents ({', '.join(sorted(set(DOCUMENT_SUFFIXES)))}) in {time.perf_counter() - start:.1f}s.")
+        fit_lsa_model(texts, args.out, dim=args.dim, n_features=args.features)
+        provider = LocalEmbeddings(model_path=str(args.out))
+        print(f"Wrote {args.out} ({provider.model_id}) in {time.perf_counter() - start:.1f}s.")
+    finally:
+        shutdown_executors(wait=False)
@@ -0,0 +1,179 @@
+# agent_executor.py
+import asyncio
+import functools
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+import traceback
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from agent_config import Settings
+from agent_tracing import span
+
+log = logging.getLogger("deep-research.executor")
+
+# --------------------------------------------------------------------------- #
+# 1.  Executors for CPU-bound work
+# --------------------------------------------------------------------------- #
+# Each kind of CPU-bound task goes to the pool that suits it:
+#   parse    HTML/PDF to text (BeautifulSoup, regex, PyMuPDF). Pure Python that holds the GIL
+#            for tens of milliseconds per page, so by default it runs in worker processes.
+#   compute  NumPy/scikit-learn work (similarity matrices, PCA, KMeans) and sentence chunking.
+#            NumPy releases the GIL, so threads suffice and nothing has to be pickled.
+# "inline" runs a kind on the event loop, as before (useful for debugging and profiling).
+EXECUTOR_KINDS = ("thread", "process", "inline")
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor_kind(task_kind: str) -> str:
+    kind = {"parse": Settings.PARSE_EXECUTOR, "compute": Settings.COMPUTE_EXECUTOR}.get(task_kind, "thread")
+    return kind if kind in EXECUTOR_KINDS else "thread"
+
+
+def get_executor(task_kind: str) -> Optional[Executor]:
+    """The executor for a task kind ('parse' or 'compute'), or None if it runs inline."""
+    global _thread_pool, _process_pool
+    kind = _executor_kind(task_kind)
+    if kind == "inline": return None
+    with _pool_lock:
+        if kind == "process":
+            if _process_pool is None:
+                # forkserver: forking a process that already runs threads (HTTP clients, this pool) is unsafe.
+                method = "forkserver" if sys.platform != "win32" else "spawn"
+                _process_pool = ProcessPoolExecutor(max_workers=Settings.CPU_PROCESS_WORKERS, mp_context=multiprocessing.get_context(method))
+            return _process_pool
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=Settings.CPU_THREAD_WORKERS, thread_name_prefix="deep-research-cpu")
+        return _thread_pool
+
+
+async def run_cpu(task_kind: str, fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Runs `fn(*args)` off the event loop in the executor for `task_kind` and awaits the result.
+
+    Functions sent to the process pool must be picklable (module-level). If the process pool
+    breaks (e.g. a worker was killed), the call is retried on the thread pool.
+    """
+    executor = get_executor(task_kind)
+    with span(f"cpu.{getattr(fn, '__name__', 'task')}", "cpu", executor=_executor_kind(task_kind)):
+        if executor is None: return fn(*args)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor, functools.partial(fn, *args))
+        except BrokenProcessPool:
+            log.warning(f"Process pool broke while running {getattr(fn, '__name__', fn)}; restarting it and retrying in a thread.")
+            _reset_process_pool()
+            return await loop.run_in_executor(get_executor("compute") or None, functools.partial(fn, *args))
+
+
+def _reset_process_pool():
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is not None: _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def shutdown_executors(wait: bool = True):
+    """Shuts the worker pools down; they are recreated on next use."""
+    global _thread_pool
+    with _pool_lock:
+        if _thread_pool is not None: _thread_pool.shutdown(wait=wait)
+        _thread_pool = None
+    _reset_process_pool()
+
+# --------------------------------------------------------------------------- #
+# 2.  Event-loop lag monitor
+# --------------------------------------------------------------------------- #
+class LoopLagMonitor:
+    """
+    Detects and reports spans in which the event loop was blocked.
+
+    A heartbeat task on the loop records when it last ran; a watchdog thread notices when the
+    heartbeat is late by more than `threshold_ms` and captures the stack the loop thread is stuck
+    in, which names the blocking code while it is still blocking. When the loop recovers, the
+    heartbeat logs the stall once, with its total length and that stack, and adds it to the
+    statistics.
+    """
+    def __init__(self, threshold_ms: float, interval_ms: float = 50.0):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.total_blocked = 0.0
+        self._last_beat = time.monotonic()
+        self._stall_stack: Optional[Tuple[float, str]] = None  # (heartbeat it was captured after, stack)
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat(), name="loop-lag-monitor")
+        threading.Thread(target=self._watchdog, name="loop-lag-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None: self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"stalls": self.stalls, "max_lag_ms": round(self.max_lag * 1000, 1), "total_blocked_ms": round(self.total_blocked * 1000, 1)}
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                lag = now - expected
+                previous_beat, self._last_beat = self._last_beat, now
+                if lag > self.threshold:
+                    self.stalls += 1
+                    self.total_blocked += lag
+                    self.max_lag = max(self.max_lag, lag)
+                    captured = self._stall_stack
+                    stack = f", in:\n{captured[1].rstrip()}" if captured and captured[0] == previous_beat else "."
+                    log.warning(f"Event loop was blocked for {lag * 1000:.0f} ms (threshold {self.threshold * 1000:.0f} ms){stack}")
+        finally:
+            self._stop.set()
+            # The loop is shutting down (asyncio.run cancels every task); forget its monitor.
+            if _monitors.get(loop) is self: del _monitors[loop]
+
+    def _watchdog(self):
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._last_beat
+            if time.monotonic() - beat - self.interval > self.threshold and (self._stall_stack is None or self._stall_stack[0] != beat):
+                frame = sys._current_frames().get(self._loop_thread_id)
+                self._stall_stack = (beat, "".join(traceback.format_stack(frame, limit=12)) if frame else "(stack unavailable)\n")
+
+
+# Keyed by the loop itself, so a closed loop's entry can never be mistaken for a new loop's.
+_monitors: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LoopLagMonitor]" = weakref.WeakKeyDictionary()
+
+
+def ensure_loop_monitor() -> Optional[LoopLagMonitor]:
+    """Starts a lag monitor on the running loop (once per loop) if `LOOP_LAG_THRESHOLD_MS` is set."""
+    if Settings.LOOP_LAG_THRESHOLD_MS <= 0: return None
+    loop = asyncio.get_running_loop()
+    monitor = _monitors.get(loop)
+    if monitor is None or monitor._task is None or monitor._task.done():
+        monitor = _monitors[loop] = LoopLagMonitor(Settings.LOOP_LAG_THRESHOLD_MS)
+        monitor.start()
+    return monitor
+
+
+def loop_monitor() -> Optional[LoopLagMonitor]:
+    """The running loop's lag monitor, if one was started; never starts one."""
+    try:
+        return _monitors.get(asyncio.get_running_loop())
+    except RuntimeError:
+        return None
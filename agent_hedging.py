@@ -0,0 +1,123 @@
+# agent_hedging.py
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from agent_config import Settings, log
+from agent_metrics import count
+
+T = TypeVar("T")
+Key = Tuple[str, ...]
+
+
+class LatencyTracker:
+    """
+    Recent latencies per call key (kind, call site, ...) and their running quantile.
+
+    Keeps the last `window` samples of each key, and of its kind (`key[:1]`) as a fallback for
+    call sites that have not been seen often enough yet.
+    """
+    def __init__(self, window: int = 200, quantile: float = 0.95, min_samples: int = 20):
+        self.window, self.quantile, self.min_samples = window, quantile, min_samples
+        self._samples: Dict[Key, Deque[float]] = {}
+        self._cached: Dict[Key, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: Key, seconds: float):
+        with self._lock:
+            for k in {key, key[:1]}:
+                samples = self._samples.get(k)
+                if samples is None: samples = self._samples[k] = deque(maxlen=self.window)
+                samples.append(seconds)
+                self._cached.pop(k, None)
+
+    def threshold(self, key: Key) -> Optional[float]:
+        """The running quantile of `key`, else of its kind; None until either has `min_samples` samples."""
+        with self._lock:
+            for k in (key, key[:1]):
+                samples = self._samples.get(k)
+                if samples is None or len(samples) < self.min_samples: continue
+                if k not in self._cached:
+                    ordered = sorted(samples)
+                    self._cached[k] = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+                return self._cached[k]
+            return None
+
+
+class HedgeBudget:
+    """
+    Caps hedged (duplicate) requests at `fraction` of all requests, plus a `burst` allowance,
+    across the process, so hedging cannot multiply load when everything is slow.
+    """
+    def __init__(self, fraction: float, burst: int):
+        self.fraction, self.burst = fraction, burst
+        self.requests, self.hedges = 0, 0
+        self._lock = threading.Lock()
+
+    def note_request(self):
+        with self._lock: self.requests += 1
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.hedges >= self.fraction * self.requests + self.burst: return False
+            self.hedges += 1
+            return True
+
+
+LATENCIES = LatencyTracker(Settings.HEDGE_WINDOW, Settings.HEDGE_QUANTILE, Settings.HEDGE_MIN_SAMPLES)
+BUDGET = HedgeBudget(Settings.HEDGE_BUDGET_FRACTION, Settings.HEDGE_BUDGET_BURST)
+
+
+async def hedged(key: Key, call: Callable[[], Awaitable[T]], succeeded: Callable[[T], bool] = lambda result: True) -> T:
+    """
+    Awaits `call()`, and if it takes longer than the running p95 latency of `key` (at least
+    `HEDGE_MIN_DELAY_SECONDS`), issues `call()` a second time. The first attempt to succeed --
+    return without raising and pass `succeeded`, e.g. an HTTP status below 400 -- wins and the
+    other is cancelled; a failed attempt only counts if the other fails too. Only successes are
+    latency samples, so fast errors do not pull the threshold down. Hedges are limited by the
+    process-wide `HedgeBudget`. With `HEDGE_REQUESTS` off this is `await call()`.
+    """
+    if not Settings.HEDGE_REQUESTS: return await call()
+    BUDGET.note_request()
+    start = time.perf_counter()
+    threshold = LATENCIES.threshold(key)
+    primary = asyncio.ensure_future(call())
+    attempts = [primary]
+    try:
+        if threshold is not None:
+            delay = max(threshold, Settings.HEDGE_MIN_DELAY_SECONDS)
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if not done:
+                if BUDGET.try_acquire():
+                    log.debug(f"Hedging {'/'.join(key)} after {delay:.2f}s.")
+                    attempts.append(asyncio.ensure_future(call()))
+                else:
+                    count("hedged_requests", kind=key[0], outcome="over_budget")
+        result, winner = await _first_success(attempts, succeeded)
+        if winner is not None:
+            # A hedged sample is right-censored: the primary took at least this long.
+            LATENCIES.record(key, time.perf_counter() - start)
+        if len(attempts) > 1:
+            count("hedged_requests", kind=key[0], outcome={0: "primary_won", 1: "backup_won"}.get(winner, "both_failed"))
+        return result
+    finally:
+        for attempt in attempts:
+            if not attempt.done(): attempt.cancel()
+
+
+async def _first_success(attempts, succeeded: Callable[[T], bool]) -> Tuple[T, Optional[int]]:
+    """
+    The result of the first attempt to succeed and its index. If all fail, the last failed
+    result (index None), or the last error raised if none returned.
+    """
+    pending, error, failed = set(attempts), None, None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for attempt in sorted(done, key=attempts.index):
+            if attempt.exception() is not None: error = attempt.exception()
+            elif succeeded(attempt.result()): return attempt.result(), attempts.index(attempt)
+            else: failed = attempt
+    if failed is not None: return failed.result(), None
+    raise error
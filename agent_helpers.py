@@ -5,70 +5,202 @@ import hashlib
 import json
 import logging
 import re
-from typing import Any, Dict, List, Optional
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
-import aiohttp
-import fitz
-from bs4 import BeautifulSoup
-from curl_cffi.requests import AsyncSession
-from openai import AsyncAzureOpenAI, Timeout
+from agent_budget import charge_chat_tokens, charge_embedding_tokens
+from agent_cassette import Interaction, cassette_transport, current_cassette
+from agent_config import ModelRoute, Settings, PROMPTS, log
+from agent_executor import run_cpu
+from agent_hedging import hedged
+from agent_metrics import count, observe
+from agent_routing import chat_cost, route_for, route_slot
+from agent_search import SearchBackend, current_search_backend
+from agent_tracing import current_phase, span
 
-from agent_config import Settings, PROMPTS, log
+# The network and parsing libraries (openai, aiohttp, curl_cffi, PyMuPDF, BeautifulSoup) are
+# imported where first used, so importing this module -- and the `research` package -- stays fast.
+if TYPE_CHECKING:
+    import aiohttp
+    from openai import AsyncAzureOpenAI
 
 # --------------------------------------------------------------------------- #
 # 1.  API Clients, Wrappers & Caching
 # --------------------------------------------------------------------------- #
-_chat_client: Optional[AsyncAzureOpenAI] = None
-_embedding_client: Optional[AsyncAzureOpenAI] = None
+_chat_client: Optional["AsyncAzureOpenAI"] = None
+_embedding_client: Optional["AsyncAzureOpenAI"] = None
+_http_session: Optional["aiohttp.ClientSession"] = None
+_http_session_loop: Optional[asyncio.AbstractEventLoop] = None
 
 class _Cache(dict):
-    def __init__(self, cap: int = 10_000): super().__init__(); self.cap = cap
-    def __getitem__(self, k): return super().get(k)
+    """FIFO-bounded dict; `cache[k]` returns None on a miss and counts hits/misses (also in the run's metrics)."""
+    def __init__(self, cap: int = 10_000, name: str = "cache"): super().__init__(); self.cap = cap; self.name = name; self.hits = 0; self.misses = 0
+    def __getitem__(self, k):
+        v = super().get(k)
+        if v is None: self.misses += 1
+        else: self.hits += 1
+        count("cache_lookups", cache=self.name, result="miss" if v is None else "hit")
+        return v
     def put(self, k, v):
         if len(self) >= self.cap: self.pop(next(iter(self)))
         self[k] = v
-EMBED_CACHE = _Cache(50_000)
-CONTENT_CACHE = _Cache(2_000)
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+EMBED_CACHE = _Cache(50_000, "embedding")
+CONTENT_CACHE = _Cache(Settings.CONTENT_CACHE_SIZE, "content")
+SEARCH_CACHE = _Cache(Settings.SEARCH_CACHE_SIZE, "search")
 
-def get_chat_client() -> AsyncAzureOpenAI:
+# Requests currently in flight, keyed by URL / search, so concurrent callers share one request.
+_IN_FLIGHT: Dict[str, "asyncio.Task[Any]"] = {}
+
+async def _single_flight(key: str, make_coro) -> Any:
+    """Runs `make_coro()` once per key at a time; concurrent callers with the same key await the same task."""
+    task = _IN_FLIGHT.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(make_coro())
+        _IN_FLIGHT[key] = task
+        task.add_done_callback(lambda t: _IN_FLIGHT.pop(key, None) if _IN_FLIGHT.get(key) is t else None)
+    # Shielded so one caller being cancelled does not cancel the request for the others.
+    return await asyncio.shield(task)
+
+def _azure_client(api_key: Optional[str], endpoint: Optional[str], kind: str) -> "AsyncAzureOpenAI":
+    from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient, Timeout
+    options: Dict[str, Any] = {"api_key": api_key, "azure_endpoint": endpoint, "max_retries": Settings.CLIENT_MAX_RETRIES}
+    cassette = current_cassette()
+    if cassette is not None:
+        options["http_client"] = DefaultAsyncHttpxClient(transport=cassette_transport(cassette, kind))
+        if cassette.mode == "replay":
+            # Replay needs no credentials, and a missing recording is not worth retrying.
+            options.update(api_key=api_key or "replay", azure_endpoint=endpoint or "https://replay.invalid", max_retries=0)
+    return AsyncAzureOpenAI(api_version=Settings.AZURE_API_VERSION, timeout=Timeout(Settings.CLIENT_TIMEOUT), **options)
+
+def get_chat_client() -> "AsyncAzureOpenAI":
     global _chat_client
     if _chat_client is None:
         log.debug("Initializing Azure Chat Client...")
-        _chat_client = AsyncAzureOpenAI(api_key=Settings.AZURE_CHAT_API_KEY, api_version=Settings.AZURE_API_VERSION, azure_endpoint=Settings.AZURE_CHAT_ENDPOINT, timeout=Timeout(Settings.CLIENT_TIMEOUT), max_retries=Settings.CLIENT_MAX_RETRIES)
+        _chat_client = _azure_client(Settings.AZURE_CHAT_API_KEY, Settings.AZURE_CHAT_ENDPOINT, "chat")
     return _chat_client
 
-def get_embedding_client() -> AsyncAzureOpenAI:
+def get_embedding_client() -> "AsyncAzureOpenAI":
     global _embedding_client
     if _embedding_client is None:
         log.debug("Initializing Azure Embedding Client...")
-        _embedding_client = AsyncAzureOpenAI(api_key=Settings.AZURE_EMBEDDING_API_KEY, api_version=Settings.AZURE_API_VERSION, azure_endpoint=Settings.AZURE_EMBEDDING_ENDPOINT, timeout=Timeout(Settings.CLIENT_TIMEOUT), max_retries=Settings.CLIENT_MAX_RETRIES)
+        _embedding_client = _azure_client(Settings.AZURE_EMBEDDING_API_KEY, Settings.AZURE_EMBEDDING_ENDPOINT, "embedding")
     return _embedding_client
 
-async def a_chat(messages: List[Dict[str, Any]], model: str = Settings.AZURE_DEPLOYMENT, temp: float = 0.5, max_tokens: int = 1024) -> str:
-    log.debug(f"Sending chat request to model '{model}' with {len(messages)} messages. Max tokens: {max_tokens}")
-    client = get_chat_client()
+def get_http_session() -> "aiohttp.ClientSession":
+    """Returns the process-wide aiohttp session (recreated if closed or if the event loop changed)."""
+    import aiohttp
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_session_loop is not loop:
+        log.debug("Initializing shared HTTP session...")
+        connector = aiohttp.TCPConnector(limit=Settings.HTTP_MAX_CONNECTIONS, limit_per_host=Settings.HTTP_MAX_CONNECTIONS_PER_HOST)
+        _http_session, _http_session_loop = aiohttp.ClientSession(connector=connector), loop
+    return _http_session
+
+async def close_http_session():
+    """Closes the shared HTTP session and API clients; call once when the event loop is about to finish."""
+    global _http_session, _http_session_loop, _chat_client, _embedding_client
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session, _http_session_loop = None, None
+    # The clients' connection pools are bound to this loop too; they are recreated on next use.
+    for client in {id(c): c for c in (_chat_client, _embedding_client) if c is not None}.values():
+        await client.close()
+    _chat_client = _embedding_client = None
+
+async def a_chat(messages: List[Dict[str, Any]], model: Optional[str] = None, temp: float = 0.5, max_tokens: int = 1024,
+                 task: Optional[str] = None) -> str:
+    """
+    A chat completion on `model` (default: the main deployment). `task` names the kind of call
+    (see `CHAT_TASKS`): if the run routes it, or its call site, to another deployment, that one
+    is tried first, with its own limits, and `model` only if it fails.
+    """
+    model = model or Settings.AZURE_DEPLOYMENT
+    route = route_for(task)
+    if route is not None and route.deployment != model:
+        try:
+            return await _hedged_chat(route.deployment, task, lambda: _routed_chat(messages, route, temp, max_tokens))
+        except Exception as e:
+            log.warning(f"Model route '{route.name}' ({route.deployment}) failed for {task or current_phase()[1]}: {e}. Falling back to '{model}'.")
+            count("llm_route_fallbacks", route=route.name, model=route.deployment)
     try:
-        rsp = await client.chat.completions.create(model=model, temperature=temp, max_tokens=max_tokens, messages=messages)
-        log.debug("Chat request successful.")
-        return rsp.choices[0].message.content.strip()
+        return await _hedged_chat(model, task, lambda: _chat(messages, model, temp, max_tokens))
     except Exception as e:
         log.error(f"Chat request failed: {e}")
         return f"Error: Could not get response from language model. {e}"
 
-async def a_embed_batch(texts: List[str], model: str = Settings.AZURE_EMBEDDING_DEPLOYMENT) -> List[Optional[List[float]]]:
+async def _hedged_chat(model: str, task: Optional[str], call) -> str:
+    # A cassette keys identical requests by occurrence, so duplicates would shift what later requests replay.
+    if current_cassette() is not None: return await call()
+    return await hedged(("chat", task or current_phase()[1], model), call)
+
+async def _routed_chat(messages: List[Dict[str, Any]], route: ModelRoute, temp: float, max_tokens: int) -> str:
+    # Each attempt, hedged ones included, holds its own slot of the route.
+    async with route_slot(route):
+        return await _chat(messages, route.deployment, temp, min(max_tokens, route.max_tokens or max_tokens), route)
+
+async def _chat(messages: List[Dict[str, Any]], model: str, temp: float, max_tokens: int, route: Optional[ModelRoute] = None) -> str:
+    route_name = route.name if route is not None else "main"
+    log.debug(f"Sending chat request to model '{model}' (route '{route_name}') with {len(messages)} messages. Max tokens: {max_tokens}")
+    client = get_chat_client()
+    options: Dict[str, Any] = {}
+    if route is not None:
+        if route.max_retries is not None: client = client.with_options(max_retries=route.max_retries)
+        if route.timeout: options["timeout"] = route.timeout
+    with span("llm.chat", "llm", model=model, route=route_name, max_tokens=max_tokens) as s:
+        start = time.perf_counter()
+        try:
+            raw = await client.chat.completions.with_raw_response.create(model=model, temperature=temp, max_tokens=max_tokens, messages=messages, **options)
+            rsp = raw.parse()
+            log.debug("Chat request successful.")
+            _record_llm_call("chat", model, start, "ok", retries=raw.retries_taken, route=route_name)
+            if rsp.usage:
+                charge_chat_tokens(rsp.usage.total_tokens)
+                count("llm_tokens", rsp.usage.prompt_tokens, kind="chat", model=model, route=route_name, type="prompt")
+                count("llm_tokens", rsp.usage.completion_tokens, kind="chat", model=model, route=route_name, type="completion")
+                cost = chat_cost(route, rsp.usage.prompt_tokens, rsp.usage.completion_tokens)
+                if cost: count("llm_cost", cost, model=model, route=route_name)
+                s.set(prompt_tokens=rsp.usage.prompt_tokens, completion_tokens=rsp.usage.completion_tokens)
+            return rsp.choices[0].message.content.strip()
+        except Exception as e:
+            _record_llm_call("chat", model, start, "error", route=route_name)
+            s.set(error=str(e))
+            raise
+
+async def a_embed_batch(texts: List[str], model: Optional[str] = None) -> List[Optional[List[float]]]:
     if not texts: return []
+    model = model or Settings.AZURE_EMBEDDING_DEPLOYMENT
     log.debug(f"Sending batch embedding request for {len(texts)} texts.")
     client = get_embedding_client()
-    try:
-        truncated_texts = [t[:Settings.MAX_EMBED_CHARS] for t in texts]
-        rsp = await client.embeddings.create(model=model, input=truncated_texts)
-        log.debug(f"Batch embedding request successful, received {len(rsp.data)} embeddings.")
-        return [d.embedding for d in rsp.data]
-    except Exception as e:
-        log.error(f"Batch embedding request failed for {len(texts)} texts: {e}")
-        return [None] * len(texts)
+    with span("llm.embed", "llm", model=model, texts=len(texts)) as s:
+        count("embedding_inputs", len(texts), model=model)
+        start = time.perf_counter()
+        try:
+            truncated_texts = [t[:Settings.MAX_EMBED_CHARS] for t in texts]
+            raw = await client.embeddings.with_raw_response.create(model=model, input=truncated_texts)
+            rsp = raw.parse()
+            log.debug(f"Batch embedding request successful, received {len(rsp.data)} embeddings.")
+            _record_llm_call("embedding", model, start, "ok", retries=raw.retries_taken)
+            if rsp.usage:
+                charge_embedding_tokens(rsp.usage.total_tokens)
+                count("llm_tokens", rsp.usage.total_tokens, kind="embedding", model=model, type="input")
+                s.set(tokens=rsp.usage.total_tokens)
+            return [d.embedding for d in rsp.data]
+        except Exception as e:
+            log.error(f"Batch embedding request failed for {len(texts)} texts: {e}")
+            _record_llm_call("embedding", model, start, "error")
+            s.set(error=str(e))
+            return [None] * len(texts)
 
-async def a_embed(text: str, model: str = Settings.AZURE_EMBEDDING_DEPLOYMENT) -> Optional[List[float]]:
+def _record_llm_call(kind: str, model: str, start: float, outcome: str, retries: int = 0, **labels: str):
+    count("llm_requests", kind=kind, model=model, outcome=outcome, **labels)
+    if retries: count("llm_retries", retries, kind=kind, model=model, **labels)
+    observe("llm_request_seconds", time.perf_counter() - start, kind=kind, model=model, **labels)
+
+async def a_embed(text: str, model: Optional[str] = None) -> Optional[List[float]]:
     results = await a_embed_batch([text], model=model)
     return results[0] if results and results[0] is not None else None
 
@@ -82,7 +214,7 @@ async def parse_pdf_with_gpt4o(pdf_bytes: bytes) -> str:
         messages = [{"role": "user","content": [dict(PROMPTS.PDF_OCR[0]), dict(PROMPTS.PDF_OCR[1])]}]
         messages[0]['content'][1]['image_url']['url'] = f"data:application/pdf;base64,{base64_pdf}"
         
-        extracted_text = await a_chat(messages, model=Settings.AZURE_DEPLOYMENT, temp=0.05, max_tokens=4000)
+        extracted_text = await a_chat(messages, model=Settings.AZURE_DEPLOYMENT, temp=0.05, max_tokens=4000, task="pdf_extract")
         if "Error:" in extracted_text: log.error(f"Multimodal model failed to parse PDF: {extracted_text}"); return ""
         log.info(f"Successfully extracted {len(extracted_text)} characters from PDF using multimodal model.")
         return extracted_text
@@ -90,15 +222,30 @@ async def parse_pdf_with_gpt4o(pdf_bytes: bytes) -> str:
         log.error(f"An unexpected error occurred during multimodal PDF parsing: {e}", exc_info=True)
         return ""
 
+def _pdf_to_text(pdf_bytes: bytes) -> str:
+    import fitz
+    text = ""
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc: text += page.get_text()
+    return text
+
+def _html_to_text(content: str) -> str:
+    """Strips markup and boilerplate elements from a page and collapses whitespace (CPU-bound; runs in the parse executor)."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, "html.parser")
+    for bad in soup(["script", "style", "nav", "header", "footer", "aside", "form"]): bad.decompose()
+    return re.sub(r"\s+", " ", soup.get_text(" ", strip=True))
+
 async def parse_pdf_bytes(pdf_bytes: bytes) -> str:
+    with span("fetch.parse_pdf", "fetch", bytes=len(pdf_bytes)) as s:
+        text = await _parse_pdf_bytes(pdf_bytes)
+        s.set(chars=len(text))
+        return text
+
+async def _parse_pdf_bytes(pdf_bytes: bytes) -> str:
     fitz_text = ""
     try:
-        def parse_fitz():
-            text = ""
-            with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
-                for page in doc: text += page.get_text()
-            return text
-        fitz_text = await asyncio.to_thread(parse_fitz)
+        fitz_text = await run_cpu("parse", _pdf_to_text, pdf_bytes)
         log.debug(f"PyMuPDF successfully extracted {len(fitz_text)} characters.")
     except Exception as e:
         log.warning(f"PyMuPDF (fitz) failed to parse PDF. Error: {e}. Will attempt fallback.")
@@ -119,72 +266,167 @@ async def parse_pdf_bytes(pdf_bytes: bytes) -> str:
     return fitz_text
 
 async def fetch_clean(url: str) -> str:
-    if not url or CONTENT_CACHE[url]:
-        if CONTENT_CACHE[url]: log.debug(f"Cache HIT for URL: {url[:80]}...")
-        return CONTENT_CACHE[url] or ""
-    log.debug(f"Cache MISS. Fetching URL: {url[:80]}...")
+    if not url: return ""
+    with span("fetch", "fetch", url=url) as s:
+        cached = CONTENT_CACHE[url]
+        if cached:
+            log.debug(f"Cache HIT for URL: {url[:80]}...")
+            s.set(cache="hit", chars=len(cached))
+            return cached
+        log.debug(f"Cache MISS. Fetching URL: {url[:80]}...")
+        text = await _single_flight(f"fetch:{url}", lambda: _fetch_and_clean(url))
+        s.set(cache="miss", chars=len(text))
+        return text
+
+async def _fetch_and_clean(url: str) -> str:
+    local = await _fetch_from_backend(url)
+    if local is not None: return local
     TOUGH_DOMAINS = ['sciencedirect.com', 'onlinelibrary.wiley.com', 'mdpi.com', 'ieee.org', 'acs.org', 'researchgate.net', 'diamond.ac.uk']
     use_impersonation = any(domain in url for domain in TOUGH_DOMAINS)
+    method = "impersonate" if use_impersonation else "aiohttp"
+    start = time.perf_counter()
     try:
-        content = ""
-        if use_impersonation:
-            log.debug(f"Using impersonation (curl_cffi) for tough domain: {url[:80]}...")
-            async with AsyncSession(impersonate="chrome110", timeout=30) as ses:
-                resp = await ses.get(url)
-                resp.raise_for_status()
-                content_type = resp.headers.get('Content-Type', '').lower()
-                if 'application/pdf' in content_type: content = await parse_pdf_bytes(resp.content)
-                else: content = resp.text
-        else:
-            log.debug(f"Using standard fetch (aiohttp) for: {url[:80]}...")
-            headers = {'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8','User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Gecko/20100101 Firefox/115.0'}
-            async with aiohttp.ClientSession(headers=headers) as ses:
-                async with ses.get(url, timeout=30, allow_redirects=True) as resp:
-                    resp.raise_for_status()
-                    content_type = resp.headers.get('Content-Type', '').lower()
-                    if 'application/pdf' in content_type: content = await parse_pdf_bytes(await resp.read())
-                    else: content = await resp.text()
-        soup = BeautifulSoup(content, "html.parser")
-        for bad in soup(["script", "style", "nav", "header", "footer", "aside", "form"]): bad.decompose()
-        text = re.sub(r"\s+", " ", soup.get_text(" ", strip=True))
+        cassette = current_cassette()
+        # Only live downloads are hedged; a cassette records the one that wins.
+        download = lambda: hedged(("fetch", current_phase()[1], method), lambda: _download(url, use_impersonation),
+                                  succeeded=lambda resp: resp.status < 400)
+        with span("fetch.download", "fetch", method=method) as s:
+            if cassette is None: resp = await download()
+            else: resp = await cassette.through("fetch", (url,), url, download)
+            s.set(status=resp.status, bytes=len(resp.body))
+        if resp.status >= 400: raise RuntimeError(f"HTTP {resp.status}")
+        count("fetch_bytes", len(resp.body), method=method)
+        if 'application/pdf' in resp.content_type: content = await parse_pdf_bytes(resp.body)
+        else: content = resp.text()
+        with span("fetch.clean_html", "cpu", chars=len(content)):
+            text = await run_cpu("parse", _html_to_text, content)
         log.info(f"Successfully fetched and cleaned URL. Content length: {len(text)}. URL: {url[:80]}...")
         text = text[:Settings.MAX_PAGE_CHARS]
         CONTENT_CACHE.put(url, text)
+        count("fetch_requests", method=method, outcome="ok")
         return text
     except Exception as e:
         log.warning(f"Fetch/Parse error for {url[:80]}... ({e})")
+        count("fetch_requests", method=method, outcome="error")
         return ""
+    finally:
+        observe("fetch_request_seconds", time.perf_counter() - start, method=method)
 
-async def searx_search(query: str, limit: int = Settings.SEARCH_RESULTS) -> List[Dict[str, str]]:
-    url = Settings.SEARX_URL + aiohttp.helpers.quote(query) + "&format=json"
-    log.debug(f"Sending search request to SearXNG for query: '{query}'")
+async def _fetch_from_backend(url: str) -> Optional[str]:
+    """The page's text if the search backend serves it itself (e.g. a local document), else None."""
+    backend = current_search_backend()
+    start = time.perf_counter()
     try:
-        async with aiohttp.ClientSession() as ses:
-            async with ses.get(url, timeout=20) as r:
-                r.raise_for_status()
-                j = await r.json()
-                results = [{"title": res.get("title", ""), "url": res.get("url", ""), "snippet": res.get("content", "")} for res in (j.get("results") or [])[:limit]]
-                log.debug(f"SearXNG returned {len(results)} results.")
-                return results
+        text = await backend.fetch(url)
     except Exception as e:
-        log.error(f"SearXNG search failed for query '{query}': {e}")
-        return []
+        log.warning(f"{backend.name} backend could not fetch {url[:80]}... ({e})")
+        count("fetch_requests", method=backend.name, outcome="error")
+        return ""
+    if text is None: return None
+    text = text[:Settings.MAX_PAGE_CHARS]
+    if text: CONTENT_CACHE.put(url, text)
+    count("fetch_requests", method=backend.name, outcome="ok" if text else "error")
+    observe("fetch_request_seconds", time.perf_counter() - start, method=backend.name)
+    return text
+
+async def _download(url: str, use_impersonation: bool) -> Interaction:
+    """GETs a page; the body is kept as bytes with the encoding to decode it with (see `Interaction.text`)."""
+    import aiohttp
+    if use_impersonation:
+        from curl_cffi.requests import AsyncSession
+        log.debug(f"Using impersonation (curl_cffi) for tough domain: {url[:80]}...")
+        async with AsyncSession(impersonate="chrome110", timeout=30) as ses:
+            resp = await ses.get(url)
+            return Interaction(resp.status_code, {"content-type": resp.headers.get('Content-Type', ''), "x-encoding": resp.encoding or "utf-8"}, resp.content)
+    log.debug(f"Using standard fetch (aiohttp) for: {url[:80]}...")
+    headers = {'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8','User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Gecko/20100101 Firefox/115.0'}
+    async with get_http_session().get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=30), allow_redirects=True) as resp:
+        body = await resp.read()
+        content_type = resp.headers.get('Content-Type', '')
+        encoding = "" if 'application/pdf' in content_type.lower() else resp.get_encoding()
+        return Interaction(resp.status, {"content-type": content_type, "x-encoding": encoding}, body)
+
+async def searx_search(query: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+    """Web (or local document) search through the process's search backend (see agent_search.py)."""
+    backend = current_search_backend()
+    if limit is None: limit = Settings.SEARCH_RESULTS
+    if limit <= 0: return []
+    cache_key = f"{backend.name}:{limit}:{query}"
+    with span("search", "search", query=query) as s:
+        cached = SEARCH_CACHE[cache_key]
+        if cached:
+            log.debug(f"Search cache HIT for query: '{query}'")
+            s.set(cache="hit", results=len(cached))
+            return [dict(hit) for hit in cached]
+        results = await _single_flight(f"search:{cache_key}", lambda: _search(backend, cache_key, query, limit))
+        s.set(cache="miss", results=len(results))
+        return [dict(hit) for hit in results]
+
+async def _search(backend: SearchBackend, cache_key: str, query: str, limit: int) -> List[Dict[str, str]]:
+    results = await backend.search(query, limit)
+    if results: SEARCH_CACHE.put(cache_key, results)
+    return results
 
 # --------------------------------------------------------------------------- #
 # 3.  Utilities
 # --------------------------------------------------------------------------- #
 def hash_txt(txt: str) -> str: return hashlib.sha1(txt.encode()).hexdigest()
 
-def sentence_chunks(text: str) -> List[str]:
+def sentence_chunks(text: str, sentences_per_chunk: Optional[int] = None) -> List[str]:
+    n = sentences_per_chunk or Settings.CHUNK_SENTENCES
     sents = re.split(r"(?<=[.!?])\s+", text)
-    chunks = [" ".join(sents[i:i+Settings.CHUNK_SENTENCES]) for i in range(0, len(sents), Settings.CHUNK_SENTENCES) if sents[i:i+Settings.CHUNK_SENTENCES]]
+    chunks = [" ".join(sents[i:i+n]) for i in range(0, len(sents), n) if sents[i:i+n]]
     return chunks
 
-def cosine_similarity(a, b) -> float: 
+def cosine_matrix(a, b):
+    """Cosine similarities between the rows of `a` and the rows of `b`, as an (len(a), len(b)) float32 matrix."""
+    return normalize_rows(a) @ normalize_rows(b).T
+
+def cosine_similarity(a, b) -> float:
     # Handles numpy arrays
     import numpy as np
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
+def normalize_rows(matrix):
+    """Returns a float32 copy of `matrix` with every row scaled to unit L2 norm (zero rows stay zero)."""
+    import numpy as np
+    m = np.asarray(matrix, dtype=np.float32)
+    if m.ndim == 1: m = m[None, :]
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+def mmr_select(query_sims, candidate_embs, k: int, lambda_mult: float) -> List[int]:
+    """
+    Maximal-marginal-relevance selection over unit-normalized candidate embeddings.
+
+    Args:
+        query_sims: 1-D array of each candidate's similarity to the query.
+        candidate_embs: 2-D array of unit-norm candidate embeddings (one row per candidate).
+        k: Number of candidates to select.
+        lambda_mult: Trade-off between relevance (1.0) and diversity (0.0).
+
+    Returns:
+        Indices into the candidate arrays, in selection order.
+    """
+    import numpy as np
+    n = len(query_sims)
+    k = min(k, n)
+    if k <= 0: return []
+    selected = [int(np.argmax(query_sims))]
+    # Running max similarity of every candidate to the already-selected set, updated one row at a time.
+    max_sim_to_selected = candidate_embs @ candidate_embs[selected[0]]
+    available = np.ones(n, dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < k:
+        mmr_scores = lambda_mult * query_sims - (1 - lambda_mult) * max_sim_to_selected
+        mmr_scores[~available] = -np.inf
+        best = int(np.argmax(mmr_scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_sim_to_selected, candidate_embs @ candidate_embs[best], out=max_sim_to_selected)
+    return selected
+
 def extract_json_from_response(raw_response: str) -> Optional[str]:
     """Extracts a JSON string from an LLM response, handling markdown and other noise."""
     # 1. Check for ```json ... ``` markdown block
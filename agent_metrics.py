@@ -0,0 +1,238 @@
+# agent_metrics.py
+import bisect
+import threading
+from contextvars import ContextVar, Token
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent_tracing import current_phase
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is +Inf.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+# name -> (Prometheus type, help text). Counters are exported with a `_total` suffix.
+METRICS = {
+    "llm_requests":        ("counter", "Chat and embedding API requests by kind, model, model route (chat), phase, call site and outcome."),
+    "llm_tokens":          ("counter", "Tokens reported by the API, by kind, model, phase, call site and token type."),
+    "embedding_inputs":    ("counter", "Texts sent for embedding, by model, phase and call site."),
+    "local_embedding_inputs": ("counter", "Texts embedded by a local (CPU) embedding provider, by model, phase and call site."),
+    "llm_retries":         ("counter", "Retries made by the OpenAI client, by kind, model, phase and call site."),
+    "prompt_batches":      ("counter", "Multi-item chat requests by task, phase, call site and outcome (complete, partial or failed parse)."),
+    "prompt_batch_items":  ("counter", "Items of multi-item chat requests by task, phase, call site and result (batched, or fallback to a single call)."),
+    "hedged_requests":     ("counter", "Chat calls and page downloads that outlived their call site's p95, by kind and outcome (primary_won, backup_won, both_failed, over_budget)."),
+    "llm_route_fallbacks": ("counter", "Chat calls whose model route failed and that were retried on the main model, by route, phase and call site."),
+    "llm_cost":            ("counter", "Cost of chat calls (from the configured per-1k-token prices), by model, route, phase and call site."),
+    "llm_request_seconds": ("histogram", "Latency of chat and embedding API requests, including client retries."),
+    "local_embedding_seconds": ("histogram", "Time to embed a batch of texts with a local (CPU) embedding provider, by model."),
+    "prescreened_chunks":  ("counter", "Fetched chunks checked by the redundancy pre-screen, by phase, call site and result (kept or dropped)."),
+    "search_requests":     ("counter", "Search backend requests by phase, call site, backend and outcome (cache hits excluded)."),
+    "search_request_seconds": ("histogram", "Latency of search backend requests, by backend."),
+    "fetch_requests":      ("counter", "Page fetches by phase, call site, method and outcome (cache hits excluded)."),
+    "fetch_bytes":         ("counter", "Bytes of page content downloaded, by phase, call site and method."),
+    "fetch_request_seconds": ("histogram", "Latency of page fetches, including parsing."),
+    "cassette_requests":   ("counter", "Requests answered from (replayed), added to (recorded) or missing from the record/replay cassette, by kind."),
+    "cache_lookups":       ("counter", "Lookups in the in-process caches, by cache, phase, call site and result (hit or miss)."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate of the q-quantile, interpolated linearly within its bucket."""
+        if not self.count: return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else lower * 2
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return LATENCY_BUCKETS[-1]
+
+
+class MetricsRegistry:
+    """
+    Counters and latency histograms of API calls, tokens, fetches and cache lookups.
+
+    Every sample is recorded twice: in the process-wide `PROCESS_METRICS` (what the MCP server
+    exports for Prometheus) and in the registry of the run that made the call, found through a
+    context variable like the run budget (see `use_metrics`). Call counts and tokens carry the
+    pipeline phase and call site they were made from (see `agent_tracing.current_phase`).
+    """
+    def __init__(self):
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series: series[key] = _Histogram()
+            series[key].observe(value)
+
+    def total(self, name: str, **match: str) -> float:
+        """Sum of a counter over every series whose labels include `match`."""
+        return sum(v for labels, v in self._series(self.counters, name) if _matches(labels, match))
+
+    def _series(self, metrics: Dict[str, Dict[Labels, Any]], name: str) -> List[Tuple[Labels, Any]]:
+        with self._lock:
+            return list(metrics.get(name, {}).items())
+
+    def _grouped(self, name: str, by: str, **match: str) -> Dict[str, float]:
+        groups: Dict[str, float] = {}
+        for labels, value in self._series(self.counters, name):
+            if _matches(labels, match):
+                key = dict(labels).get(by, "")
+                groups[key] = groups.get(key, 0) + value
+        return groups
+
+    def _latency(self, name: str, **match: str) -> Optional[Dict[str, float]]:
+        merged = _Histogram()
+        for labels, h in self._series(self.histograms, name):
+            if _matches(labels, match):
+                merged.counts = [a + b for a, b in zip(merged.counts, h.counts)]
+                merged.sum, merged.count = merged.sum + h.sum, merged.count + h.count
+        if not merged.count: return None
+        return {"mean_ms": round(merged.sum / merged.count * 1000, 1), "p50_ms": round(merged.quantile(0.5) * 1000, 1),
+                "p95_ms": round(merged.quantile(0.95) * 1000, 1)}
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals, latencies, cache hit ratios and per-phase / per-call-site breakdowns, as plain JSON."""
+        caches = {}
+        for cache, lookups in self._grouped("cache_lookups", "cache").items():
+            hits = self.total("cache_lookups", cache=cache, result="hit")
+            caches[cache] = {"hits": int(hits), "misses": int(lookups - hits), "hit_ratio": round(hits / lookups, 3) if lookups else 0.0}
+
+        def breakdown(by: str) -> Dict[str, Dict[str, int]]:
+            rows: Dict[str, Dict[str, int]] = {}
+            for column, values in [("chat_calls", self._grouped("llm_requests", by, kind="chat")),
+                                   ("chat_tokens", self._grouped("llm_tokens", by, kind="chat")),
+                                   ("embedding_inputs", self._grouped("embedding_inputs", by)),
+                                   ("embedding_tokens", self._grouped("llm_tokens", by, kind="embedding")),
+                                   ("searches", self._grouped("search_requests", by)),
+                                   ("fetches", self._grouped("fetch_requests", by))]:
+                for key, value in values.items():
+                    rows.setdefault(key, {})[column] = int(value)
+            return rows
+
+        routes = {}
+        for route, calls in self._grouped("llm_requests", "route", kind="chat").items():
+            routes[route] = {"calls": int(calls), "errors": int(self.total("llm_requests", kind="chat", route=route, outcome="error")),
+                             "fallbacks": int(self.total("llm_route_fallbacks", route=route)),
+                             "prompt_tokens": int(self.total("llm_tokens", kind="chat", route=route, type="prompt")),
+                             "completion_tokens": int(self.total("llm_tokens", kind="chat", route=route, type="completion")),
+                             "cost": round(self.total("llm_cost", route=route), 6),
+                             "latency": self._latency("llm_request_seconds", kind="chat", route=route)}
+
+        return {
+            "chat": {"calls": int(self.total("llm_requests", kind="chat")), "errors": int(self.total("llm_requests", kind="chat", outcome="error")),
+                     "prompt_tokens": int(self.total("llm_tokens", kind="chat", type="prompt")),
+                     "completion_tokens": int(self.total("llm_tokens", kind="chat", type="completion")),
+                     "cost": round(self.total("llm_cost"), 6), "latency": self._latency("llm_request_seconds", kind="chat"),
+                     "routes": routes},
+            "embedding": {"calls": int(self.total("llm_requests", kind="embedding")), "errors": int(self.total("llm_requests", kind="embedding", outcome="error")),
+                          "inputs": int(self.total("embedding_inputs")), "local_inputs": int(self.total("local_embedding_inputs")), "tokens": int(self.total("llm_tokens", kind="embedding")),
+                          "latency": self._latency("llm_request_seconds", kind="embedding")},
+            "retries": int(self.total("llm_retries")),
+            "search": {"requests": int(self.total("search_requests")), "errors": int(self.total("search_requests", outcome="error")),
+                       "latency": self._latency("search_request_seconds")},
+            "fetch": {"requests": int(self.total("fetch_requests")), "errors": int(self.total("fetch_requests", outcome="error")),
+                      "bytes": int(self.total("fetch_bytes")), "latency": self._latency("fetch_request_seconds")},
+            "caches": caches,
+            "by_phase": breakdown("phase"),
+            "by_site": breakdown("site"),
+        }
+
+    def to_prometheus(self, prefix: str = "deep_research") -> str:
+        """The registry in the Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {name: dict(series) for name, series in self.histograms.items()}
+        for name, (kind, help_text) in METRICS.items():
+            full = f"{prefix}_{name}_total" if kind == "counter" else f"{prefix}_{name}"
+            series = counters.get(name) if kind == "counter" else histograms.get(name)
+            if not series: continue
+            lines += [f"# HELP {full} {help_text}", f"# TYPE {full} {kind}"]
+            for labels, value in sorted(series.items()):
+                if kind == "counter":
+                    lines.append(f"{full}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS + (float("inf"),), value.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{full}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{full}_sum{_format_labels(labels)} {_format_value(value.sum)}")
+                lines.append(f"{full}_count{_format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _matches(labels: Labels, match: Dict[str, str]) -> bool:
+    if not match: return True
+    found = dict(labels)
+    return all(found.get(k) == v for k, v in match.items())
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels: return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+PROCESS_METRICS = MetricsRegistry()
+_current_metrics: ContextVar[Optional[MetricsRegistry]] = ContextVar("run_metrics", default=None)
+
+
+def use_metrics(registry: Optional[MetricsRegistry]) -> Token:
+    """Makes `registry` record the samples of this context (and of tasks created from it), besides `PROCESS_METRICS`."""
+    return _current_metrics.set(registry)
+
+
+def reset_metrics(token: Token):
+    _current_metrics.reset(token)
+
+
+def current_metrics() -> Optional[MetricsRegistry]:
+    return _current_metrics.get()
+
+
+def count(name: str, value: float = 1, **labels: str):
+    """Adds to a counter of the process and of the current run, labelled with the caller's phase and call site."""
+    labels["phase"], labels["site"] = current_phase()
+    PROCESS_METRICS.inc(name, value, **labels)
+    run = _current_metrics.get()
+    if run is not None: run.inc(name, value, **labels)
+
+
+def observe(name: str, seconds: float, **labels: str):
+    """Records a latency in the process and current run histograms."""
+    PROCESS_METRICS.observe(name, seconds, **labels)
+    run = _current_metrics.get()
+    if run is not None: run.observe(name, seconds, **labels)
@@ -0,0 +1,48 @@
+# agent_routing.py
+import asyncio
+import contextlib
+from contextvars import ContextVar, Token
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+
+from agent_config import ModelRoute, Settings
+from agent_tracing import current_phase
+
+# task or call site -> route, for the running pipeline (see `use_routes`).
+_current_routes: ContextVar[Dict[str, ModelRoute]] = ContextVar("model_routes", default={})
+# Concurrency limits are per deployment and process, so runs sharing a route share its slots.
+_slots: Dict[Tuple[str, str, int], asyncio.Semaphore] = {}
+
+
+def use_routes(routes: Iterable[ModelRoute]) -> Token:
+    """Makes `routes` the current run's model routes in this context (and tasks created from it)."""
+    return _current_routes.set({task: route for route in routes for task in route.tasks})
+
+
+def reset_routes(token: Token):
+    _current_routes.reset(token)
+
+
+def route_for(task: Optional[str]) -> Optional[ModelRoute]:
+    """The route serving a chat call: the one for its task, else the one for its call site; None = the main model."""
+    routes = _current_routes.get()
+    if not routes: return None
+    return routes.get(task) if task in routes else routes.get(current_phase()[1])
+
+
+@contextlib.asynccontextmanager
+async def route_slot(route: ModelRoute) -> AsyncIterator[None]:
+    """Holds one of the route's `max_concurrency` request slots (no limit if 0)."""
+    if not route.max_concurrency:
+        yield
+        return
+    key = (route.name, route.deployment, id(asyncio.get_running_loop()))
+    if key not in _slots: _slots[key] = asyncio.Semaphore(route.max_concurrency)
+    async with _slots[key]:
+        yield
+
+
+def chat_cost(route: Optional[ModelRoute], prompt_tokens: int, completion_tokens: int) -> float:
+    """Price of a chat call on `route` (None = the main model), from the per-1,000-token prices; 0 if unpriced."""
+    prompt_price, completion_price = ((route.prompt_cost_per_1k, route.completion_cost_per_1k) if route is not None
+                                      else (Settings.CHAT_PROMPT_COST_PER_1K, Settings.CHAT_COMPLETION_COST_PER_1K))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
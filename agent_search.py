@@ -0,0 +1,333 @@
+# agent_search.py
+import abc
+import argparse
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from agent_cassette import current_cassette
+from agent_config import Settings, log
+from agent_metrics import count, observe
+
+# File types the local backend indexes, by suffix.
+DOCUMENT_SUFFIXES = {".html": "html", ".htm": "html", ".xhtml": "html", ".txt": "text", ".md": "text", ".rst": "text", ".pdf": "pdf"}
+
+
+class SearchBackend(abc.ABC):
+    """
+    Where `searx_search` finds results and `fetch_clean` resolves the URLs they point to.
+
+    `search` returns up to `limit` results as `{"title", "url", "snippet"}` dicts. `fetch`
+    returns the clean text of a URL the backend can serve itself (e.g. a local document), or
+    None to have `fetch_clean` download it from the web.
+    """
+    name = "search"
+
+    @abc.abstractmethod
+    async def search(self, query: str, limit: int) -> List[Dict[str, str]]:
+        ...
+
+    async def fetch(self, url: str) -> Optional[str]:
+        return None
+
+    def close(self):
+        pass
+
+
+class SearxngBackend(SearchBackend):
+    """A SearXNG instance's JSON API (`Settings.SEARX_URL`, read per request)."""
+    name = "searxng"
+
+    def __init__(self, url: Optional[str] = None):
+        self.url = url
+
+    async def search(self, query: str, limit: int) -> List[Dict[str, str]]:
+        from urllib.parse import quote
+        url = (self.url or Settings.SEARX_URL) + quote(query) + "&format=json"
+        log.debug(f"Sending search request to SearXNG for query: '{query}'")
+        start = time.perf_counter()
+        try:
+            cassette = current_cassette()
+            if cassette is None: resp = await self._get(url)
+            else: resp = await cassette.through("search", (query,), query, lambda: self._get(url))
+            if resp.status >= 400: raise RuntimeError(f"HTTP {resp.status}")
+            j = json.loads(resp.body)
+            results = [{"title": res.get("title", ""), "url": res.get("url", ""), "snippet": res.get("content", "")} for res in (j.get("results") or [])[:limit]]
+            log.debug(f"SearXNG returned {len(results)} results.")
+            count("search_requests", backend=self.name, outcome="ok")
+            return results
+        except Exception as e:
+            log.error(f"SearXNG search failed for query '{query}': {e}")
+            count("search_requests", backend=self.name, outcome="error")
+            return []
+        finally:
+            observe("search_request_seconds", time.perf_counter() - start, backend=self.name)
+
+    @staticmethod
+    async def _get(url: str):
+        import aiohttp
+        from agent_cassette import Interaction
+        from agent_helpers import get_http_session
+        async with get_http_session().get(url, timeout=aiohttp.ClientTimeout(total=20)) as r:
+            return Interaction(r.status, {"content-type": r.headers.get('Content-Type', '')}, await r.read())
+
+
+# --------------------------------------------------------------------------- #
+#  Local document search
+# --------------------------------------------------------------------------- #
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id      INTEGER PRIMARY KEY,
+    path    TEXT NOT NULL UNIQUE,
+    url     TEXT NOT NULL UNIQUE,
+    mtime   REAL NOT NULL,
+    size    INTEGER NOT NULL,
+    title   TEXT NOT NULL,
+    text    TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    title, text, content='documents', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, title, text) VALUES (new.id, new.title, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, title, text) VALUES ('delete', old.id, old.title, old.text);
+    INSERT INTO documents_fts (rowid, title, text) VALUES (new.id, new.title, new.text);
+END;
+"""
+
+# Title matches count this many times as much as body matches in the BM25 score.
+_TITLE_WEIGHT = 4.0
+
+
+def _read_document(path: str) -> Tuple[str, str]:
+    """(title, clean text) of a local document; ("", "") if it cannot be read. CPU-bound; runs in the parse executor."""
+    from agent_helpers import _html_to_text, _pdf_to_text
+    file = Path(path)
+    try:
+        kind = DOCUMENT_SUFFIXES[file.suffix.lower()]
+        if kind == "pdf":
+            data = file.read_bytes()
+            return file.stem, _pdf_to_text(data)
+        content = file.read_text(encoding="utf-8", errors="replace")
+        if kind == "html":
+            title = re.search(r"<title[^>]*>(.*?)</title>", content, re.IGNORECASE | re.DOTALL)
+            return (re.sub(r"\s+", " ", title.group(1)).strip() if title else "") or file.stem, _html_to_text(content)
+        first_line = next((line.strip("# \t") for line in content.splitlines() if line.strip()), "")
+        return first_line[:120] or file.stem, content
+    except Exception as e:
+        log.warning(f"Could not index {path}: {e}")
+        return "", ""
+
+
+class LocalSearchIndex:
+    """
+    On-disk full-text index of a directory of documents (HTML, text, PDF), ranked with BM25.
+
+    The index is an SQLite FTS5 table (Porter-stemmed, BM25 ranking with title matches
+    weighted up) next to the documents' clean text, so results and the pages they link to
+    are served without parsing anything again. `update` is incremental: only files added or
+    changed since (by modification time and size) are parsed, in the parse executor, and
+    files that disappeared are dropped.
+
+    Safe to share between the pipelines of one process; calls are serialized by a lock and
+    are meant to run in a worker thread (`asyncio.to_thread`).
+    """
+    def __init__(self, index_path: Union[str, Path]):
+        self.path = Path(index_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=30.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def update(self, directory: Union[str, Path], batch_size: int = 256) -> Dict[str, int]:
+        """Brings the index up to date with `directory`; returns counts of added, updated, removed and unchanged documents."""
+        from agent_executor import get_executor
+        root = Path(directory).resolve()
+        files = {str(p): (st.st_mtime, st.st_size) for p, st in _walk(root)}
+        with self._lock:
+            known = {path: (mtime, size) for path, mtime, size in self._db.execute("SELECT path, mtime, size FROM documents")}
+        # Documents of other directories indexed into the same file are left alone.
+        removed = [path for path in known if path not in files and Path(path).is_relative_to(root)]
+        changed = sorted(path for path, signature in files.items() if known.get(path) != signature)
+        if removed:
+            with self._lock, self._db:
+                self._db.executemany("DELETE FROM documents WHERE path = ?", [(path,) for path in removed])
+
+        executor = get_executor("parse")
+        indexed = 0
+        for start in range(0, len(changed), batch_size):
+            batch = changed[start:start + batch_size]
+            parsed = list(executor.map(_read_document, batch, chunksize=8) if executor else map(_read_document, batch))
+            # An unreadable file is stored with empty text: its stale row goes, and it is not parsed again until it changes.
+            rows = [(path, Path(path).as_uri(), *files[path], title if text.strip() else "", text if text.strip() else "")
+                    for path, (title, text) in zip(batch, parsed)]
+            with self._lock, self._db:
+                self._db.executemany(
+                    "INSERT INTO documents (path, url, mtime, size, title, text) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET url = excluded.url, mtime = excluded.mtime, size = excluded.size, "
+                    "title = excluded.title, text = excluded.text", rows)
+            indexed += sum(1 for row in rows if row[-1])
+            log.info(f"Indexed {start + len(batch)}/{len(changed)} new or changed documents under {root}.")
+        added = sum(1 for path in changed if path not in known)
+        return {"added": added, "updated": len(changed) - added, "removed": len(removed),
+                "unchanged": len(files) - len(changed), "unreadable": len(changed) - indexed}
+
+    def search(self, query: str, limit: int) -> List[Dict[str, str]]:
+        """The `limit` best BM25 matches of any of the query's words, as search results."""
+        terms = re.findall(r"\w+", query.lower())
+        if not terms or limit <= 0: return []
+        match = " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT d.title, d.url, snippet(documents_fts, 1, '', '', ' … ', 32) FROM documents_fts "
+                "JOIN documents d ON d.id = documents_fts.rowid WHERE documents_fts MATCH ? "
+                f"ORDER BY bm25(documents_fts, {_TITLE_WEIGHT}, 1.0) LIMIT ?", (match, limit)).fetchall()
+        return [{"title": title, "url": url, "snippet": " ".join(snippet.split())} for title, url, snippet in rows]
+
+    def get_text(self, url: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT text FROM documents WHERE url = ? AND text != ''", (url,)).fetchone()
+        return row[0] if row else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            documents, chars = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(text)), 0) FROM documents WHERE text != ''").fetchone()
+        return {"documents": documents, "chars": chars}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _walk(root: Path) -> Iterator[Tuple[Path, os.stat_result]]:
+    """Indexable files under `root` (hidden files and directories skipped)."""
+    for path in root.rglob("*"):
+        if path.suffix.lower() not in DOCUMENT_SUFFIXES: continue
+        if any(part.startswith(".") for part in path.relative_to(root).parts): continue
+        try:
+            if path.is_file(): yield path, path.stat()
+        except OSError:
+            continue
+
+
+class LocalIndexBackend(SearchBackend):
+    """
+    Searches a local document directory through a `LocalSearchIndex`, and serves the documents'
+    text to `fetch_clean` for their `file://` URLs. With `auto_index`, the index is updated
+    (incrementally) on first use in the process.
+    """
+    name = "local"
+
+    def __init__(self, directory: Union[str, Path], index_path: Optional[Union[str, Path]] = None, auto_index: bool = True):
+        self.directory = Path(directory)
+        self.index = LocalSearchIndex(index_path or default_index_path(self.directory))
+        self.auto_index = auto_index
+        self._update_lock = threading.Lock()
+        self._updated = not auto_index
+
+    def _ensure_updated(self):
+        with self._update_lock:
+            if self._updated: return
+            start = time.perf_counter()
+            changes = self.index.update(self.directory)
+            self._updated = True
+            log.info(f"Local search index of {self.directory} is up to date ({changes}, {time.perf_counter() - start:.1f}s).")
+
+    async def search(self, query: str, limit: int) -> List[Dict[str, str]]:
+        start = time.perf_counter()
+        try:
+            if not self._updated: await asyncio.to_thread(self._ensure_updated)
+            results = await asyncio.to_thread(self.index.search, query, limit)
+            count("search_requests", backend=self.name, outcome="ok")
+            return results
+        except Exception as e:
+            log.error(f"Local search failed for query '{query}': {e}")
+            count("search_requests", backend=self.name, outcome="error")
+            return []
+        finally:
+            observe("search_request_seconds", time.perf_counter() - start, backend=self.name)
+
+    async def fetch(self, url: str) -> Optional[str]:
+        if not url.startswith("file:"): return None
+        return await asyncio.to_thread(self.index.get_text, url)
+
+    def close(self):
+        self.index.close()
+
+
+def default_index_path(directory: Union[str, Path]) -> Path:
+    """`Settings.LOCAL_SEARCH_INDEX`, or a hidden file in the document directory."""
+    return Path(Settings.LOCAL_SEARCH_INDEX) if Settings.LOCAL_SEARCH_INDEX else Path(directory) / ".deep-research-index.sqlite"
+
+
+def _local_backend() -> LocalIndexBackend:
+    if not Settings.LOCAL_SEARCH_DIR:
+        raise ValueError("SEARCH_BACKEND=local needs LOCAL_SEARCH_DIR, the directory of documents to search.")
+    return LocalIndexBackend(Settings.LOCAL_SEARCH_DIR, auto_index=Settings.LOCAL_SEARCH_AUTO_INDEX)
+
+
+# name -> factory of the backend, for `Settings.SEARCH_BACKEND`. Add others with `register_search_backend`.
+SEARCH_BACKENDS: Dict[str, Callable[[], SearchBackend]] = {"searxng": SearxngBackend, "local": _local_backend}
+
+_backend: Optional[SearchBackend] = None
+
+
+def register_search_backend(name: str, factory: Callable[[], SearchBackend]):
+    SEARCH_BACKENDS[name] = factory
+
+
+def use_search_backend(backend: Optional[Union[SearchBackend, str]]) -> Optional[SearchBackend]:
+    """Sets the process's search backend: an instance, a registered name, or None for `Settings.SEARCH_BACKEND` on next use."""
+    global _backend
+    if isinstance(backend, str):
+        if backend not in SEARCH_BACKENDS:
+            raise ValueError(f"Unknown search backend {backend!r}; available: {', '.join(SEARCH_BACKENDS)}.")
+        backend = SEARCH_BACKENDS[backend]()
+    _backend = backend
+    return backend
+
+
+def current_search_backend() -> SearchBackend:
+    """The process's search backend, created from `Settings.SEARCH_BACKEND` on first use."""
+    if _backend is None:
+        use_search_backend(Settings.SEARCH_BACKEND)
+    return _backend
+
+
+if __name__ == "__main__":
+    from agent_config import configure_logging
+    from agent_executor import shutdown_executors
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Builds or queries the local document search index (SEARCH_BACKEND=local).")
+    parser.add_argument("command", choices=["index", "search"])
+    parser.add_argument("directory", type=Path, help="Directory of HTML, text and PDF documents.")
+    parser.add_argument("query", nargs="?", help="Query for the 'search' command.")
+    parser.add_argument("--index", type=Path, help="Index file (default: LOCAL_SEARCH_INDEX or DIRECTORY/.deep-research-index.sqlite).")
+    parser.add_argument("-n", "--limit", type=int, default=Settings.SEARCH_RESULTS)
+    args = parser.parse_args()
+    index = LocalSearchIndex(args.index or default_index_path(args.directory))
+    try:
+        if args.command == "index":
+            start = time.perf_counter()
+            print(index.update(args.directory), index.stats(), f"{time.perf_counter() - start:.1f}s")
+        else:
+            if not args.query: parser.error("'search' needs a query")
+            start = time.perf_counter()
+            results = index.search(args.query, args.limit)
+            for hit in results: print(f"{hit['title']}\n  {hit['url']}\n  {hit['snippet']}\n")
+            print(f"{len(results)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+    finally:
+        index.close()
+        shutdown_executors(wait=False)
@@ -0,0 +1,189 @@
+# agent_tracing.py
+import asyncio
+import functools
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar, Token
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+
+class Span:
+    """A timed operation of a traced run; use as a context manager and attach attributes with `set`."""
+    __slots__ = ("tracer", "name", "category", "attrs", "start", "duration", "lane")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, attrs: Dict[str, Any]):
+        self.tracer, self.name, self.category, self.attrs = tracer, name, category, attrs
+        self.start = self.duration = 0.0
+        self.lane = 0
+
+    def set(self, **attrs: Any) -> "Span":
+        self.attrs.update(attrs)
+        return self
+
+    def __enter__(self) -> "Span":
+        self.lane = self.tracer._lane()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = "cancelled" if exc_type is asyncio.CancelledError else f"{exc_type.__name__}: {exc}"
+        self.tracer.spans.append(self)
+        return False
+
+
+class _NoopSpan:
+    """Returned by `span` when tracing is off: every operation is a no-op."""
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> "_NoopSpan":
+        return self
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Collects the spans of one research run.
+
+    Spans are grouped into lanes by the asyncio task (or thread) that ran them, so concurrent
+    work -- sections, fetches, embedding batches -- shows up side by side in a Chrome trace
+    (chrome://tracing or https://ui.perfetto.dev) while spans within a lane nest properly.
+    """
+    def __init__(self, name: str = "research"):
+        self.name = name
+        self.spans: List[Span] = []
+        self.started_at = time.perf_counter()
+        self.wall_started_at = time.time()
+        self._lanes: Dict[int, int] = {}
+        self._lane_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = id(task) if task is not None else threading.get_ident()
+        lane = self._lanes.get(key)
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.setdefault(key, len(self._lanes) + 1)
+                self._lane_names[lane] = task.get_name() if task is not None else threading.current_thread().name
+        return lane
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per span name: calls, total, mean and max seconds, sorted by total time."""
+        by_name: Dict[str, List[float]] = {}
+        for s in self.spans:
+            by_name.setdefault(s.name, []).append(s.duration)
+        rows = [{"name": name, "calls": len(d), "total_s": sum(d), "mean_ms": sum(d) / len(d) * 1000, "max_ms": max(d) * 1000}
+                for name, d in by_name.items()]
+        return sorted(rows, key=lambda r: r["total_s"], reverse=True)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """The spans in Chrome's Trace Event Format (complete events, microseconds)."""
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": self.name}}]
+        events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": lane, "args": {"name": name}} for lane, name in self._lane_names.items()]
+        for s in sorted(self.spans, key=lambda s: s.start):
+            events.append({"name": s.name, "cat": s.category, "ph": "X", "pid": pid, "tid": s.lane,
+                           "ts": round((s.start - self.started_at) * 1e6, 1), "dur": round(s.duration * 1e6, 1),
+                           "args": {k: _jsonable(v) for k, v in s.attrs.items()}})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"run": self.name, "started_at": self.wall_started_at}}
+
+    def export_chrome_trace(self, path: Union[str, Path]) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_chrome_trace()), encoding="utf-8")
+        return path
+
+    def print_summary(self, console=None, limit: int = 25):
+        """Prints the per-span summary as a rich table."""
+        from rich.console import Console
+        from rich.table import Table
+        console = console or Console()
+        wall = self.elapsed
+        table = Table(title=f"[bold]⏱ Trace summary[/bold] ({wall:.1f}s wall)")
+        for column in ("Span", "Calls", "Total (s)", "Mean (ms)", "Max (ms)", "Σ / wall"):
+            table.add_column(column, justify="left" if column == "Span" else "right")
+        for row in self.summary()[:limit]:
+            table.add_row(row["name"], str(row["calls"]), f"{row['total_s']:.2f}", f"{row['mean_ms']:.0f}", f"{row['max_ms']:.0f}",
+                          f"{row['total_s'] / wall:.0%}" if wall > 0 else "-")
+        console.print(table)
+
+
+def _jsonable(value: Any) -> Any:
+    return value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+
+
+_current_tracer: ContextVar[Optional[Tracer]] = ContextVar("tracer", default=None)
+# Names of the `traced` phases the current task is inside, outermost first.
+_current_phases: ContextVar[Tuple[str, ...]] = ContextVar("phases", default=())
+
+
+def use_tracer(tracer: Optional[Tracer]) -> Token:
+    """Makes `tracer` collect the spans of this context (and of tasks created from it)."""
+    return _current_tracer.set(tracer)
+
+
+def reset_tracer(token: Token):
+    _current_tracer.reset(token)
+
+
+def current_tracer() -> Optional[Tracer]:
+    return _current_tracer.get()
+
+
+def current_phase() -> Tuple[str, str]:
+    """(pipeline phase, call site): the outermost and innermost `traced` phase the caller is in."""
+    phases = _current_phases.get()
+    return (phases[0], phases[-1]) if phases else ("other", "other")
+
+
+def span(name: str, category: str = "phase", **attrs: Any):
+    """
+    A span of the current run's tracer, to be used as `with span(...) as s:`.
+
+    Without an active tracer this returns a shared no-op object, so instrumentation costs a
+    context-variable lookup when tracing is off.
+    """
+    tracer = _current_tracer.get()
+    if tracer is None: return _NOOP_SPAN
+    return Span(tracer, name, category, attrs)
+
+
+def traced(name: Optional[str] = None, category: str = "phase") -> Callable:
+    """
+    Decorator that wraps every call of an async function in a span. Functions in the "phase"
+    category also name the phase their callees run in (see `current_phase`), traced or not.
+    """
+    def decorate(fn):
+        span_name = name or fn.__qualname__
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            token = _current_phases.set(_current_phases.get() + (span_name,)) if category == "phase" else None
+            try:
+                if _current_tracer.get() is None: return await fn(*args, **kwargs)
+                with span(span_name, category):
+                    return await fn(*args, **kwargs)
+            finally:
+                if token is not None: _current_phases.reset(token)
+        return wrapper
+    return decorate
@@ -0,0 +1,163 @@
+# batch.py
+import argparse
+import asyncio
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from agent_config import SCRIPT_VERSION, RunConfig, Settings, configure_logging, log
+from agent_executor import ensure_loop_monitor, shutdown_executors
+from agent_helpers import CONTENT_CACHE, EMBED_CACHE, SEARCH_CACHE, close_http_session
+from agent_metrics import PROCESS_METRICS
+from research.corpus import default_corpus
+from research.persistence import report_filename
+from research.pipeline import ResearchPipeline, is_failed_report
+from research.report_cache import default_report_cache
+
+console = Console()
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one query in a batch."""
+    query: str
+    seconds: float
+    report_path: Optional[str] = None
+    error: Optional[str] = None
+    metrics: Optional[dict] = None
+
+
+def read_queries(path: Path) -> List[str]:
+    """Reads one query per line, skipping blank lines, `#` comments and exact duplicates."""
+    queries = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            queries.append(line)
+    unique = list(dict.fromkeys(queries))
+    if len(unique) < len(queries):
+        log.warning(f"Skipping {len(queries) - len(unique)} duplicate queries in {path}.")
+    return unique
+
+
+async def run_batch(queries: List[str], config: RunConfig, out_dir: Path, concurrency: int) -> List[BatchResult]:
+    """
+    Runs many research pipelines concurrently in this event loop.
+
+    A fixed pool of `concurrency` workers drains a queue of questions, so at most that many
+    pipelines are active at once. All of them share the process-wide Azure clients, HTTP session
+    and the embedding, page-content and search caches; concurrent fetches of the same URL or
+    search are collapsed into a single request. Each report is written as soon as it is done.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    queue: "asyncio.Queue[str]" = asyncio.Queue()
+    for query in queries: queue.put_nowait(query)
+    results: List[BatchResult] = []
+
+    async def worker():
+        while True:
+            try:
+                query = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            pipeline = ResearchPipeline(query, config=config, report_cache=default_report_cache(), corpus=default_corpus())
+            try:
+                report = await pipeline.run()
+                if is_failed_report(report):
+                    # The pipeline reports some failures as its result rather than raising.
+                    error = report.removeprefix("Error:").strip().splitlines()[0].lstrip("# ")
+                    log.error(f"Batch query failed: '{query}': {error}")
+                    result = BatchResult(query, time.perf_counter() - start, error=error, metrics=pipeline.metrics.summary())
+                else:
+                    report_path = out_dir / report_filename(query)
+                    report_path.write_text(report, encoding="utf-8")
+                    result = BatchResult(query, time.perf_counter() - start, report_path=str(report_path), metrics=pipeline.metrics.summary())
+            except Exception as e:
+                log.error(f"Batch query failed: '{query}'", exc_info=True)
+                result = BatchResult(query, time.perf_counter() - start, error=str(e))
+            if result.error is None:
+                console.print(f"[green]✓[/green] [{len(results) + 1}/{len(queries)}] {query} [dim]({result.seconds:.0f}s)[/dim]")
+            else:
+                console.print(f"[red]✗[/red] [{len(results) + 1}/{len(queries)}] {query}: {result.error}")
+            results.append(result)
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(queries)))))
+    return results
+
+
+def print_batch_stats(results: List[BatchResult], wall_seconds: float, loop_stats: Optional[dict] = None):
+    """Prints aggregate throughput, latency and shared-cache statistics for a finished batch."""
+    succeeded = [r for r in results if r.error is None]
+    latencies = np.array([r.seconds for r in succeeded]) if succeeded else np.zeros(1)
+    table = Table(title="[bold green]📊 Batch Summary[/bold green]", show_header=False)
+    table.add_column("Metric", style="cyan")
+    table.add_column("Value")
+    table.add_row("Queries (succeeded / failed)", f"{len(succeeded)} / {len(results) - len(succeeded)}")
+    table.add_row("Wall time", f"{wall_seconds:.1f}s")
+    table.add_row("Throughput", f"{len(succeeded) / wall_seconds * 3600:.1f} queries/hour" if wall_seconds > 0 else "n/a")
+    table.add_row("Per-query latency (mean / p50 / max)", f"{latencies.mean():.1f}s / {np.median(latencies):.1f}s / {latencies.max():.1f}s")
+    metrics = PROCESS_METRICS.summary()
+    table.add_row("Chat calls (prompt / completion tokens)", f"{metrics['chat']['calls']} ({metrics['chat']['prompt_tokens']} / {metrics['chat']['completion_tokens']})")
+    table.add_row("Embedding calls (inputs, tokens)", f"{metrics['embedding']['calls']} ({metrics['embedding']['inputs']}, {metrics['embedding']['tokens']})")
+    table.add_row("Searches / fetches (bytes)", f"{metrics['search']['requests']} / {metrics['fetch']['requests']} ({metrics['fetch']['bytes'] / 2**20:.1f} MiB)")
+    for name, cache in [("Page content cache", CONTENT_CACHE), ("Search cache", SEARCH_CACHE), ("Embedding cache", EMBED_CACHE)]:
+        table.add_row(f"{name} (hit ratio, entries)", f"{cache.hit_ratio():.1%}, {len(cache)}")
+    if loop_stats:
+        table.add_row("Event-loop stalls (count, max, total)", f"{loop_stats['stalls']}, {loop_stats['max_lag_ms']:.0f} ms, {loop_stats['total_blocked_ms']:.0f} ms")
+    console.print(table)
+
+
+async def batch_cli():
+    """Command-line interface for running a file of research questions in one process."""
+    parser = argparse.ArgumentParser(description=f"Deep-Research Agent v{SCRIPT_VERSION} (batch mode)")
+    parser.add_argument("queries_file", type=Path, help="Text file with one research question per line ('#' starts a comment).")
+    parser.add_argument("-o", "--out-dir", type=Path, default=Path("reports"), help="Directory for the reports and batch_summary.json (default: ./reports).")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Maximum number of pipelines running at once (default: 4).")
+    parser.add_argument("--max-cycles", type=int, default=Settings.MAX_CYCLES, help=f"Maximum agentic cycles per question (default: {Settings.MAX_CYCLES}).")
+    parser.add_argument("--deadline", type=float, default=Settings.RUN_DEADLINE_SECONDS, metavar="SECONDS", help="Per-question time budget (0 = no limit).")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the pipelines' logs (interleaved).")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    # Per-pipeline rich panels would interleave, so the pipelines run without UI and the batch reports progress.
+    config = RunConfig(output_style="quiet", max_cycles=args.max_cycles, deadline_seconds=args.deadline)
+    logging.getLogger().setLevel(Settings.LOG_LEVEL if args.verbose else logging.CRITICAL + 10)
+    log.setLevel(Settings.LOG_LEVEL if args.verbose else logging.ERROR)
+
+    queries = read_queries(args.queries_file)
+    if not queries:
+        parser.error(f"no queries found in {args.queries_file}")
+    console.print(f"[bold magenta]🔬 Running {len(queries)} research questions, {args.concurrency} at a time[/bold magenta]")
+
+    start = time.perf_counter()
+    monitor = ensure_loop_monitor()
+    try:
+        results = await run_batch(queries, config, args.out_dir, args.concurrency)
+    finally:
+        await close_http_session()
+        shutdown_executors(wait=False)
+    wall_seconds = time.perf_counter() - start
+
+    summary_path = args.out_dir / "batch_summary.json"
+    summary_path.write_text(json.dumps({"wall_seconds": wall_seconds, "metrics": PROCESS_METRICS.summary(), "results": [asdict(r) for r in results]},
+                                       indent=2, ensure_ascii=False), encoding="utf-8")
+    (args.out_dir / "metrics.prom").write_text(PROCESS_METRICS.to_prometheus(), encoding="utf-8")
+    print_batch_stats(results, wall_seconds, monitor.stats() if monitor else None)
+    console.print(f"[cyan]Reports and summary written to:[/] {args.out_dir.resolve()}")
+
+
+if __name__ == "__main__":
+    configure_logging()
+    try:
+        asyncio.run(batch_cli())
+    except KeyboardInterrupt:
+        print("\n--- Batch interrupted by user. Shutting down. ---")
@@ -0,0 +1,8 @@
+# bench/__init__.py
+"""
+Offline end-to-end benchmarks.
+
+`bench.fake_servers` provides local stand-ins for Azure OpenAI (chat and embeddings), SearXNG
+and the web (a static server over a fixture corpus of HTML and PDF pages); `bench.e2e` drives
+`ResearchPipeline.run` against them and reports wall time, throughput, call counts and memory.
+"""
@@ -0,0 +1,172 @@
+# bench/e2e.py
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from rich.console import Console
+from rich.table import Table
+
+from bench.fake_servers import FakeServerConfig, FakeServers, configure_settings
+from bench.fixtures import BENCH_QUERIES, build_corpus, load_corpus
+
+console = Console()
+
+# Benchmark figures compared against a baseline, and whether higher values are better.
+COMPARED = {
+    "wall_seconds": False, "mean_run_seconds": False, "p95_run_seconds": False, "runs_per_hour": True,
+    "chat_calls": False, "chat_tokens": False, "embedding_calls": False, "embedding_inputs": False,
+    "searches": False, "fetches": False, "peak_rss_mb": False,
+}
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+async def run_level(queries: List[str], concurrency: int, max_cycles: int) -> Dict[str, Any]:
+    """Researches every query end to end, `concurrency` at a time, and aggregates the runs' metrics."""
+    from agent_config import RunConfig
+    from agent_executor import ensure_loop_monitor
+    from agent_helpers import close_http_session
+    from research.pipeline import ResearchPipeline
+
+    config = RunConfig(output_style="detailed", max_cycles=max_cycles)
+    monitor = ensure_loop_monitor()
+    limit = asyncio.Semaphore(concurrency)
+    runs: List[Dict[str, Any]] = []
+
+    async def research(query: str):
+        async with limit:
+            pipeline = ResearchPipeline(query, config=config, report_cache=None, corpus=None)
+            start = time.perf_counter()
+            report = await pipeline.run()
+            runs.append({"query": query, "seconds": time.perf_counter() - start, "report_chars": len(report),
+                         "sources": len(pipeline.state.results), "metrics": pipeline.metrics.summary()})
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(research(q) for q in queries))
+    finally:
+        await close_http_session()
+    wall = time.perf_counter() - start
+
+    seconds = sorted(r["seconds"] for r in runs)
+    total = lambda *path: sum(_dig(r["metrics"], path) for r in runs)
+    return {
+        "concurrency": concurrency, "runs": len(runs), "wall_seconds": round(wall, 3),
+        "mean_run_seconds": round(sum(seconds) / len(seconds), 3), "p95_run_seconds": round(seconds[min(len(seconds) - 1, int(0.95 * len(seconds)))], 3),
+        "runs_per_hour": round(len(runs) / wall * 3600, 1),
+        "chat_calls": total("chat", "calls"), "chat_tokens": total("chat", "prompt_tokens") + total("chat", "completion_tokens"),
+        "embedding_calls": total("embedding", "calls"), "embedding_inputs": total("embedding", "inputs"),
+        "searches": total("search", "requests"), "fetches": total("fetch", "requests"), "retries": total("retries"),
+        "loop_stalls": monitor.stats()["stalls"] if monitor else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "per_run": runs,
+    }
+
+
+def _dig(summary: Dict[str, Any], path) -> int:
+    for key in path: summary = summary.get(key, 0) if isinstance(summary, dict) else 0
+    return summary or 0
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of `results` against `baseline`: figures more than `tolerance` (a fraction) worse, per concurrency level."""
+    regressions = []
+    base_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in results["levels"]:
+        base = base_levels.get(level["concurrency"])
+        if base is None: continue
+        for name, higher_is_better in COMPARED.items():
+            now, before = level.get(name), base.get(name)
+            if not now or not before: continue
+            change = (now - before) / before
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"concurrency {level['concurrency']}: {name} {before} -> {now} ({change:+.0%})")
+    return regressions
+
+
+def print_results(results: Dict[str, Any]):
+    table = Table(title="[bold green]⏱ End-to-end benchmark[/bold green]")
+    table.add_column("Concurrency", style="cyan")
+    for level in results["levels"]: table.add_column(str(level["concurrency"]), justify="right")
+    for row in ["runs", "wall_seconds", "mean_run_seconds", "p95_run_seconds", "runs_per_hour", "chat_calls", "chat_tokens",
+                "embedding_calls", "embedding_inputs", "searches", "fetches", "retries", "loop_stalls", "peak_rss_mb"]:
+        table.add_row(row.replace("_", " "), *(str(level.get(row)) for level in results["levels"]))
+    console.print(table)
+    console.print(f"[dim]Fake server counters: {results['server_counters']}[/dim]")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the research pipeline against local stand-ins for Azure OpenAI, SearXNG and the web.")
+    parser.add_argument("-n", "--runs", type=int, default=4, help="Research runs per concurrency level (default: 4).")
+    parser.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 4], help="Concurrency levels to measure (default: 1 4).")
+    parser.add_argument("--max-cycles", type=int, default=3, help="Agentic cycles per run (default: 3).")
+    parser.add_argument("--queries", type=Path, help="File with one question per line (default: built-in energy questions).")
+    parser.add_argument("--corpus-dir", type=Path, help="Serve the .html/.pdf files of this directory instead of the generated corpus.")
+    parser.add_argument("--pages", type=int, default=80, help="Size of the generated fixture corpus (default: 80).")
+    parser.add_argument("--chat-latency-ms", type=float, default=FakeServerConfig.chat_latency_ms)
+    parser.add_argument("--embedding-latency-ms", type=float, default=FakeServerConfig.embedding_latency_ms)
+    parser.add_argument("--page-latency-ms", type=float, default=FakeServerConfig.page_latency_ms)
+    parser.add_argument("--rate-limit-rps", type=float, default=0.0, help="Requests per second each fake API accepts before answering 429 (0 = unlimited).")
+    parser.add_argument("--stragglers", type=float, default=0.0, help="Share of chat and page requests the fake servers answer --straggler-ms late (default: 0).")
+    parser.add_argument("--straggler-ms", type=float, default=FakeServerConfig.straggler_ms)
+    parser.add_argument("--warm", action="store_true", help="Keep the in-process caches between concurrency levels.")
+    parser.add_argument("-o", "--out", type=Path, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", type=Path, help="Fail (exit code 1) if a figure is more than --tolerance worse than in this results file.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression against the baseline (default: 0.15).")
+    parser.add_argument("--save-baseline", type=Path, help="Also write the results to this file, for later --baseline comparisons.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show the pipelines' logs.")
+    args = parser.parse_args()
+
+    config = FakeServerConfig(chat_latency_ms=args.chat_latency_ms, embedding_latency_ms=args.embedding_latency_ms,
+                              page_latency_ms=args.page_latency_ms, rate_limit_rps=args.rate_limit_rps,
+                              straggler_fraction=args.stragglers, straggler_ms=args.straggler_ms)
+    corpus = load_corpus(args.corpus_dir) if args.corpus_dir else build_corpus(args.pages)
+    servers = FakeServers(corpus, config).start()
+    configure_settings(servers)
+    from agent_config import configure_logging
+    configure_logging()
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.CRITICAL + 10)
+
+    from agent_config import Settings
+    from agent_executor import shutdown_executors
+    from agent_helpers import CONTENT_CACHE, EMBED_CACHE, SEARCH_CACHE
+    questions = [q.strip() for q in args.queries.read_text(encoding="utf-8").splitlines() if q.strip()] if args.queries else BENCH_QUERIES
+    queries = [questions[i % len(questions)] for i in range(args.runs)]
+
+    results: Dict[str, Any] = {"created_at": time.time(), "python": sys.version.split()[0], "corpus_pages": len(corpus),
+                               "settings": {"max_cycles": args.max_cycles, "parse_executor": Settings.PARSE_EXECUTOR,
+                                            "fake_servers": vars(config)},
+                               "levels": []}
+    try:
+        for concurrency in args.concurrency:
+            if not args.warm:
+                for cache in (CONTENT_CACHE, EMBED_CACHE, SEARCH_CACHE): cache.clear()
+            console.print(f"[cyan]Running {len(queries)} research runs at concurrency {concurrency}...[/cyan]")
+            results["levels"].append(asyncio.run(run_level(queries, concurrency, args.max_cycles)))
+    finally:
+        shutdown_executors(wait=False)
+        results["server_counters"] = dict(servers.counters)
+        servers.stop()
+
+    print_results(results)
+    for path in (args.out, args.save_baseline):
+        if path: path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        if regressions:
+            console.print("[bold red]Regressions against the baseline:[/bold red]\n" + "\n".join(f"  {r}" for r in regressions))
+            sys.exit(1)
+        console.print(f"[green]No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).[/green]")
+
+
+if __name__ == "__main__":
+    main()
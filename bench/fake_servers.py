@@ -0,0 +1,315 @@
+# bench/fake_servers.py
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from aiohttp import web
+
+from agent_batching import ITEM_MARKER, parse_batch
+from bench.fixtures import TOPICS, FixturePage, build_corpus, search_corpus, topics_in
+
+
+_BATCH_PROMPT = re.compile(r"\n\nYou will receive (\d+) numbered items\.")
+
+
+@dataclass
+class FakeServerConfig:
+    """Latency, rate-limit and shape settings of the stand-in services."""
+    chat_latency_ms: float = 400.0        # time to first token
+    chat_ms_per_token: float = 2.0        # added per completion token
+    embedding_latency_ms: float = 60.0    # per request
+    embedding_ms_per_input: float = 1.0   # added per text in the batch
+    search_latency_ms: float = 150.0
+    page_latency_ms: float = 120.0
+    jitter: float = 0.25                  # latencies vary by up to +-jitter (deterministically per request)
+    rate_limit_rps: float = 0.0           # per API (chat, embeddings); over the limit requests get 429s. 0 = off
+    rate_limit_burst: int = 20
+    straggler_fraction: float = 0.0       # share of chat and page attempts that take straggler_ms longer (per attempt,
+    straggler_ms: float = 5000.0          # so a retry or hedged duplicate of a straggler is usually fast)
+    embedding_dim: int = 256
+    search_results: int = 10
+    planner_max_cycles: int = 0           # the fake planner concludes research after this many cycles; 0 = never
+    seed: int = 0
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate, self.capacity, self.tokens, self.updated = rate, float(burst), float(burst), time.monotonic()
+
+    def take(self) -> float:
+        """Takes a token; returns 0, or the seconds until one is available (request rejected)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+def _stable_random(*parts: Any) -> random.Random:
+    return random.Random(hashlib.sha1("\x00".join(map(str, parts)).encode()).digest())
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class FakeLLM:
+    """
+    Deterministic stand-in for the chat and embedding models.
+
+    Chat answers are recognized by the prompts of `agent_config.PROMPTS` and built to parse the
+    way the pipeline expects (JSON plans, outlines, reviews, cited sections). Embeddings are
+    hashed bags of words, so texts sharing vocabulary are similar, as with a real model.
+    """
+    def __init__(self, config: FakeServerConfig):
+        self.config = config
+
+    def embed(self, text: str) -> List[float]:
+        v = np.full(self.config.embedding_dim, 0.01)
+        for word in re.findall(r"\w+", text.lower()):
+            v[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.config.embedding_dim] += 1.0
+        return (v / np.linalg.norm(v)).round(6).tolist()
+
+    def chat(self, messages: List[Dict[str, Any]], max_tokens: int) -> str:
+        system = messages[0]["content"] if isinstance(messages[0]["content"], str) else ""
+        user = messages[-1]["content"] if isinstance(messages[-1]["content"], str) else ""
+        if (batch := _BATCH_PROMPT.search(system)) and ITEM_MARKER in user:
+            # Multi-item prompts (agent_batching) get each item answered as if it had been sent alone.
+            n = int(batch.group(1))
+            items = parse_batch(user, n)
+            single = [{"role": "system", "content": system[:batch.start()]}]
+            return "\n".join(f"{ITEM_MARKER} {i + 1}\n{self.chat(single + [{'role': 'user', 'content': items.get(i, '')}], max_tokens // n - 8)}"
+                             for i in range(n))
+        # Section prompts are seeded by their topic line only: their excerpts (and source numbers)
+        # depend on the order concurrent tasks finish in, and the benchmark's call counts should not.
+        seed_text = user.split("\n", 1)[0] if user.startswith("Topic:") else user
+        rng = _stable_random(self.config.seed, system, seed_text)
+        if not isinstance(messages[-1]["content"], str):  # multimodal PDF OCR
+            return ""
+        if "Return a JSON list" in system:
+            count = int(m.group(1)) if (m := re.search(r"Generate (\d+)", system)) else 3
+            return json.dumps([self._query(rng, user) for _ in range(count)])
+        if "structured JSON outline" in system:
+            return json.dumps({"outline": [{"topic": t, "subtopics": rng.sample(TOPICS[t], 3)} for t in topics_in(user, 4)]})
+        if "research strategist" in system:
+            return json.dumps(self._plan(rng, user))
+        if "adversarial reviewer" in system:
+            roll = rng.random()
+            if roll < 0.5: return json.dumps({"critique": "The section is adequately supported.", "action": "NONE"})
+            if roll < 0.75: return json.dumps({"critique": "The argument is vague in places.", "action": "REWRITE"})
+            return json.dumps({"critique": "A claim lacks evidence.", "action": "SEARCH", "query": self._query(rng, user)})
+        if "topic label" in system:
+            return topics_in(user, 1)[0]
+        if "report title" in system:
+            return f"{topics_in(user, 1)[0]}: A Review of the Evidence"
+        if "summarize an AI agent" in system:
+            return "The agent is searching for more evidence on the weakest topics."
+        if "research writer" in system:
+            sources = sorted(set(re.findall(r"\[Source (\d+)\]", user)), key=int) or ["1"]
+            return self._paragraphs(rng, user, min(max_tokens, 700), sources)
+        return self._paragraphs(rng, user, min(max_tokens, 250))
+
+    def _query(self, rng: random.Random, context: str) -> str:
+        topic = rng.choice(topics_in(context, 3))
+        return f"{topic.lower()} {' '.join(rng.sample(TOPICS[topic], 2))}"
+
+    def _plan(self, rng: random.Random, state_summary: str) -> Dict[str, Any]:
+        cycles = int(m.group(1)) if (m := re.search(r"Research Cycles Completed: (\d+)", state_summary)) else 0
+        if self.config.planner_max_cycles and cycles >= self.config.planner_max_cycles:
+            return {"critique": "Research deemed complete.", "thought": "All topics are covered.", "plan": []}
+        outline = re.findall(r'"topic": "([^"]+)"', state_summary) or topics_in(state_summary, 2)
+        targets = rng.sample(outline, min(2, len(outline)))
+        return {"critique": "Coverage of some topics is thin.", "thought": "Search for the least covered topics.",
+                "plan": [{"action": "SEARCH", "query": f"{t.lower()} {' '.join(rng.sample(TOPICS.get(t, ['evidence', 'review']), 2))}",
+                          "target_outline_topic": t} for t in targets]}
+
+    def _paragraphs(self, rng: random.Random, context: str, tokens: int, sources: Optional[List[str]] = None) -> str:
+        vocab = [w for t in topics_in(context, 2) for w in TOPICS[t]]
+        sentences, length = [], 0
+        while length < tokens * 4:
+            sentence = " ".join(rng.choice(vocab) for _ in range(rng.randint(10, 18))).capitalize()
+            if sources: sentence += f" [Source {rng.choice(sources)}]"
+            sentences.append(sentence + ".")
+            length += len(sentences[-1]) + 1
+        return " ".join(sentences)
+
+
+class FakeServers:
+    """
+    Runs the stand-ins on one local HTTP port, in a background thread with its own event loop
+    (so serving never competes with the benchmarked pipelines' event loop):
+
+        POST /openai/deployments/{deployment}/chat/completions   Azure OpenAI chat
+        POST /openai/deployments/{deployment}/embeddings         Azure OpenAI embeddings
+        GET  /search?q=...&format=json                          SearXNG JSON API
+        GET  /pages/{slug}.html | .pdf                           the fixture corpus
+
+    `counters` records requests, rate-limit rejections, stragglers, inputs and bytes served.
+    """
+    def __init__(self, corpus: Optional[List[FixturePage]] = None, config: Optional[FakeServerConfig] = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeServerConfig()
+        self.corpus = corpus if corpus is not None else build_corpus(seed=self.config.seed)
+        self.llm = FakeLLM(self.config)
+        self.host, self.port = host, port
+        self.counters: Dict[str, int] = {}
+        self._bodies: Dict[str, Tuple[bytes, str]] = {}
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._attempts = 0  # chat and page requests seen, to pick stragglers per attempt
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def searx_url(self) -> str:
+        """Value for `Settings.SEARX_URL`."""
+        return f"{self.base_url}/search?q="
+
+    def start(self) -> "FakeServers":
+        for page in self.corpus:
+            self._bodies[page.path] = (page.body(), "application/pdf" if page.kind == "pdf" else "text/html; charset=utf-8")
+        threading.Thread(target=self._serve, name="fake-servers", daemon=True).start()
+        self._ready.wait()
+        if self._error: raise self._error
+        return self
+
+    def stop(self):
+        if self._loop is None: return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def reset_counters(self):
+        self.counters = {}
+
+    def _count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def _serve(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._start_site())
+        except BaseException as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _start_site(self):
+        app = web.Application(client_max_size=64 * 2**20)
+        app.router.add_post("/openai/deployments/{deployment}/chat/completions", self._chat)
+        app.router.add_post("/openai/deployments/{deployment}/embeddings", self._embeddings)
+        app.router.add_get("/search", self._search)
+        app.router.add_get("/pages/{name}", self._page)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def _delay(self, ms: float, *key: Any, straggle: bool = False):
+        jitter = 1 + self.config.jitter * (2 * _stable_random(self.config.seed, *key).random() - 1)
+        if straggle and self.config.straggler_fraction > 0:
+            self._attempts += 1
+            if _stable_random(self.config.seed, "straggler", self._attempts).random() < self.config.straggler_fraction:
+                self._count("stragglers")
+                ms += self.config.straggler_ms / jitter
+        await asyncio.sleep(max(0.0, ms * jitter) / 1000)
+
+    def _rate_limited(self, api: str) -> Optional[web.Response]:
+        if self.config.rate_limit_rps <= 0: return None
+        bucket = self._buckets.setdefault(api, _TokenBucket(self.config.rate_limit_rps, self.config.rate_limit_burst))
+        wait = bucket.take()
+        if not wait: return None
+        self._count(f"{api}_rate_limited")
+        return web.json_response({"error": {"code": "429", "message": "Rate limit exceeded (fake server)."}}, status=429,
+                                 headers={"retry-after-ms": str(int(wait * 1000) + 1)})
+
+    async def _chat(self, request: web.Request) -> web.Response:
+        if (rejected := self._rate_limited("chat")) is not None: return rejected
+        body = await request.json()
+        self._count("chat_requests")
+        content = self.llm.chat(body["messages"], body.get("max_tokens") or 1024)
+        prompt_tokens = sum(_tokens(m["content"] if isinstance(m["content"], str) else json.dumps(m["content"])) for m in body["messages"])
+        completion_tokens = _tokens(content) if content else 0
+        await self._delay(self.config.chat_latency_ms + self.config.chat_ms_per_token * completion_tokens, "chat", content[:200], straggle=True)
+        return web.json_response({
+            "id": f"chatcmpl-{hashlib.sha1(content.encode()).hexdigest()[:12]}", "object": "chat.completion", "created": int(time.time()),
+            "model": request.match_info["deployment"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    async def _embeddings(self, request: web.Request) -> web.Response:
+        if (rejected := self._rate_limited("embeddings")) is not None: return rejected
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        self._count("embedding_requests")
+        self._count("embedding_inputs", len(inputs))
+        await self._delay(self.config.embedding_latency_ms + self.config.embedding_ms_per_input * len(inputs), "embed", inputs[0][:200])
+        tokens = sum(_tokens(text) for text in inputs)
+        return web.json_response({
+            "object": "list", "model": request.match_info["deployment"],
+            "data": [{"object": "embedding", "index": i, "embedding": self.llm.embed(text)} for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    async def _search(self, request: web.Request) -> web.Response:
+        query = request.query.get("q", "")
+        self._count("search_requests")
+        await self._delay(self.config.search_latency_ms, "search", query)
+        results = [{"title": page.title, "url": self.base_url + page.path, "content": page.text[:200]}
+                   for page in search_corpus(self.corpus, query, self.config.search_results)]
+        return web.json_response({"query": query, "number_of_results": len(results), "results": results})
+
+    async def _page(self, request: web.Request) -> web.Response:
+        found = self._bodies.get(request.path)
+        self._count("page_requests")
+        await self._delay(self.config.page_latency_ms, "page", request.path, straggle=True)
+        if found is None: return web.Response(status=404, text="Not found")
+        body, content_type = found
+        self._count("page_bytes", len(body))
+        return web.Response(body=body, headers={"Content-Type": content_type})
+
+
+def configure_settings(servers: FakeServers, embedding_deployment: str = "text-embedding-3-small"):
+    """Points `Settings` at the stand-ins and turns off the cross-run caches, which would skew repeated runs."""
+    from agent_config import Settings
+    Settings.AZURE_CHAT_ENDPOINT = Settings.AZURE_EMBEDDING_ENDPOINT = servers.base_url
+    Settings.AZURE_CHAT_API_KEY = Settings.AZURE_EMBEDDING_API_KEY = "fake-key"
+    Settings.AZURE_EMBEDDING_DEPLOYMENT = Settings.AZURE_EMBEDDING_DEPLOYMENT or embedding_deployment
+    Settings.SEARX_URL = servers.searx_url
+    Settings.REPORT_CACHE_DIR = Settings.CORPUS_DIR = ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-ins for Azure OpenAI, SearXNG and a fixture web corpus.")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--pages", type=int, default=80, help="Size of the generated fixture corpus.")
+    parser.add_argument("--chat-latency-ms", type=float, default=FakeServerConfig.chat_latency_ms)
+    parser.add_argument("--rate-limit-rps", type=float, default=0.0)
+    args = parser.parse_args()
+    config = FakeServerConfig(chat_latency_ms=args.chat_latency_ms, rate_limit_rps=args.rate_limit_rps)
+    servers = FakeServers(build_corpus(args.pages), config, port=args.port).start()
+    print(f"AZURE_CHAT_ENDPOINT={servers.base_url}\nAZURE_EMBEDDING_ENDPOINT={servers.base_url}\nAZURE_CHAT_API_KEY=fake-key\n"
+          f"AZURE_EMBEDDING_API_KEY=fake-key\nAZURE_EMBEDDING_DEPLOYMENT=text-embedding-3-small\nSEARX_URL={servers.searx_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servers.stop()
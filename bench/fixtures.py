@@ -0,0 +1,142 @@
+# bench/fixtures.py
+import random
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+# Each topic has its own vocabulary, so pages, queries and embeddings of one topic resemble each
+# other more than those of another -- enough structure for retrieval, clustering and coverage to
+# behave as they would on real pages.
+TOPICS: Dict[str, List[str]] = {
+    "Solar power": "solar photovoltaic panel silicon irradiance inverter rooftop module efficiency cell sunlight array thin-film perovskite tracking".split(),
+    "Wind power": "wind turbine blade offshore onshore rotor nacelle gearbox capacity-factor tower gust farm yaw curtailment".split(),
+    "Grid storage": "battery storage lithium grid frequency peak discharge cycle flow-battery pumped-hydro inertia dispatch ancillary capacity".split(),
+    "Nuclear energy": "nuclear reactor uranium fission waste enrichment safety coolant modular reprocessing decommissioning isotope containment".split(),
+    "Carbon pricing": "carbon price tax emissions trading allowance cap permit levy auction leakage offset border adjustment".split(),
+    "Energy policy": "policy subsidy regulation tariff mandate incentive legislation feed-in auction target standard ministry reform".split(),
+    "Hydropower": "hydro dam reservoir river turbine flow sediment run-of-river drought ecology fish penstock spillway".split(),
+    "Electricity markets": "market wholesale price demand supply bidding merit-order spot futures congestion retail consumer volatility".split(),
+}
+COMMON_WORDS = "the study shows that costs rise fall over time while experts argue and data suggest a significant trend in recent years across regions".split()
+
+# Questions the benchmark researches (cycled when more runs than questions are requested).
+BENCH_QUERIES = [
+    "What are the trade-offs between solar and wind power for national grids?",
+    "How does grid storage change the economics of renewable electricity?",
+    "Is nuclear energy compatible with a carbon pricing regime?",
+    "What policy instruments accelerated hydropower and wind deployment?",
+    "How do electricity markets price intermittent renewable supply?",
+    "What are the main risks of large battery storage projects?",
+    "How effective are carbon taxes compared with emissions trading?",
+    "Which energy policies lowered the cost of solar photovoltaics?",
+]
+
+
+@dataclass
+class FixturePage:
+    """A page of the fixture corpus, served by the static server and found by the fake SearXNG."""
+    slug: str
+    title: str
+    topic: str
+    text: str
+    kind: str = "html"  # 'html' or 'pdf'
+    words: Set[str] = field(default_factory=set, repr=False)
+    source: Optional[Path] = None  # file served as-is (corpora loaded from a directory)
+
+    @property
+    def path(self) -> str:
+        return f"/pages/{self.slug}.{self.kind}"
+
+    def body(self) -> bytes:
+        """The page as served: an HTML document with boilerplate to strip, or a PDF."""
+        if self.source is not None: return self.source.read_bytes()
+        if self.kind == "pdf": return _render_pdf(self.title, self.text)
+        paragraphs = "".join(f"<p>{p}</p>" for p in self.text.split("\n\n"))
+        return (f"<!DOCTYPE html><html><head><title>{self.title}</title><style>p {{ margin: 1em; }}</style>"
+                f"<script>var tracking = true;</script></head><body><nav><a href='/'>Home</a> | <a href='/about'>About</a></nav>"
+                f"<header><h1>{self.title}</h1></header><article>{paragraphs}</article>"
+                f"<footer>Copyright fixture corpus</footer></body></html>").encode("utf-8")
+
+
+def _words(text: str) -> Set[str]:
+    return set(re.findall(r"[a-z][a-z\-]+", text.lower()))
+
+
+def _sentence(rng: random.Random, vocab: List[str]) -> str:
+    words = [rng.choice(vocab if rng.random() < 0.6 else COMMON_WORDS) for _ in range(rng.randint(8, 16))]
+    return " ".join(words).capitalize() + "."
+
+
+def build_corpus(pages: int = 80, pdf_fraction: float = 0.15, paragraphs: int = 6, seed: int = 0) -> List[FixturePage]:
+    """Generates a deterministic corpus of `pages` pages spread over `TOPICS`, a share of them PDFs."""
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    corpus = []
+    for i in range(pages):
+        topic = topics[i % len(topics)]
+        # Most sentences come from the page's topic, some from a neighbouring one.
+        vocab = TOPICS[topic] + TOPICS[topics[(i + 1) % len(topics)]][:4]
+        title = f"{topic}: {' '.join(rng.sample(TOPICS[topic], 3))} ({i})"
+        text = "\n\n".join(" ".join(_sentence(rng, vocab) for _ in range(rng.randint(4, 8))) for _ in range(paragraphs))
+        kind = "pdf" if rng.random() < pdf_fraction else "html"
+        corpus.append(FixturePage(slug=f"page-{i:04d}", title=title, topic=topic, text=text, kind=kind, words=_words(title + " " + text)))
+    return corpus
+
+
+def load_corpus(directory: Path) -> List[FixturePage]:
+    """Loads a corpus of `.html`/`.htm` and `.pdf` files (e.g. saved real pages) from a directory."""
+    import fitz
+    from bs4 import BeautifulSoup
+    corpus = []
+    for path in sorted(Path(directory).iterdir()):
+        suffix = path.suffix.lower()
+        if suffix in (".html", ".htm"):
+            soup = BeautifulSoup(path.read_text(encoding="utf-8", errors="replace"), "html.parser")
+            title, text, kind = (soup.title.string if soup.title and soup.title.string else path.stem), soup.get_text(" ", strip=True), "html"
+        elif suffix == ".pdf":
+            with fitz.open(path) as doc:
+                text = "".join(page.get_text() for page in doc)
+            title, kind = path.stem, "pdf"
+        else:
+            continue
+        corpus.append(FixturePage(slug=path.stem, title=title, topic="", text=text, kind=kind,
+                                  words=_words(title + " " + text), source=path))
+    return corpus
+
+
+def _render_pdf(title: str, text: str) -> bytes:
+    import fitz
+    doc = fitz.open()
+    lines = [title, ""] + [line for paragraph in text.split("\n\n") for line in _wrap(paragraph, 95) + [""]]
+    for start in range(0, len(lines), 60):
+        page = doc.new_page()
+        page.insert_text((50, 60), "\n".join(lines[start:start + 60]), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _wrap(paragraph: str, width: int) -> List[str]:
+    lines, line = [], ""
+    for word in paragraph.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}".strip()
+    return lines + ([line] if line else [])
+
+
+def search_corpus(corpus: List[FixturePage], query: str, limit: int) -> List[FixturePage]:
+    """Pages ranked by how many query words they contain (ties broken by corpus order)."""
+    terms = _words(query)
+    scored = [(len(terms & page.words), -i, page) for i, page in enumerate(corpus)]
+    return [page for score, _, page in sorted(scored, key=lambda s: (s[0], s[1]), reverse=True) if score > 0][:limit]
+
+
+def topics_in(text: str, limit: Optional[int] = None) -> List[str]:
+    """Fixture topics ranked by how many of their words occur in `text`."""
+    words = _words(text)
+    ranked = sorted(TOPICS, key=lambda t: -len(words & set(TOPICS[t])))
+    return ranked[:limit] if limit else ranked
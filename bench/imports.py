@@ -0,0 +1,102 @@
+# bench/imports.py
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+ROOT = Path(__file__).resolve().parent.parent
+
+# Libraries that load on first use (see agent_helpers, research.analysis, research.ui).
+HEAVY = ("sklearn", "fitz", "pymupdf", "curl_cffi", "bs4", "openai", "aiohttp", "rich")
+
+# module -> (import-time budget in ms, modules that must not be loaded by importing it).
+# The MCP SDK itself imports httpx and rich, so only the agent's own heavy dependencies count there.
+BUDGETS: Dict[str, Tuple[float, Tuple[str, ...]]] = {
+    "agent_config": (60, HEAVY + ("dotenv", "numpy")),
+    "agent_helpers": (150, HEAVY),
+    "research": (400, HEAVY),
+    "research.jobs": (450, HEAVY),
+    "mcp_server": (1500, tuple(m for m in HEAVY if m != "rich")),
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def probe(module: str) -> Dict[str, Any]:
+    """Imports `module` in a fresh interpreter; returns the import time, the modules loaded and the slowest ones (by self time)."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    slowest = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line: continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        slowest.append((int(self_us), name.strip()))
+    result["process_seconds"] = wall
+    result["slowest"] = [(name, round(us / 1000, 1)) for us, name in sorted(slowest, reverse=True)[:8]]
+    return result
+
+
+def measure(module: str, repeat: int) -> Dict[str, Any]:
+    runs = [probe(module) for _ in range(repeat)]
+    return {"module": module, "import_ms": round(statistics.median(r["seconds"] for r in runs) * 1000, 1),
+            "process_ms": round(statistics.median(r["process_seconds"] for r in runs) * 1000, 1),
+            "loaded": set(runs[0]["modules"]), "slowest": runs[0]["slowest"]}
+
+
+def check(result: Dict[str, Any], scale: float) -> List[str]:
+    """Budget violations of a measurement: too slow, or a lazily imported library loaded eagerly."""
+    budget_ms, forbidden = BUDGETS.get(result["module"], (None, HEAVY))
+    problems = [f"{result['module']} loads {name} on import" for name in forbidden if name in result["loaded"]]
+    if budget_ms is not None and result["import_ms"] > budget_ms * scale:
+        problems.append(f"{result['module']} takes {result['import_ms']:.0f} ms to import (budget {budget_ms * scale:.0f} ms)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures how long the agent's modules take to import in a fresh interpreter and checks them against budgets.")
+    parser.add_argument("modules", nargs="*", default=list(BUDGETS), help=f"Modules to import (default: {' '.join(BUDGETS)}).")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Fresh interpreters per module; the median is reported (default: 5).")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the time budgets, for slower machines (default: 1).")
+    parser.add_argument("--no-check", action="store_true", help="Only report; never fail.")
+    parser.add_argument("-o", "--out", type=Path, help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = [measure(module, args.repeat) for module in args.modules]
+    table = Table(title="[bold green]⏱ Import time[/bold green] (median of fresh interpreters)")
+    for column in ("Module", "Import (ms)", "Process (ms)", "Budget (ms)", "Heavy libraries loaded"):
+        table.add_column(column, justify="right" if "ms)" in column else "left")
+    for r in results:
+        budget = BUDGETS.get(r["module"], (None,))[0]
+        table.add_row(r["module"], f"{r['import_ms']:.0f}", f"{r['process_ms']:.0f}", f"{budget * args.scale:.0f}" if budget else "—",
+                      ", ".join(m for m in HEAVY if m in r["loaded"]) or "none")
+    console.print(table)
+    for r in results:
+        console.print(f"[dim]{r['module']}: slowest imports (self ms): {', '.join(f'{name} {ms}' for name, ms in r['slowest'][:5])}[/dim]")
+
+    if args.out:
+        args.out.write_text(json.dumps([{k: v for k, v in r.items() if k != "loaded"} for r in results], indent=2), encoding="utf-8")
+    problems = [] if args.no_check else [p for r in results for p in check(r, args.scale)]
+    if problems:
+        console.print("[bold red]Import budget exceeded:[/bold red]\n" + "\n".join(f"  {p}" for p in problems))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
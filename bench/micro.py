@@ -0,0 +1,293 @@
+# bench/micro.py
+import argparse
+import gc
+import json
+import math
+import random
+import re
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from rich.console import Console
+from rich.table import Table
+
+from agent_config import Settings
+from agent_helpers import _html_to_text, cosine_similarity, extract_json_from_response, sentence_chunks
+from bench.fixtures import COMMON_WORDS, TOPICS
+from research.actions import score_candidates
+from research.analysis import _cluster_embeddings, _max_similarities
+from research.synthesis import _mmr_rank
+
+console = Console()
+
+ACT_CANDIDATES = 1000   # chunks scored per action step (a few searches' pages) against the knowledge base
+OUTLINE_TOPICS = 8      # topics of a typical outline (coverage) and sections (retrieval)
+# Python lists of 1536 floats take ~50 KB per row; implementations fed lists stop at this size.
+LIST_INPUT_MAX = 10_000
+
+
+@dataclass
+class Implementation:
+    fn: Callable[[Dict[str, Any]], Any]
+    max_n: Optional[int] = None  # larger sizes are skipped (too slow or too much memory)
+
+
+@dataclass
+class MicroBenchmark:
+    """A hot path timed over a range of sizes, with alternative implementations side by side."""
+    name: str
+    unit: str                                   # what the size counts
+    setup: Callable[[int, int], Dict[str, Any]]  # (size, dim) -> inputs, built outside the timing
+    implementations: Dict[str, Implementation] = field(default_factory=dict)
+
+
+# --------------------------------------------------------------------------- #
+# Synthetic inputs
+# --------------------------------------------------------------------------- #
+def embeddings(n: int, dim: int, seed: int = 0, clusters: int = OUTLINE_TOPICS) -> np.ndarray:
+    """Unit float32 rows scattered around `clusters` random directions, like chunks of a few topics."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    rows = centers[rng.integers(0, clusters, n)] + 1.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def _as_lists(matrix: np.ndarray, n: int) -> Optional[List[List[float]]]:
+    """The rows as Python lists (how the pipeline holds embeddings), or None above `LIST_INPUT_MAX`."""
+    return matrix.tolist() if n <= LIST_INPUT_MAX else None
+
+
+def _sentences(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    vocab = [w for words in TOPICS.values() for w in words] + COMMON_WORDS
+    return [" ".join(rng.choice(vocab) for _ in range(rng.randint(8, 20))).capitalize() + rng.choice(".!?") for _ in range(n)]
+
+
+def setup_scoring(n: int, dim: int) -> Dict[str, Any]:
+    kb, candidates, utility = embeddings(n, dim, 1), embeddings(ACT_CANDIDATES, dim, 2), embeddings(ACT_CANDIDATES, dim, 3)
+    return {"kb": kb, "candidates": candidates, "utility": utility, "kb_lists": _as_lists(kb, n),
+            "candidate_lists": candidates.tolist(), "utility_lists": utility.tolist()}
+
+
+def setup_coverage(n: int, dim: int) -> Dict[str, Any]:
+    kb, topics = embeddings(n, dim, 1), embeddings(OUTLINE_TOPICS, dim, 4)
+    return {"kb": kb, "topics": topics, "kb_lists": _as_lists(kb, n), "topic_lists": topics.tolist()}
+
+
+def setup_clustering(n: int, dim: int) -> Dict[str, Any]:
+    return {"kb": embeddings(n, dim, 1)}
+
+
+def setup_text(n: int, dim: int) -> Dict[str, Any]:
+    return {"text": " ".join(_sentences(n))}
+
+
+def setup_html(n: int, dim: int) -> Dict[str, Any]:
+    sentences = _sentences(n * 5)
+    paragraphs = "".join(f"<p>{' '.join(sentences[i:i + 5])}</p>" for i in range(0, len(sentences), 5))
+    page = (f"<html><head><title>Page</title><style>p {{ margin: 0 }}</style><script>var x = 1;</script></head>"
+            f"<body><nav><a href='/'>Home</a></nav><header><h1>Title</h1></header><article>{paragraphs}</article>"
+            f"<aside>Related</aside><footer>Footer</footer></body></html>")
+    return {"html": page}
+
+
+def setup_json(n: int, dim: int) -> Dict[str, Any]:
+    items = [{"action": "SEARCH", "query": sentence[:80], "target_outline_topic": f"Topic {i % OUTLINE_TOPICS}"}
+             for i, sentence in enumerate(_sentences(n))]
+    body = json.dumps({"critique": "Coverage is uneven.", "thought": "Search the thin topics.", "plan": items}, indent=2)
+    # Prose around the object and no markdown fence: the slowest path (parse attempt, then greedy regex).
+    return {"response": f"Here is the plan you asked for:\n{body}\nLet me know if anything should change."}
+
+
+# --------------------------------------------------------------------------- #
+# Alternative implementations
+# --------------------------------------------------------------------------- #
+def _pairwise_scores(d: Dict[str, Any]) -> List[float]:
+    """The per-pair loop the vectorized scoring replaced."""
+    alpha = Settings.NOVELTY_ALPHA
+    return [alpha * cosine_similarity(c, u) - (1 - alpha) * max(cosine_similarity(c, e) for e in d["kb"])
+            for c, u in zip(d["candidates"], d["utility"])]
+
+
+def _retrieve_full_sort(d: Dict[str, Any]) -> List[np.ndarray]:
+    """Top-k by a full argsort of every similarity row, without MMR."""
+    sims = d["topics"] @ d["kb"].T
+    return [np.argsort(-row)[:Settings.TOP_K_RESULTS_PER_SECTION] for row in sims]
+
+
+def _cluster_minibatch(d: Dict[str, Any]) -> np.ndarray:
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.decomposition import PCA
+    reduced = PCA(n_components=Settings.PCA_COMPONENTS, svd_solver="randomized", random_state=42).fit_transform(d["kb"])
+    return MiniBatchKMeans(n_clusters=Settings.N_CLUSTERS, random_state=42, n_init="auto").fit_predict(reduced)
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _sentence_chunks_compiled(d: Dict[str, Any]) -> List[str]:
+    """`sentence_chunks` with a precompiled pattern and one slice per chunk."""
+    n, sents = Settings.CHUNK_SENTENCES, _SENTENCE_END.split(d["text"])
+    return [" ".join(sents[i:i + n]) for i in range(0, len(sents), n)]
+
+
+def _html_regex(d: Dict[str, Any]) -> str:
+    """Tag stripping by regular expressions (no parse tree); a lower bound for the cleaning cost."""
+    html = re.sub(r"(?is)<(script|style|nav|header|footer|aside|form)\b.*?</\1>", " ", d["html"])
+    return re.sub(r"\s+", " ", re.sub(r"<[^>]+>", " ", html)).strip()
+
+
+def _json_raw_decode(d: Dict[str, Any]) -> Optional[str]:
+    """Decodes from the first brace with `json.JSONDecoder.raw_decode` instead of regex extraction."""
+    response = d["response"]
+    start = response.find("{")
+    if start < 0: return None
+    try:
+        _, end = json.JSONDecoder().raw_decode(response, start)
+    except json.JSONDecodeError:
+        return None
+    return response[start:end]
+
+
+def _optional_lxml() -> Dict[str, Implementation]:
+    """An lxml-parser variant of the HTML cleaning, when lxml is installed."""
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return {}
+    from bs4 import BeautifulSoup
+
+    def clean(d: Dict[str, Any]) -> str:
+        soup = BeautifulSoup(d["html"], "lxml")
+        for bad in soup(["script", "style", "nav", "header", "footer", "aside", "form"]): bad.decompose()
+        return re.sub(r"\s+", " ", soup.get_text(" ", strip=True))
+    return {"bs4 + lxml": Implementation(clean, max_n=10_000)}
+
+
+def benchmarks() -> List[MicroBenchmark]:
+    alpha, top_k = Settings.NOVELTY_ALPHA, Settings.TOP_K_RESULTS_PER_SECTION
+    return [
+        MicroBenchmark("act_scoring", "knowledge-base chunks", setup_scoring, {
+            "score_candidates (lists)": Implementation(lambda d: score_candidates(d["candidate_lists"], d["utility_lists"], d["kb_lists"], alpha), LIST_INPUT_MAX),
+            "score_candidates (arrays)": Implementation(lambda d: score_candidates(d["candidates"], d["utility"], d["kb"], alpha)),
+            "per-pair loop": Implementation(_pairwise_scores, max_n=1_000),
+        }),
+        MicroBenchmark("topic_coverage", "knowledge-base chunks", setup_coverage, {
+            "_max_similarities (lists)": Implementation(lambda d: _max_similarities(d["topic_lists"], d["kb_lists"]), LIST_INPUT_MAX),
+            "_max_similarities (arrays)": Implementation(lambda d: _max_similarities(d["topics"], d["kb"])),
+        }),
+        MicroBenchmark("latent_topics", "knowledge-base chunks", setup_clustering, {
+            "PCA + KMeans (float64)": Implementation(lambda d: _cluster_embeddings(d["kb"].astype(np.float64), Settings.PCA_COMPONENTS, Settings.N_CLUSTERS), max_n=30_000),
+            "PCA + KMeans (float32)": Implementation(lambda d: _cluster_embeddings(d["kb"], Settings.PCA_COMPONENTS, Settings.N_CLUSTERS)),
+            "randomized PCA + MiniBatchKMeans": Implementation(_cluster_minibatch),
+        }),
+        MicroBenchmark("synthesis_retrieval", "knowledge-base chunks", setup_coverage, {
+            "_mmr_rank (lists)": Implementation(lambda d: _mmr_rank(d["topic_lists"], d["kb_lists"], top_k, Settings.MMR_CANDIDATE_POOL, Settings.MMR_LAMBDA), LIST_INPUT_MAX),
+            "_mmr_rank (arrays)": Implementation(lambda d: _mmr_rank(d["topics"], d["kb"], top_k, Settings.MMR_CANDIDATE_POOL, Settings.MMR_LAMBDA)),
+            "full argsort, no MMR": Implementation(_retrieve_full_sort),
+        }),
+        MicroBenchmark("sentence_chunks", "sentences", setup_text, {
+            "sentence_chunks": Implementation(lambda d: sentence_chunks(d["text"])),
+            "precompiled pattern": Implementation(_sentence_chunks_compiled),
+        }),
+        MicroBenchmark("html_cleaning", "paragraphs", setup_html, {
+            "_html_to_text (html.parser)": Implementation(lambda d: _html_to_text(d["html"]), max_n=10_000),
+            **_optional_lxml(),
+            "regex strip": Implementation(_html_regex),
+        }),
+        MicroBenchmark("extract_json", "plan items", setup_json, {
+            "extract_json_from_response": Implementation(lambda d: extract_json_from_response(d["response"])),
+            "raw_decode": Implementation(_json_raw_decode),
+        }),
+    ]
+
+
+# --------------------------------------------------------------------------- #
+# Measurement
+# --------------------------------------------------------------------------- #
+def measure(impl: Implementation, data: Dict[str, Any], repeat: int, max_seconds: float) -> Dict[str, float]:
+    """Best-of-`repeat` wall time and peak traced memory (a separate first run, under tracemalloc)."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    impl.fn(data)
+    first = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times = [first]  # tracemalloc slows Python-heavy code; its run only counts when nothing else is measured
+    for i in range(repeat):
+        if first * (i + 1) > max_seconds and i: break
+        gc.collect()
+        start = time.perf_counter()
+        impl.fn(data)
+        times.append(time.perf_counter() - start)
+    return {"ms": round(min(times[1:] or times) * 1000, 3), "peak_mb": round(peak / 2**20, 2)}
+
+
+def scaling_exponent(points: List[Tuple[int, float]]) -> Optional[float]:
+    """Slope of log(time) over log(size) between the smallest and largest measured size (1.0 = linear)."""
+    points = [(n, t) for n, t in points if t > 0]
+    if len(points) < 2: return None
+    (n0, t0), (n1, t1) = points[0], points[-1]
+    return round(math.log(t1 / t0) / math.log(n1 / n0), 2)
+
+
+def run(selected: List[MicroBenchmark], sizes: List[int], dim: int, repeat: int, max_seconds: float) -> Dict[str, Any]:
+    results = {}
+    for bench in selected:
+        console.print(f"[cyan]{bench.name}[/cyan] ({bench.unit}: {', '.join(map(str, sizes))})")
+        rows: Dict[str, Dict[str, Any]] = {name: {} for name in bench.implementations}
+        for n in sizes:
+            data = bench.setup(n, dim)
+            for name, impl in bench.implementations.items():
+                if impl.max_n and n > impl.max_n: continue
+                rows[name][n] = measure(impl, data, repeat, max_seconds)
+            del data
+            gc.collect()
+        for name, by_size in rows.items():
+            by_size["scaling"] = scaling_exponent([(n, m["ms"]) for n, m in by_size.items() if isinstance(n, int)])
+        results[bench.name] = {"unit": bench.unit, "implementations": rows}
+    return results
+
+
+def print_results(results: Dict[str, Any], sizes: List[int]):
+    for name, result in results.items():
+        table = Table(title=f"[bold green]{name}[/bold green] [dim](size = {result['unit']}; ms / peak MB)[/dim]")
+        table.add_column("Implementation", style="cyan")
+        for n in sizes: table.add_column(f"{n:,}", justify="right")
+        table.add_column("Scaling", justify="right")
+        for impl, by_size in result["implementations"].items():
+            cells = [f"{by_size[n]['ms']:.2f} / {by_size[n]['peak_mb']:.1f}" if n in by_size else "—" for n in sizes]
+            exponent = by_size.get("scaling")
+            table.add_row(impl, *cells, f"n^{exponent}" if exponent is not None else "—")
+        console.print(table)
+
+
+def main():
+    available = {b.name: b for b in benchmarks()}
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the numeric and text hot paths, with alternative implementations side by side.")
+    parser.add_argument("names", nargs="*", metavar="BENCHMARK", help=f"Benchmarks to run (default: all): {', '.join(available)}.")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000], help="Sizes to measure (default: 1000 10000 100000).")
+    parser.add_argument("--dim", type=int, default=1536, help="Embedding dimensions (default: 1536).")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Timed repetitions per measurement; the best is reported (default: 3).")
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="Stop repeating a measurement after about this long (default: 10).")
+    parser.add_argument("-o", "--out", type=Path, help="Write the results to this JSON file.")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in available]
+    if unknown: parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    sizes = sorted(args.sizes)
+    selected = [available[name] for name in args.names] if args.names else list(available.values())
+    results = {"created_at": time.time(), "dim": args.dim, "sizes": sizes,
+               "benchmarks": run(selected, sizes, args.dim, args.repeat, args.max_seconds)}
+    print_results(results["benchmarks"], sizes)
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2, default=str), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
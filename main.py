@@ -1,38 +1,71 @@
 # main.py
 import argparse
 import asyncio
+import json
 import logging
-import re
 from pathlib import Path
 
 from rich.console import Console
 
-from agent_config import SCRIPT_VERSION, Settings, log
-from agent_helpers import hash_txt
+from agent_cassette import use_cassette
+from agent_search import LocalIndexBackend, use_search_backend
+from agent_config import SCRIPT_VERSION, RunConfig, Settings, configure_logging, log
+from agent_executor import shutdown_executors
+from agent_helpers import close_http_session, hash_txt
 # WHAT: The ResearchPipeline is now imported directly from the package.
 # WHY: This simplifies the import statement and aligns with the new package structure.
+from research.persistence import load_state, report_filename, save_state
+from research.corpus import default_corpus
 from research.pipeline import ResearchPipeline
+from research.report_cache import default_report_cache
 
 
 async def main_cli():
     """The main command-line interface function."""
     parser = argparse.ArgumentParser(description=f"Deep-Research Agent v{SCRIPT_VERSION}", formatter_class=argparse.RawTextHelpFormatter)
-    parser.add_argument("question", nargs="+", help="Your research prompt")
+    parser.add_argument("question", nargs="*", help="Your research prompt (optional with --resume)")
     parser.add_argument("-s", "--output-style", choices=["detailed", "summary", "progress"], default="summary", help="""Choose the output style:
   - detailed: Show all verbose logs.
   - summary: Show high-level agent summaries per cycle (default).
   - progress: Show a minimal progress bar.""")
+    parser.add_argument("--max-cycles", type=int, default=Settings.MAX_CYCLES, help=f"Maximum number of agentic research cycles (default: {Settings.MAX_CYCLES}).")
+    parser.add_argument("--deadline", type=float, default=Settings.RUN_DEADLINE_SECONDS, metavar="SECONDS", help="Stop researching in time to finish the report within about SECONDS (0 = no limit).")
+    parser.add_argument("--max-chat-tokens", type=int, default=Settings.RUN_MAX_CHAT_TOKENS, help="Chat token budget of the run (0 = no limit).")
+    parser.add_argument("--max-fetches", type=int, default=Settings.RUN_MAX_FETCHES, help="Maximum number of pages fetched by the run (0 = no limit).")
+    parser.add_argument("--save-state", metavar="DIR", help="Save the final research state to DIR so the report can be regenerated incrementally later.")
+    parser.add_argument("--from-state", metavar="DIR", help="Continue from a research state saved with --save-state; unchanged sections are reused.")
+    parser.add_argument("--previous-report", metavar="FILE", help="The report produced from --from-state; its unchanged sections are reused verbatim.")
+    parser.add_argument("--checkpoint", metavar="DIR", help="Checkpoint the run to DIR after every agentic cycle and synthesized section.")
+    parser.add_argument("--resume", metavar="CHECKPOINT", help="Resume an interrupted run from its checkpoint directory (and keep checkpointing there).")
+    parser.add_argument("--refresh", action="store_true", help="Re-research the question even if the report cache (REPORT_CACHE_DIR) holds a recent answer.")
+    parser.add_argument("--no-cache", action="store_true", help="Neither read from nor write to the report cache.")
+    parser.add_argument("--metrics", metavar="FILE", help="Write the run's API calls, tokens, fetches and cache hit ratios (by phase and call site) to FILE as JSON.")
+    parser.add_argument("--trace", metavar="FILE", help="Record timing spans of the run, write them to FILE as a Chrome trace (chrome://tracing, ui.perfetto.dev) and print a summary.")
+    parser.add_argument("--local-docs", metavar="DIR", help="Search the HTML, text and PDF documents in DIR (indexed incrementally) instead of the web.")
+    parser.add_argument("--cassette", metavar="DIR", help="Record the run's searches, page fetches and API calls to the cassette in DIR, or replay them from it (see --cassette-mode).")
+    parser.add_argument("--cassette-mode", choices=["record", "replay", "record_missing"], default=Settings.CASSETTE_MODE, help=f"record: always use the network; replay: never (unrecorded requests fail); record_missing: replay what is recorded, record the rest (default: {Settings.CASSETTE_MODE}).")
     args = parser.parse_args()
+    if not args.question and not args.resume:
+        parser.error("a research question is required unless --resume is given")
+    if args.resume and args.from_state:
+        parser.error("--resume and --from-state cannot be combined")
     
-    Settings.OUTPUT_STYLE = args.output_style
-    if Settings.OUTPUT_STYLE == "detailed":
+    if args.cassette:
+        use_cassette(args.cassette, args.cassette_mode)
+    if args.local_docs:
+        use_search_backend(LocalIndexBackend(args.local_docs))
+
+    config = RunConfig(output_style=args.output_style, max_cycles=args.max_cycles, deadline_seconds=args.deadline,
+                       max_chat_tokens=args.max_chat_tokens, max_fetches=args.max_fetches, trace=bool(args.trace) or Settings.TRACE_ENABLED)
+    if config.output_style == "detailed":
         logging.getLogger().setLevel(Settings.LOG_LEVEL) 
         log.setLevel(Settings.LOG_LEVEL) 
     else: 
         logging.getLogger().setLevel(logging.CRITICAL + 10) 
         log.setLevel(logging.INFO) 
 
-    question_str = " ".join(args.question)
+    previous_state = load_state(args.resume or args.from_state) if (args.resume or args.from_state) else None
+    question_str = " ".join(args.question) if args.question else previous_state.query
     
     # Basic cleaning for common CLI argument parsing issues
     cleaned_question = question_str
@@ -45,12 +78,30 @@ async def main_cli():
             log.warning(f"Detected 'output-style {parts[-1]}' at the end of the query. Cleaning it.")
             cleaned_question = " output-style ".join(parts[:-1]).strip()
 
-    engine = ResearchPipeline(cleaned_question)
-    report = await engine.run()
-    
-    report_filename_base = re.sub(r'[^\w\s-]', '', cleaned_question.lower())
-    report_filename_base = re.sub(r'[-\s]+', '_', report_filename_base)[:50] 
-    report_path = Path(f"report_{report_filename_base}_{hash_txt(cleaned_question)[:8]}.md")
+    previous_report = Path(args.previous_report).read_text(encoding="utf-8") if args.previous_report else None
+    checkpoint_dir = args.resume or args.checkpoint
+    engine = ResearchPipeline(cleaned_question, previous_state=previous_state, previous_report=previous_report, checkpoint_dir=checkpoint_dir, config=config,
+                              report_cache=None if args.no_cache else default_report_cache(), refresh=args.refresh, corpus=default_corpus())
+    try:
+        report = await engine.run()
+    except asyncio.CancelledError:
+        if checkpoint_dir:
+            print(f"\n[INFO] Progress is checkpointed. Continue with: python main.py --resume {checkpoint_dir}")
+        raise
+    finally:
+        await close_http_session()
+        shutdown_executors(wait=False)
+        if args.trace and engine.tracer is not None:
+            trace_path = engine.tracer.export_chrome_trace(args.trace).resolve()
+            log.info(f"Trace written to {trace_path}")
+            engine.ui.console.print(f"\n[cyan]Trace written to:[/] {trace_path}")
+            engine.tracer.print_summary(engine.ui.console)
+    if args.save_state:
+        save_state(engine.state, args.save_state)
+    if args.metrics:
+        Path(args.metrics).write_text(json.dumps(engine.metrics.summary(), indent=2), encoding="utf-8")
+
+    report_path = Path(report_filename(cleaned_question))
     
     try:
         report_path.write_text(report, encoding="utf-8")
@@ -66,7 +117,7 @@ async def main_cli():
             print(f"[ERROR] Failed to write report to fallback path {report_path}: {e_fb}")
             log.error(f"Failed to write report to fallback path {report_path}: {e_fb}")
 
-    if Settings.OUTPUT_STYLE == 'detailed':
+    if config.output_style == 'detailed':
         log.info("--- FINAL REPORT ---") 
         print("\n" + ("="*80) + "\nFINAL REPORT\n" + ("="*80) + "\n")
         print(report)
@@ -75,16 +126,6 @@ async def main_cli():
     else:
         engine.ui.end(report_path)
 
-async def run_deep_research(query: str, output_style: str = "summary") -> str:
-    """
-    Public API function to run the deep research process.
-    Returns a Markdown report as a string.
-    """
-    Settings.OUTPUT_STYLE = output_style
-    engine = ResearchPipeline(query)
-    report = await engine.run()
-    return report
-
 # WHAT: The local definition of run_deep_research is removed.
 # WHY: This function has been moved into the `research` package to serve as the official
 # public API, making it accessible to other parts of your application, like mcp_server.py.
@@ -92,6 +133,7 @@ async def run_deep_research(query: str, output_style: str = "summary") -> str:
 
 
 if __name__ == "__main__":
+    configure_logging()
     try:
         asyncio.run(main_cli())
     except KeyboardInterrupt:
@@ -1,24 +1,188 @@
 # mcp_server.py
-from mcp.server.fastmcp import FastMCP
-from pydantic import BaseModel, Field
+import argparse
 import asyncio
+import contextlib
+import dataclasses
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from mcp.server.fastmcp import Context, FastMCP
+from pydantic import BaseModel, Field
 
-from research import run_deep_research
+from agent_config import configure_logging
+from agent_executor import ensure_loop_monitor
+from agent_metrics import PROCESS_METRICS
+from research.jobs import JobManager, ResearchJob
 
-mcp = FastMCP("DeepResearchMCP")
+@contextlib.asynccontextmanager
+async def _lifespan(server: FastMCP):
+    # Watch the server's event loop from start-up, so stalls before the first research run are counted too.
+    ensure_loop_monitor()
+    yield
+
+mcp = FastMCP("DeepResearchMCP", lifespan=_lifespan)
+# One bounded, per-client-fair worker pool shared by every tool call (see `research.jobs`).
+jobs = JobManager()
 
 class Report(BaseModel):
     report_markdown: str = Field(description="Full research report in Markdown")
+    metrics: Optional[Dict[str, Any]] = Field(None, description="API calls, tokens, fetches, latencies and cache hit ratios of the run, by phase and call site")
+
+class JobInfo(BaseModel):
+    job_id: str = Field(description="Id to pass to research_status / research_result / cancel_research")
+    status: str = Field(description="'queued' | 'running' | 'done' | 'failed' | 'cancelled'")
+    query: str
+    queue_position: Optional[int] = Field(None, description="Position among this client's queued jobs (queued jobs only)")
+    elapsed_seconds: Optional[float] = Field(None, description="Time spent running so far (or in total, once finished)")
+    progress: Dict[str, Any] = Field(default_factory=dict, description="Phase, cycle, sources, chunks and sections written")
+    error: Optional[str] = None
+
+class JobEvents(BaseModel):
+    job_id: str
+    status: str
+    events: List[Dict[str, Any]] = Field(description="Progress events after the cursor; 'section' events carry finished sections")
+    next_cursor: int = Field(description="Pass as `after` on the next call")
+
+def _client_id(ctx: Context, client: Optional[str]) -> str:
+    """Identity used for fair scheduling: an explicit caller id (e.g. the end user behind mcpo), else the MCP client/session."""
+    if client: return client
+    try:
+        return ctx.client_id or f"session-{id(ctx.session):x}"
+    except ValueError:  # no active request context
+        return "anonymous"
+
+def _job_info(job: ResearchJob) -> JobInfo:
+    elapsed = None
+    if job.started_at:
+        elapsed = round((job.finished_at or time.time()) - job.started_at, 1)
+    return JobInfo(job_id=job.id, status=job.status, query=job.query, queue_position=jobs.queue_position(job),
+                   elapsed_seconds=elapsed, progress=job.progress(), error=job.error)
+
+def _job_config(deadline_seconds: Optional[float]):
+    """The server's run config, with the caller's deadline if one was given."""
+    return dataclasses.replace(jobs.config, deadline_seconds=deadline_seconds) if deadline_seconds else None
+
+def _get_job(job_id: str) -> ResearchJob:
+    try:
+        return jobs.get(job_id)
+    except KeyError as e:
+        raise ValueError(str(e)) from None
 
 @mcp.tool()
-async def deep_research(query: str, output_style: str = "summary") -> Report:
+async def deep_research(query: str, ctx: Context, output_style: str = "summary", refresh: bool = False,
+                        deadline_seconds: Optional[float] = None) -> Report:
     """
     Multi-hop web research. Returns Markdown.
-    output_style: 'summary' | 'detailed' | 'progress'
+    Waits for the whole run; prefer submit_research + research_status for long questions.
+    output_style is accepted for compatibility; the server never renders console output.
+    refresh: re-research the question even if a recent report for it (or a paraphrase) is cached.
+    deadline_seconds: run time after which research stops and the report is written from what was found.
+    """
+    job = jobs.submit(query, _client_id(ctx, None), config=_job_config(deadline_seconds), refresh=refresh)
+    try:
+        job = await jobs.wait(job.id)
+    except asyncio.CancelledError:
+        # The caller is gone (disconnect or timeout); the run would only spend budget on a report nobody reads.
+        jobs.cancel(job.id)
+        raise
+    if job.status != "done":
+        raise RuntimeError(f"Research job {job.id} {job.status}: {job.error or 'no report produced'}")
+    return Report(report_markdown=job.report, metrics=job.metrics)
+
+@mcp.tool()
+async def submit_research(query: str, ctx: Context, client: Optional[str] = None, refresh: bool = False,
+                          deadline_seconds: Optional[float] = None) -> JobInfo:
+    """
+    Queues a deep-research job and returns immediately with its job id.
+    client: optional caller identity (e.g. the end user's id) used for fair scheduling.
+    refresh: re-research the question even if a recent report for it (or a paraphrase) is cached.
+    deadline_seconds: run time (excluding time queued) after which research stops and the report is written.
+    """
+    return _job_info(jobs.submit(query, _client_id(ctx, client), config=_job_config(deadline_seconds), refresh=refresh))
+
+@mcp.tool()
+async def research_status(job_id: str) -> JobInfo:
+    """Returns the status and live progress of a research job."""
+    return _job_info(_get_job(job_id))
+
+@mcp.tool()
+async def stream_research(query: str, ctx: Context, narrate: bool = False, deadline_seconds: Optional[float] = None) -> Report:
+    """
+    Multi-hop web research that streams progress while it runs.
+    Each event (plan, searches, sources, gain, every finished section, ...) is sent as a
+    progress notification whose message is the event as JSON; the final report is returned.
+    narrate: also stream short human-readable plan summaries (one extra LLM call per cycle).
+    deadline_seconds: run time after which research stops and the report is written from what was found.
+    """
+    # Runs as a queued job, so streaming callers get the same admission control as everyone else.
+    job = jobs.submit(query, _client_id(ctx, None), config=_job_config(deadline_seconds), narrate=narrate)
+    cursor = 0
+    try:
+        while True:
+            finished = job.finished
+            for event in job.events[cursor:]:
+                cursor += 1
+                if event["type"] != "report":
+                    await ctx.report_progress(cursor, message=json.dumps(event, ensure_ascii=False))
+            if finished: break
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+    except asyncio.CancelledError:
+        jobs.cancel(job.id)
+        raise
+    if job.status != "done":
+        raise RuntimeError(f"Research job {job.id} {job.status}: {job.error or 'no report produced'}")
+    return Report(report_markdown=job.report, metrics=job.metrics)
+
+@mcp.tool()
+async def research_events(job_id: str, after: int = 0) -> JobEvents:
+    """
+    Returns a research job's progress events after the cursor `after`, including every section
+    as soon as it is written, so a partial report can be shown before the job finishes.
+    """
+    job = _get_job(job_id)
+    events = job.events[after:]
+    return JobEvents(job_id=job.id, status=job.status, events=events, next_cursor=after + len(events))
+
+@mcp.tool()
+async def research_result(job_id: str) -> Report:
+    """Returns the Markdown report of a finished research job."""
+    job = _get_job(job_id)
+    if job.status != "done":
+        raise ValueError(f"Job {job_id} is {job.status}" + (f": {job.error}" if job.error else "; poll research_status until it is 'done'."))
+    return Report(report_markdown=job.report, metrics=job.metrics)
+
+@mcp.tool()
+async def cancel_research(job_id: str) -> JobInfo:
+    """Cancels a queued or running research job."""
+    return _job_info(jobs.cancel(job_id))
+
+@mcp.tool()
+async def research_queue_stats() -> Dict[str, Any]:
+    """Worker pool usage, job counts by status and the server's resident memory."""
+    return jobs.stats()
+
+@mcp.tool()
+async def research_metrics(job_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    API calls, tokens, retries, fetches, latencies and cache hit ratios, by pipeline phase and call site.
+    job_id: metrics of one job (live while it runs); without it, totals of every run since the server started.
     """
-    md = await run_deep_research(query, output_style)
-    return Report(report_markdown=md)
+    if job_id is None: return PROCESS_METRICS.summary()
+    job = _get_job(job_id)
+    return job.pipeline.metrics.summary() if job.pipeline is not None else (job.metrics or {})
+
+@mcp.tool()
+async def research_metrics_prometheus() -> str:
+    """The server's metrics since start-up in the Prometheus text exposition format, for scraping or capacity planning."""
+    return PROCESS_METRICS.to_prometheus()
 
 if __name__ == "__main__":
-    # stdio is what mcpo wraps by default
-    mcp.run()
\ No newline at end of file
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Deep-Research MCP server")
+    # stdio is what mcpo wraps by default; streamable-http delivers progress notifications over HTTP.
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"], default="stdio")
+    mcp.run(transport=parser.parse_args().transport)
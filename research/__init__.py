@@ -5,4 +5,4 @@
 # It allows external modules (like a server ) to import it cleanly
 # with `from research import run_deep_research`, rather than needing to know the
 # internal file structure (`from research.pipeline import run_deep_research`).
-from .pipeline import run_deep_research
\ No newline at end of file
+from .pipeline import run_deep_research, stream_deep_research
\ No newline at end of file
@@ -1,13 +1,29 @@
 # research/actions.py
 import asyncio
 import logging
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 
-from agent_config import Settings
-from agent_helpers import (cosine_similarity, fetch_clean, hash_txt,
+from agent_budget import budget_pressure, reserve_fetches
+from agent_config import RunConfig
+from agent_executor import run_cpu
+from agent_helpers import (cosine_matrix, fetch_clean, normalize_rows,
                            searx_search, sentence_chunks)
+from agent_tracing import traced
+from research.corpus import CorpusStore
+
+def score_candidates(chunk_embs: List[List[float]], utility_embs: List[List[float]], existing_embs: List[List[float]],
+                     novelty_alpha: float) -> np.ndarray:
+    """
+    Scores candidate chunks as `alpha * utility - (1 - alpha) * redundancy`, where utility is the
+    cosine similarity to the chunk's own utility embedding and redundancy the highest similarity
+    to any chunk already in the knowledge base. CPU-bound; runs in the compute executor.
+    """
+    chunks = normalize_rows(chunk_embs)
+    utility = np.einsum("ij,ij->i", chunks, normalize_rows(utility_embs))
+    redundancy = cosine_matrix(chunks, existing_embs).max(axis=1) if len(existing_embs) else np.zeros(len(chunks), dtype=np.float32)
+    return novelty_alpha * utility - (1 - novelty_alpha) * redundancy
 
 # Forward declarations for type hinting
 class ResearchState:
@@ -23,12 +39,20 @@ class ActionComponent:
     This component is responsible for performing web searches, fetching and cleaning
     web page content, scoring the relevance of new information chunks using HyDE,
     and adding the most valuable chunks to the research state's knowledge base.
+
+    With a `corpus`, pages processed by earlier runs are recalled before searching the
+    web, search results already in it are not fetched again, and newly fetched pages are
+    added to it.
     """
-    def __init__(self, state: 'ResearchState', analysis: 'AnalysisComponent', logger: logging.Logger):
+    def __init__(self, state: 'ResearchState', analysis: 'AnalysisComponent', logger: logging.Logger, config: RunConfig,
+                 corpus: Optional[CorpusStore] = None):
         self.state = state
         self.analysis = analysis
         self.logger = logger
+        self.config = config
+        self.corpus = corpus
 
+    @traced("actions")
     async def act(self, search_actions: List[Dict[str, Any]]) -> Tuple[Dict[str, List[str]], int]:
         """
         Executes a list of search actions, fetches content, scores it, and updates the state.
@@ -47,17 +71,16 @@ class ActionComponent:
         
         query_to_sources_map = {action['query']: [] for action in search_actions}
         
-        target_topics = list(set(action['target_outline_topic'] for action in search_actions if action.get('target_outline_topic')))
+        target_topics = list(dict.fromkeys(action['target_outline_topic'] for action in search_actions if action.get('target_outline_topic')))
         
-        hyde_generation_tasks = [self.analysis._generate_hypothetical_document(topic) for topic in target_topics]
-        hypothetical_docs = await asyncio.gather(*hyde_generation_tasks)
+        hypothetical_docs = await self.analysis.generate_hypothetical_documents(target_topics)
         
         hyde_embeddings_list = await self.analysis._embed_texts_with_cache(hypothetical_docs)
         
         hyde_embedding_map = {topic: emb for topic, emb in zip(target_topics, hyde_embeddings_list) if emb}
         self.logger.info(f"Generated and embedded {len(hyde_embedding_map)} hypothetical documents for relevance scoring.")
 
-        scored_chunks = []
+        targets = []
         for action in search_actions:
             query = action.get('query')
             if not query: continue
@@ -73,62 +96,134 @@ class ActionComponent:
             if not utility_embedding:
                 self.logger.warning(f"No utility embedding available for query '{query}' (target: '{target_topic}'). Skipping scoring for this action's results.")
                 continue
+            targets.append((query, target_topic, utility_embedding))
+
+        # (chunk_text, source_idx, embedding, utility_embedding) candidates for the knowledge base.
+        candidates = await self._recall_from_corpus(targets, query_to_sources_map) if self.corpus else []
+        pages_to_store = []
 
+        for query, target_topic, utility_embedding in targets:
             self.logger.info(f"Executing search for query: '{query}' (Target: '{target_topic or 'Overall Query'}')")
-            hits = await searx_search(query)
+            hits = await searx_search(query, limit=self.config.search_results)
             
-            urls_to_fetch = { hit['url'] for hit in hits if hit.get('url') and hit['url'] not in self.state.url_to_source_index }
+            # In result order (not a set), so source numbering and prompts do not depend on string hashing.
+            urls_to_fetch = list(dict.fromkeys(hit['url'] for hit in hits if hit.get('url') and hit['url'] not in self.state.url_to_source_index))
             if not urls_to_fetch:
                 self.logger.info(f"All search results for query '{query}' have already been processed. Skipping.")
                 continue
+
+            # Pages an earlier run processed recently are taken from the corpus, already chunked and embedded.
+            if self.corpus:
+                stored_pages = await asyncio.to_thread(self._load_stored_pages, urls_to_fetch)
+                urls_to_fetch = [url for url in urls_to_fetch if url not in stored_pages]
+                for url, (title, stored_chunks) in stored_pages.items():
+                    source_idx = self.state.reserve_source(url, title, query)
+                    if source_idx is None: continue
+                    if query in query_to_sources_map: query_to_sources_map[query].append(title)
+                    candidates.extend((chunk.text, source_idx, chunk.embedding, utility_embedding) for chunk in stored_chunks)
+                if stored_pages:
+                    self.logger.info(f"Reused {len(stored_pages)} stored pages from the corpus for query '{query}'.")
             
+            allowed = reserve_fetches(len(urls_to_fetch))
+            if allowed < len(urls_to_fetch):
+                self.logger.info(f"Fetch budget allows {allowed}/{len(urls_to_fetch)} pages for query '{query}'.")
+                urls_to_fetch = urls_to_fetch[:allowed]
             fetch_tasks = {url: asyncio.create_task(fetch_clean(url)) for url in urls_to_fetch}
             chunks_to_embed, chunk_metadata = [], []
 
             for url, content_task in fetch_tasks.items():
                 content = await content_task
                 if content and len(content) > 100:
-                    source_idx = len(self.state.results) 
                     title = next((h['title'] for h in hits if h.get('url') == url), "Untitled")
-                    self.state.results.append({"url": url, "title": title, "query": query})
-                    self.state.url_to_source_index[url] = source_idx
+                    source_idx = self.state.reserve_source(url, title, query)
+                    if source_idx is None: continue
                     if query in query_to_sources_map: query_to_sources_map[query].append(title)
-                    for chunk_text in sentence_chunks(content):
+                    for chunk_text in await run_cpu("compute", sentence_chunks, content, self.config.chunk_sentences):
                         chunks_to_embed.append(chunk_text)
                         chunk_metadata.append({'original_chunk': chunk_text, 'source_idx': source_idx})
             
+            if chunks_to_embed and self.analysis.prescreener is not None:
+                redundant = await self.analysis.prescreen_redundant(chunks_to_embed)
+                kept = [i for i, flag in enumerate(redundant) if not flag]
+                if len(kept) < len(chunks_to_embed):
+                    self.logger.info(f"Pre-screen dropped {len(chunks_to_embed) - len(kept)}/{len(chunks_to_embed)} redundant chunks for query '{query}'.")
+                chunks_to_embed, chunk_metadata = [chunks_to_embed[i] for i in kept], [chunk_metadata[i] for i in kept]
+
             if not chunks_to_embed: continue
 
             chunk_embeddings = await self.analysis._embed_texts_with_cache(chunks_to_embed)
-            existing_embs_list = list(self.state.chunk_embedding_cache.values()) 
-
-            for i, chunk_emb_list in enumerate(chunk_embeddings):
+            pages = {}
+            for meta, chunk_emb_list in zip(chunk_metadata, chunk_embeddings):
                 if not chunk_emb_list: continue
-                chunk_emb_np = np.array(chunk_emb_list)
-                meta = chunk_metadata[i]
-                chunk_text = meta['original_chunk']
-                
-                utility = cosine_similarity(np.array(utility_embedding), chunk_emb_np)
-                redundancy = 0.0
-                if existing_embs_list: 
-                    similarities_to_existing = [cosine_similarity(chunk_emb_np, np.array(e_emb)) for e_emb in existing_embs_list if e_emb is not None] 
-                    if similarities_to_existing: 
-                         redundancy = max(similarities_to_existing)
-                
-                score = (Settings.NOVELTY_ALPHA * utility) - ((1 - Settings.NOVELTY_ALPHA) * redundancy)
-                scored_chunks.append((score, chunk_text, meta['source_idx'], chunk_emb_list))
+                candidates.append((meta['original_chunk'], meta['source_idx'], chunk_emb_list, utility_embedding))
+                pages.setdefault(meta['source_idx'], []).append((meta['original_chunk'], chunk_emb_list))
+            pages_to_store.extend((self.state.results[idx], chunks) for idx, chunks in pages.items())
+
+        if self.corpus and pages_to_store:
+            await asyncio.to_thread(self._store_pages, pages_to_store)
+
+        existing_embs_list = [emb for emb in self.state.chunk_embedding_cache.values() if emb is not None]
+        scores = await run_cpu("compute", score_candidates, [c[2] for c in candidates], [c[3] for c in candidates],
+                               existing_embs_list, self.config.novelty_alpha) if candidates else []
+        scored_chunks = [(float(score), chunk_text, source_idx, chunk_emb_list)
+                         for score, (chunk_text, source_idx, chunk_emb_list, _) in zip(scores, candidates)]
 
         scored_chunks.sort(key=lambda x: x[0], reverse=True)
-        top_chunks = scored_chunks[:Settings.NOVELTY_TOP_K]
-
-        num_new_chunks_added = 0
-        for score, chunk_text, source_idx, chunk_emb_list in top_chunks:
-            chunk_hash = hash_txt(chunk_text)
-            if chunk_hash not in self.state.chunk_embedding_cache: 
-                self.state.all_chunks.append((chunk_text, source_idx))
-                self.state.chunk_embedding_cache[chunk_hash] = chunk_emb_list
-                num_new_chunks_added +=1
-        
+        # Under budget pressure only the best half is kept, which also keeps later prompts smaller.
+        top_k = self.config.novelty_top_k
+        if budget_pressure() >= self.config.budget_degrade_fraction: top_k = max(1, top_k // 2)
+        top_chunks = scored_chunks[:top_k]
+
+        num_new_chunks_added = self.state.commit_chunks([(chunk_text, source_idx, chunk_emb_list) for _, chunk_text, source_idx, chunk_emb_list in top_chunks])
+
         self.logger.info(f"Added {num_new_chunks_added} new chunks to knowledge base (out of {len(scored_chunks)} candidates).")
         await asyncio.sleep(0.5)
-        return query_to_sources_map, num_new_chunks_added
\ No newline at end of file
+        return query_to_sources_map, num_new_chunks_added
+
+    @traced("corpus.recall")
+    async def _recall_from_corpus(self, targets: List[Tuple[str, Any, List[float]]],
+                                  query_to_sources_map: Dict[str, List[str]]) -> List[Tuple[str, int, List[float], List[float]]]:
+        """
+        Recalls fresh chunks relevant to each action's target from the cross-run corpus,
+        before any web search is issued. Their sources are registered like fetched ones, so
+        the web searches that follow do not fetch those pages again.
+        """
+        if not targets: return []
+        try:
+            recalled = await asyncio.to_thread(self.corpus.search, [utility for _, _, utility in targets], self.analysis.embedding_space,
+                                               self.config.corpus_top_k, self.config.corpus_min_similarity, list(self.state.url_to_source_index))
+        except Exception as e:
+            self.logger.warning(f"Corpus search failed ({e}); relying on web search only.")
+            return []
+
+        candidates, recalled_sources = [], {}
+        for (query, _, utility_embedding), hits in zip(targets, recalled):
+            for hit in hits:
+                if hit.url not in recalled_sources:
+                    recalled_sources[hit.url] = self.state.reserve_source(hit.url, hit.title, query)
+                    if recalled_sources[hit.url] is not None and query in query_to_sources_map:
+                        query_to_sources_map[query].append(hit.title)
+                if recalled_sources[hit.url] is None: continue  # registered meanwhile by a concurrent section
+                candidates.append((hit.text, recalled_sources[hit.url], hit.embedding, utility_embedding))
+        if candidates:
+            self.logger.info(f"Recalled {len(candidates)} chunks from {sum(i is not None for i in recalled_sources.values())} stored pages in the corpus.")
+        return candidates
+
+    def _load_stored_pages(self, urls) -> Dict[str, Tuple[str, list]]:
+        """Returns url -> (title, chunks) for the URLs the corpus holds a fresh copy of."""
+        stored_pages = {}
+        try:
+            for url in urls:
+                page = self.corpus.get_page(url, self.analysis.embedding_space)
+                if page: stored_pages[url] = page
+        except Exception as e:
+            self.logger.warning(f"Corpus lookup failed ({e}); fetching the pages instead.")
+        return stored_pages
+
+    def _store_pages(self, pages: List[Tuple[Dict[str, Any], List[Tuple[str, List[float]]]]]):
+        """Adds freshly fetched and embedded pages to the corpus. Failures are logged, never fatal."""
+        try:
+            for source, chunks in pages:
+                self.corpus.add_page(source['url'], source['title'], source['query'], self.analysis.embedding_space, chunks)
+        except Exception as e:
+            self.logger.warning(f"Failed to store pages in the corpus: {e}")
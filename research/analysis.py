@@ -1,15 +1,40 @@
 # research/analysis.py
-import asyncio
 import logging
 from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
 
-from agent_config import PROMPTS, Settings
-from agent_helpers import (a_chat, a_embed_batch, cosine_similarity,
-                           hash_txt, EMBED_CACHE)
+from agent_batching import a_chat_batch
+from agent_config import PROMPTS, RunConfig
+from agent_embeddings import EmbeddingProvider, get_embedding_provider
+from agent_executor import run_cpu
+from agent_helpers import cosine_matrix, hash_txt, EMBED_CACHE
+from agent_metrics import count
+from agent_tracing import traced
+
+def _max_similarities(queries: List[List[float]], keys: List[List[float]]) -> np.ndarray:
+    """Highest cosine similarity of each query to any key."""
+    return cosine_matrix(queries, keys).max(axis=1)
+
+def _redundant_mask(candidates: List[List[float]], existing: List[List[float]], threshold: float) -> List[bool]:
+    """
+    Whether each candidate is a near-duplicate (cosine similarity >= `threshold`) of an existing
+    vector or of an earlier candidate that is kept.
+    """
+    redundant = np.zeros(len(candidates), dtype=bool)
+    if len(existing): redundant |= cosine_matrix(candidates, existing).max(axis=1) >= threshold
+    within = cosine_matrix(candidates, candidates)
+    for i in range(1, len(candidates)):
+        if not redundant[i]: redundant[i] = bool((within[i, :i][~redundant[:i]] >= threshold).any())
+    return redundant.tolist()
+
+def _cluster_embeddings(embeddings: np.ndarray, n_components: int, n_clusters: int) -> np.ndarray:
+    """PCA-reduces the embeddings and returns their KMeans cluster labels."""
+    # scikit-learn takes about a second to import; only runs that explore latent topics pay for it.
+    from sklearn.cluster import KMeans
+    from sklearn.decomposition import PCA
+    reduced_embeddings = PCA(n_components=n_components).fit_transform(embeddings)
+    return KMeans(n_clusters=n_clusters, random_state=42, n_init='auto').fit_predict(reduced_embeddings)
 
 # Forward declaration for type hinting
 class ResearchState:
@@ -23,28 +48,52 @@ class AnalysisComponent:
     unsupervised learning (PCA + KMeans), and tracking information gain to
     determine when research should conclude.
     """
-    def __init__(self, state: 'ResearchState', logger: logging.Logger):
+    def __init__(self, state: 'ResearchState', logger: logging.Logger, config: RunConfig):
         self.state = state
         self.logger = logger
+        self.config = config
+        # Embeds everything the run compares (chunks, HyDE documents, labels, queries); see agent_embeddings.
+        self.embedder: EmbeddingProvider = get_embedding_provider(config.embedding_provider, config.embedding_model)
+        # Optional cheaper provider that drops redundant chunks before `embedder` sees them.
+        self.prescreener: Optional[EmbeddingProvider] = (get_embedding_provider(config.prescreen_embedding_provider, config.embedding_model)
+                                                         if config.prescreen_embedding_provider else None)
+        # Pre-screen embeddings of the first `_prescreen_rows` knowledge-base chunks, kept apart from
+        # EMBED_CACHE so cheap local vectors do not evict paid ones; grown by the new chunks each step.
+        self._prescreen_matrix: Optional[np.ndarray] = None
+        self._prescreen_rows, self._prescreen_last = 0, ""
+        self._prescreen_candidates: Dict[str, List[float]] = {}
+
+    @property
+    def embedding_space(self) -> Optional[str]:
+        """The run's embedding model id; the corpus and the report cache only match entries from the same space."""
+        return self.embedder.model_id
 
-    async def _generate_hypothetical_document(self, topic: str) -> str:
-        """Uses an LLM to generate a hypothetical document for a given topic (HyDE)."""
-        self.logger.debug(f"Generating HyDE document for topic: '{topic}'")
-        prompt = [{"role": "system", "content": PROMPTS.HYDE_GENERATOR}, {"role": "user", "content": topic}]
-        doc = await a_chat(prompt, temp=0.4, max_tokens=512)
-        if "Error:" in doc:
-            self.logger.warning(f"Could not generate HyDE document for '{topic}'. Using topic string as fallback.")
-            return topic
-        return doc
+    @traced("hyde")
+    async def generate_hypothetical_documents(self, topics: List[str]) -> List[str]:
+        """Uses an LLM to generate a hypothetical document for each topic (HyDE), in as few calls as `prompt_batch_size` allows."""
+        self.logger.debug(f"Generating HyDE documents for {len(topics)} topics.")
+        docs = await a_chat_batch(PROMPTS.HYDE_GENERATOR, list(topics), model=self.config.chat_model, temp=0.4, max_tokens=512,
+                                  task="hyde", batch_size=self.config.prompt_batch_size)
+        for i, (topic, doc) in enumerate(zip(topics, docs)):
+            if "Error:" in doc:
+                self.logger.warning(f"Could not generate HyDE document for '{topic}'. Using topic string as fallback.")
+                docs[i] = topic
+        return docs
     
-    async def _embed_texts_with_cache(self, texts: List[str]) -> List[Optional[List[float]]]:
-        """Embeds a list of texts, utilizing a cache to avoid redundant API calls."""
+    @traced("embeddings")
+    async def _embed_texts_with_cache(self, texts: List[str], provider: Optional[EmbeddingProvider] = None) -> List[Optional[List[float]]]:
+        """Embeds a list of texts (with the run's provider unless another is given), utilizing a cache to avoid redundant API calls."""
+        provider = provider or self.embedder
         texts_to_embed, indices_to_embed, final_embeddings = [], [], [None] * len(texts)
+        model = provider.model_id
+        # The session-specific cache holds knowledge-base chunks, embedded with the run's provider only.
+        session_cache = self.state.chunk_embedding_cache if provider is self.embedder else {}
         for i, text in enumerate(texts):
             if not text: continue
             h = hash_txt(text)
-            # Check both the session-specific cache and the global cache
-            cached_emb = self.state.chunk_embedding_cache.get(h) or EMBED_CACHE.get(h)
+            # Check both the session-specific cache and the global cache; the global one is shared by
+            # runs that may use different embedding models, so its keys include the model.
+            cached_emb = session_cache.get(h) or EMBED_CACHE[f"{model}:{h}"]
             if cached_emb:
                 final_embeddings[i] = cached_emb
             else:
@@ -52,23 +101,49 @@ class AnalysisComponent:
                 indices_to_embed.append(i)
         
         if texts_to_embed:
-            all_new_embeddings: List[Optional[List[float]]] = []
-            batches = [texts_to_embed[i:i + Settings.EMBEDDING_BATCH_SIZE] for i in range(0, len(texts_to_embed), Settings.EMBEDDING_BATCH_SIZE)]
-            
-            batch_results_futures = [a_embed_batch(batch) for batch in batches]
-            batch_results_list_of_lists = await asyncio.gather(*batch_results_futures)
-            
-            for batch_result in batch_results_list_of_lists:
-                all_new_embeddings.extend(batch_result)
-
+            all_new_embeddings = await provider.embed(texts_to_embed)
             for i, emb in enumerate(all_new_embeddings):
                 if emb:
                     original_index = indices_to_embed[i]
                     final_embeddings[original_index] = emb
                     # Put the new embedding into the global cache
-                    EMBED_CACHE.put(hash_txt(texts_to_embed[i]), emb)
+                    EMBED_CACHE.put(f"{model}:{hash_txt(texts_to_embed[i])}", emb)
         return final_embeddings
 
+    @traced("prescreen")
+    async def prescreen_redundant(self, texts: List[str]) -> List[bool]:
+        """
+        Flags fetched chunks that add nothing new: near-duplicates, by the pre-screen provider's
+        embeddings, of a knowledge-base chunk or of an earlier chunk in `texts`. Flagged chunks
+        need not be embedded with the run's (costlier) provider. All False without a pre-screen.
+        """
+        if self.prescreener is None or not texts: return [False] * len(texts)
+        chunks = self.state.all_chunks
+        if self._prescreen_rows > len(chunks) or (self._prescreen_rows and chunks[self._prescreen_rows - 1][0] != self._prescreen_last):
+            # The knowledge base was replaced (warm start), not grown.
+            self._prescreen_matrix, self._prescreen_rows = None, 0
+        added = [chunk_text for chunk_text, _ in chunks[self._prescreen_rows:]]
+        # Chunks kept by the last step were its candidates, so most of `added` is already embedded.
+        to_embed = list(texts) + [t for t in added if hash_txt(t) not in self._prescreen_candidates]
+        fresh = dict(zip(map(hash_txt, to_embed), await self.prescreener.embed(to_embed)))
+        added_embs = [emb for emb in (fresh.get(h) or self._prescreen_candidates.get(h) for h in map(hash_txt, added)) if emb]
+        if added_embs:
+            block = np.asarray(added_embs, dtype=np.float32)
+            self._prescreen_matrix = block if self._prescreen_matrix is None else np.vstack([self._prescreen_matrix, block])
+        if added: self._prescreen_rows, self._prescreen_last = len(chunks), added[-1]
+        self._prescreen_candidates = {h: fresh[h] for h in map(hash_txt, texts) if fresh.get(h)}
+        candidates = [(i, emb) for i, emb in enumerate(fresh.get(hash_txt(t)) for t in texts) if emb]
+        existing = self._prescreen_matrix if self._prescreen_matrix is not None else []
+        redundant = [False] * len(texts)
+        if candidates:
+            mask = await run_cpu("compute", _redundant_mask, [emb for _, emb in candidates], existing,
+                                 self.config.prescreen_duplicate_similarity)
+            for (i, _), flag in zip(candidates, mask): redundant[i] = flag
+        dropped = sum(redundant)
+        count("prescreened_chunks", len(texts) - dropped, result="kept")
+        if dropped: count("prescreened_chunks", dropped, result="dropped")
+        return redundant
+
     def get_gain_trend_description(self) -> str:
         """Analyzes the recent history of information gain to describe its trend."""
         history = self.state.information_gain_history
@@ -76,7 +151,7 @@ class AnalysisComponent:
         recent_gains = history[-3:]
         if len(recent_gains) < 2: return "Stable."
         avg_gain = np.mean(recent_gains)
-        if avg_gain < Settings.DIMINISHING_RETURNS_THRESHOLD: return "Stalling (very low gain)."
+        if avg_gain < self.config.diminishing_returns_threshold: return "Stalling (very low gain)."
         if recent_gains[-1] > recent_gains[-2]: return "Increasing."
         elif recent_gains[-1] < recent_gains[-2] * 0.75: return "Decreasing."
         else: return "Stable."
@@ -87,12 +162,18 @@ class AnalysisComponent:
 
         Returns a vector of coverage scores and a human-readable summary.
         """
+        coverage_scores, summary = await self._topic_coverage_scores()
+        if coverage_scores is None: return None, summary
+        return np.array(list(coverage_scores.values())), summary
+
+    async def _topic_coverage_scores(self) -> Tuple[Optional[Dict[str, float]], str]:
+        """Computes each outline topic's coverage (max similarity to any chunk), keyed by topic."""
         if not self.state.outline or not self.state.all_chunks: return None, "Not enough data for coverage analysis."
         
         outline_topic_texts = [t.get('topic') for t in self.state.outline if isinstance(t, dict) and t.get('topic')]
         if not outline_topic_texts: return None, "Outline is malformed or empty (no topic strings)."
 
-        hyde_docs_for_outline = await asyncio.gather(*(self._generate_hypothetical_document(ot) for ot in outline_topic_texts))
+        hyde_docs_for_outline = await self.generate_hypothetical_documents(outline_topic_texts)
         outline_embeddings = await self._embed_texts_with_cache(hyde_docs_for_outline)
         
         valid_outline_data = [(ot, o_emb) for ot, o_emb in zip(outline_topic_texts, outline_embeddings) if o_emb]
@@ -101,23 +182,20 @@ class AnalysisComponent:
         cached_chunk_embeddings_values = [emb for emb in self.state.chunk_embedding_cache.values() if emb is not None]
         if not cached_chunk_embeddings_values: return None, "No valid chunk embeddings in cache for coverage."
         
-        cached_chunk_embeddings_np = [np.array(emb) for emb in cached_chunk_embeddings_values]
-
-        coverage_scores = {}
-        for ot_text, o_emb_list in valid_outline_data:
-            o_emb_np = np.array(o_emb_list)
-            sims_to_chunks = [cosine_similarity(o_emb_np, c_emb_np) for c_emb_np in cached_chunk_embeddings_np]
-            coverage_scores[ot_text] = max(sims_to_chunks) if sims_to_chunks else 0.0
+        # Max similarity of each topic to any chunk, as one matrix product off the event loop.
+        max_sims = await run_cpu("compute", _max_similarities, [o_emb for _, o_emb in valid_outline_data], cached_chunk_embeddings_values)
+        coverage_scores = {ot_text: float(sim) for (ot_text, _), sim in zip(valid_outline_data, max_sims)}
         
         summary = ", ".join([f"'{k}': {v:.2f}" for k, v in coverage_scores.items()])
-        return np.array(list(coverage_scores.values())), summary
+        return coverage_scores, summary
 
+    @traced("clustering")
     async def get_latent_topics(self) -> List[Dict[str, Any]]: 
         """
         Discovers latent topics from chunk embeddings using PCA for dimensionality
         reduction and KMeans for clustering.
         """
-        if len(self.state.chunk_embedding_cache) < Settings.N_CLUSTERS: return []
+        if len(self.state.chunk_embedding_cache) < self.config.n_clusters: return []
         
         texts_and_embs_for_clustering = []
         for chunk_text, _ in self.state.all_chunks: 
@@ -126,36 +204,33 @@ class AnalysisComponent:
             if emb is not None:
                 texts_and_embs_for_clustering.append({'text': chunk_text, 'emb': np.array(emb)})
         
-        if len(texts_and_embs_for_clustering) < Settings.N_CLUSTERS: return []
+        if len(texts_and_embs_for_clustering) < self.config.n_clusters: return []
 
         embeddings_np_array = np.array([item['emb'] for item in texts_and_embs_for_clustering])
         original_texts_ordered = [item['text'] for item in texts_and_embs_for_clustering]
 
-        n_components = min(Settings.PCA_COMPONENTS, embeddings_np_array.shape[0], embeddings_np_array.shape[1])
+        n_components = min(self.config.pca_components, embeddings_np_array.shape[0], embeddings_np_array.shape[1])
         if n_components <= 1: return [] 
 
-        pca = PCA(n_components=n_components)
-        reduced_embeddings = pca.fit_transform(embeddings_np_array)
-        
-        actual_n_clusters = min(Settings.N_CLUSTERS, len(reduced_embeddings))
+        actual_n_clusters = min(self.config.n_clusters, len(embeddings_np_array))
         if actual_n_clusters <= 1: return []
 
-        kmeans = KMeans(n_clusters=actual_n_clusters, random_state=42, n_init='auto')
-        cluster_labels = kmeans.fit_predict(reduced_embeddings)
+        cluster_labels = await run_cpu("compute", _cluster_embeddings, embeddings_np_array, n_components, actual_n_clusters)
         
-        cluster_tasks = []
+        snippets = []
         for i in range(actual_n_clusters):
             current_cluster_texts = [original_texts_ordered[j] for j, label in enumerate(cluster_labels) if label == i]
             if not current_cluster_texts: continue
             
             sample = "\n- ".join(current_cluster_texts[:5]) 
-            prompt = [{"role": "system", "content": "Read these text snippets from a research cluster. Provide a concise, 3-5 word topic label for them."},
-                      {"role": "user", "content": f"Snippets:\n- {sample[:3000]}"}]
-            cluster_tasks.append(a_chat(prompt, temp=0.2, max_tokens=16))
+            snippets.append(f"Snippets:\n- {sample[:3000]}")
         
-        gathered_labels = await asyncio.gather(*cluster_tasks)
+        gathered_labels = await a_chat_batch("Read these text snippets from a research cluster. Provide a concise, 3-5 word topic label for them.",
+                                             snippets, model=self.config.chat_model, temp=0.2, max_tokens=16, task="cluster_label",
+                                             batch_size=self.config.prompt_batch_size)
         return [{"label": label, "id": i} for i, label in enumerate(gathered_labels) if not label.startswith("Error:")]
 
+    @traced("information_gain")
     async def update_information_gain(self):
         """
         Calculates and records the information gain for the current cycle.
@@ -164,8 +239,11 @@ class AnalysisComponent:
         of the current state and the previous state. It resets if the outline changes.
         """
         self.logger.debug("Updating information gain...")
-        coverage_vector, _ = await self.calculate_topic_coverage()
-        if coverage_vector is None: return
+        coverage_scores, _ = await self._topic_coverage_scores()
+        if coverage_scores is None: return
+        coverage_vector = np.array(list(coverage_scores.values()))
+        for topic, score in coverage_scores.items():
+            self.state.topic_coverage_history.setdefault(topic, []).append(float(score))
 
         if self.state.last_coverage_vector is not None:
             if coverage_vector.shape == self.state.last_coverage_vector.shape:
@@ -183,9 +261,26 @@ class AnalysisComponent:
         Checks if the average information gain over a recent window has fallen
         below a predefined threshold, indicating that research should stop.
         """
-        if len(self.state.information_gain_history) < Settings.DIMINISHING_RETURNS_WINDOW: return False
-        avg_gain = np.mean(self.state.information_gain_history[-Settings.DIMINISHING_RETURNS_WINDOW:])
-        if avg_gain < Settings.DIMINISHING_RETURNS_THRESHOLD:
+        if len(self.state.information_gain_history) < self.config.diminishing_returns_window: return False
+        avg_gain = np.mean(self.state.information_gain_history[-self.config.diminishing_returns_window:])
+        if avg_gain < self.config.diminishing_returns_threshold:
             self.logger.warning(f"Avg gain ({avg_gain:.4f}) is below threshold. Stopping.")
             return True
-        return False
\ No newline at end of file
+        return False
+
+    def get_saturated_topics(self) -> List[str]:
+        """
+        Returns outline topics whose coverage has stopped improving.
+
+        A topic is saturated once its coverage rose by less than
+        `speculative_coverage_epsilon` in each of the last `speculative_saturation_cycles` cycles.
+        """
+        window = self.config.speculative_saturation_cycles
+        saturated = []
+        for block in self.state.outline:
+            history = self.state.topic_coverage_history.get(block.get('topic'), [])
+            if len(history) < window + 1: continue
+            recent = history[-(window + 1):]
+            if all(later - earlier < self.config.speculative_coverage_epsilon for earlier, later in zip(recent, recent[1:])):
+                saturated.append(block['topic'])
+        return saturated
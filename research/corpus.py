@@ -0,0 +1,172 @@
+# research/corpus.py
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from agent_config import Settings
+from agent_helpers import normalize_rows
+
+log = logging.getLogger("deep-research.corpus")
+
+CORPUS_FILE = "corpus.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url             TEXT NOT NULL,
+    embedding_model TEXT NOT NULL,
+    title           TEXT,
+    query           TEXT,
+    fetched_at      REAL NOT NULL,
+    PRIMARY KEY (url, embedding_model)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    url             TEXT NOT NULL,
+    embedding_model TEXT NOT NULL,
+    position        INTEGER NOT NULL,
+    text            TEXT NOT NULL,
+    embedding       BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_by_page ON chunks (url, embedding_model);
+"""
+
+
+@dataclass
+class CorpusChunk:
+    """A chunk of a previously processed page, as returned by the corpus."""
+    text: str
+    url: str
+    title: str
+    fetched_at: float
+    embedding: List[float] = field(repr=False)
+    similarity: float = 0.0
+
+
+class CorpusStore:
+    """
+    Persistent, cross-run store of processed pages: their chunks, chunk embeddings, source
+    metadata and fetch dates, with an in-memory vector index on top.
+
+    Pages are stored per embedding deployment, since embeddings of different models are not
+    comparable. The index holds one normalized float32 matrix per model; it is built on first
+    use and extended with rows added since (also by other processes sharing the file), so a
+    search is a single matrix-vector product.
+
+    Safe to share between the pipelines of one process; calls are serialized by a lock and
+    are meant to run in a worker thread (`asyncio.to_thread`).
+    """
+    def __init__(self, directory: Union[str, Path], max_age_days: Optional[float] = None):
+        self.path = Path(directory)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_age_seconds = (Settings.CORPUS_MAX_AGE_DAYS if max_age_days is None else max_age_days) * 86400
+        self._db = sqlite3.connect(self.path / CORPUS_FILE, check_same_thread=False, timeout=30.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        # embedding model -> (chunk ids, normalized embedding matrix, highest chunk id loaded)
+        self._index: Dict[str, Tuple[np.ndarray, np.ndarray, int]] = {}
+
+    def search(self, query_embeddings: Sequence[List[float]], embedding_model: Optional[str], top_k: int,
+               min_similarity: float = 0.0, exclude_urls: Sequence[str] = ()) -> List[List[CorpusChunk]]:
+        """
+        Returns, for each query embedding, up to `top_k` fresh chunks (fetched within the
+        corpus's max age) with cosine similarity of at least `min_similarity`, best first.
+        Chunks of `exclude_urls` (e.g. sources the run already has) are skipped.
+        """
+        if not query_embeddings or top_k <= 0: return [[] for _ in query_embeddings]
+        with self._lock:
+            ids, matrix = self._refresh_index(embedding_model or "")
+            if not len(ids) or matrix.shape[1] != len(query_embeddings[0]):
+                return [[] for _ in query_embeddings]
+            sims = normalize_rows(query_embeddings) @ matrix.T  # (queries, chunks)
+            # Over-fetch, since stale pages and excluded URLs are only filtered after ranking.
+            pool = min(len(ids), top_k * 4)
+            candidates = np.argpartition(-sims, pool - 1, axis=1)[:, :pool]
+            wanted = {int(ids[j]) for row, cols in enumerate(candidates) for j in cols if sims[row, j] >= min_similarity}
+            rows = self._load_chunks(wanted, embedding_model or "", time.time() - self.max_age_seconds, set(exclude_urls))
+
+        results = []
+        for row, cols in enumerate(candidates):
+            hits = []
+            for j in sorted(cols, key=lambda j: -sims[row, j]):
+                chunk = rows.get(int(ids[j]))
+                if chunk is None or sims[row, j] < min_similarity: continue
+                hits.append(CorpusChunk(*chunk, similarity=float(sims[row, j])))
+                if len(hits) == top_k: break
+            results.append(hits)
+        return results
+
+    def get_page(self, url: str, embedding_model: Optional[str]) -> Optional[Tuple[str, List[CorpusChunk]]]:
+        """Returns (title, chunks in page order) of a fresh stored page, or None if it is absent or stale."""
+        with self._lock:
+            page = self._db.execute("SELECT title, fetched_at FROM pages WHERE url = ? AND embedding_model = ?",
+                                    (url, embedding_model or "")).fetchone()
+            if page is None or time.time() - page[1] > self.max_age_seconds: return None
+            rows = self._db.execute("SELECT text, embedding FROM chunks WHERE url = ? AND embedding_model = ? ORDER BY position",
+                                    (url, embedding_model or "")).fetchall()
+        title, fetched_at = page
+        return title, [CorpusChunk(text, url, title, fetched_at, np.frombuffer(emb, dtype=np.float32).tolist()) for text, emb in rows]
+
+    def add_page(self, url: str, title: str, query: str, embedding_model: Optional[str],
+                 chunks: Sequence[Tuple[str, List[float]]]) -> int:
+        """Stores (or re-stores, with a new fetch date) a processed page and its embedded chunks. Returns the chunk count."""
+        chunks = [(text, emb) for text, emb in chunks if emb]
+        if not chunks: return 0
+        model = embedding_model or ""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM chunks WHERE url = ? AND embedding_model = ?", (url, model))
+            self._db.execute("INSERT OR REPLACE INTO pages (url, embedding_model, title, query, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                             (url, model, title, query, time.time()))
+            self._db.executemany("INSERT INTO chunks (url, embedding_model, position, text, embedding) VALUES (?, ?, ?, ?, ?)",
+                                 [(url, model, i, text, np.asarray(emb, dtype=np.float32).tobytes()) for i, (text, emb) in enumerate(chunks)])
+        return len(chunks)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            pages, = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()
+            chunks, = self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()
+        return {"pages": pages, "chunks": chunks}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _refresh_index(self, model: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Extends the model's index with chunks added since it was last loaded."""
+        ids, matrix, last_id = self._index.get(model, (np.zeros(0, dtype=np.int64), None, 0))
+        rows = self._db.execute("SELECT id, embedding FROM chunks WHERE embedding_model = ? AND id > ? ORDER BY id",
+                                (model, last_id)).fetchall()
+        if rows:
+            new = normalize_rows([np.frombuffer(emb, dtype=np.float32) for _, emb in rows]).astype(np.float32)
+            if matrix is not None and matrix.shape[1] == new.shape[1]:
+                new = np.vstack([matrix, new])
+                ids = np.concatenate([ids, np.array([i for i, _ in rows], dtype=np.int64)])
+            else:
+                ids = np.array([i for i, _ in rows], dtype=np.int64)
+            matrix, last_id = new, rows[-1][0]
+            self._index[model] = (ids, matrix, last_id)
+        return ids, matrix if matrix is not None else np.zeros((0, 0), dtype=np.float32)
+
+    def _load_chunks(self, chunk_ids, model: str, fetched_after: float, exclude_urls) -> Dict[int, tuple]:
+        """Loads the given chunks of fresh pages; ids of replaced (deleted) chunks are simply absent."""
+        if not chunk_ids: return {}
+        placeholders = ",".join("?" * len(chunk_ids))
+        rows = self._db.execute(
+            f"SELECT c.id, c.text, c.url, p.title, p.fetched_at, c.embedding FROM chunks c "
+            f"JOIN pages p ON p.url = c.url AND p.embedding_model = c.embedding_model "
+            f"WHERE c.id IN ({placeholders}) AND p.fetched_at >= ?", (*chunk_ids, fetched_after)).fetchall()
+        return {cid: (text, url, title or "Untitled", fetched_at, np.frombuffer(emb, dtype=np.float32).tolist())
+                for cid, text, url, title, fetched_at, emb in rows if url not in exclude_urls}
+
+
+@lru_cache(maxsize=1)
+def default_corpus() -> Optional[CorpusStore]:
+    """The process-wide corpus at `Settings.CORPUS_DIR`, or None if the corpus is disabled."""
+    return CorpusStore(Settings.CORPUS_DIR) if Settings.CORPUS_DIR else None
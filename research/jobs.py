@@ -0,0 +1,244 @@
+# research/jobs.py
+import asyncio
+import logging
+import os
+import resource
+import sys
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from agent_config import RunConfig, Settings
+from agent_executor import loop_monitor
+from research.corpus import default_corpus
+from research.pipeline import ResearchPipeline
+from research.report_cache import default_report_cache
+
+log = logging.getLogger("deep-research.jobs")
+
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class JobQueueFullError(RuntimeError):
+    """Raised when a client already has the maximum number of queued jobs."""
+
+
+@dataclass
+class ResearchJob:
+    """A research run submitted to a `JobManager`, with its lifecycle timestamps and outcome."""
+    id: str
+    query: str
+    client_id: str
+    config: RunConfig
+    narrate: bool = False
+    refresh: bool = False
+    status: str = "queued"
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    report: Optional[str] = None
+    error: Optional[str] = None
+    # API calls, tokens, fetches and cache hit ratios of the run (see `agent_metrics.MetricsRegistry.summary`).
+    metrics: Optional[Dict[str, Any]] = field(default=None, repr=False)
+    pipeline: Optional[ResearchPipeline] = field(default=None, repr=False)
+    task: Optional["asyncio.Task[str]"] = field(default=None, repr=False)
+    final_progress: Dict[str, Any] = field(default_factory=dict, repr=False)
+    # Progress events of the run (see `research.pipeline.stream_deep_research`), for cursor-based polling.
+    events: List[Dict[str, Any]] = field(default_factory=list, repr=False)
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def progress(self) -> Dict[str, Any]:
+        """Live progress of a running job (cycles, sources, chunks, sections), or the final snapshot."""
+        if self.pipeline is None: return dict(self.final_progress)
+        state = self.pipeline.state
+        return {
+            "phase": state.phase,
+            "cycle": state.cycles,
+            "max_cycles": self.config.max_cycles,
+            "sources": len(state.results),
+            "chunks": len(state.all_chunks),
+            "sections_done": len(state.sections) if state.phase != "research" else 0,
+            "sections_total": len([b for b in state.outline if b.get('topic')]),
+            "budget": self.pipeline.budget.snapshot() if self.pipeline.budget.limited else None,
+        }
+
+
+def current_rss_mb() -> float:
+    """Resident memory of this process in MiB (peak RSS where the current value is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+class JobManager:
+    """
+    Bounded, fair scheduler for research jobs inside a long-running server.
+
+    Jobs wait in one FIFO queue per client; idle workers take the next job round-robin across
+    clients, so one client submitting many questions cannot starve the others. At most
+    `workers` pipelines run at once, and while the process is above `memory_limit_mb` no new
+    pipeline is started (unless none is running). Finished jobs are kept for `result_ttl`
+    seconds so their results can be fetched.
+
+    Workers are started lazily on the first submission, inside the server's event loop.
+    """
+    def __init__(self, workers: Optional[int] = None, max_queued_per_client: Optional[int] = None,
+                 memory_limit_mb: Optional[int] = None, result_ttl: Optional[float] = None, config: Optional[RunConfig] = None):
+        self.num_workers = workers or Settings.JOB_WORKERS
+        self.max_queued_per_client = max_queued_per_client or Settings.JOB_MAX_QUEUED_PER_CLIENT
+        self.memory_limit_mb = Settings.JOB_MEMORY_LIMIT_MB if memory_limit_mb is None else memory_limit_mb
+        self.result_ttl = result_ttl or Settings.JOB_RESULT_TTL
+        # Jobs never write to stdout: it may be the transport (MCP stdio), so the rich UI stays off.
+        self.config = config or RunConfig(output_style="detailed")
+        self.jobs: Dict[str, ResearchJob] = {}
+        self._queues: Dict[str, Deque[str]] = {}
+        self._client_order: Deque[str] = deque()
+        self._running = 0
+        self._cond: Optional[asyncio.Condition] = None
+        self._workers: List["asyncio.Task[None]"] = []
+        # Pending notifications; the event loop only keeps weak references to tasks.
+        self._notify_tasks: Set["asyncio.Task[None]"] = set()
+
+    def submit(self, query: str, client_id: str = "anonymous", config: Optional[RunConfig] = None, narrate: bool = False,
+               refresh: bool = False) -> ResearchJob:
+        """
+        Queues a research job and returns it immediately. Raises `JobQueueFullError` if the client's queue is full.
+        `refresh` re-researches a question the report cache (if enabled) already answered.
+        """
+        self._ensure_workers()
+        self._evict_expired()
+        queue = self._queues.setdefault(client_id, deque())
+        if len(queue) >= self.max_queued_per_client:
+            raise JobQueueFullError(f"Client '{client_id}' already has {len(queue)} queued jobs (limit {self.max_queued_per_client}).")
+        job = ResearchJob(id=uuid.uuid4().hex[:12], query=query, client_id=client_id, config=config or self.config,
+                          narrate=narrate, refresh=refresh)
+        self.jobs[job.id] = job
+        queue.append(job.id)
+        if client_id not in self._client_order: self._client_order.append(client_id)
+        self._notify()
+        log.info(f"Queued job {job.id} for client '{client_id}': '{query}'")
+        return job
+
+    def get(self, job_id: str) -> ResearchJob:
+        """Returns a job by id. Raises `KeyError` for unknown or expired jobs."""
+        self._evict_expired()
+        if job_id not in self.jobs:
+            raise KeyError(f"Unknown or expired job id '{job_id}'.")
+        return self.jobs[job_id]
+
+    def queue_position(self, job: ResearchJob) -> Optional[int]:
+        """1-based position of a queued job within its client's queue."""
+        queue = self._queues.get(job.client_id)
+        if job.status != "queued" or not queue or job.id not in queue: return None
+        return list(queue).index(job.id) + 1
+
+    def cancel(self, job_id: str) -> ResearchJob:
+        """Cancels a queued or running job; finished jobs are returned unchanged."""
+        job = self.get(job_id)
+        if job.status == "queued":
+            queue = self._queues.get(job.client_id)
+            if queue and job_id in queue: queue.remove(job_id)
+            self._finish(job, "cancelled")
+        elif job.status == "running" and job.task:
+            job.task.cancel()
+        return job
+
+    async def wait(self, job_id: str) -> ResearchJob:
+        """Waits until a job has finished and returns it."""
+        job = self.get(job_id)
+        await job.done.wait()
+        return job
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {status: 0 for status in JOB_STATUSES}
+        for job in self.jobs.values(): counts[job.status] += 1
+        monitor = loop_monitor()
+        return {"workers": self.num_workers, "running": self._running, "jobs": counts, "rss_mb": round(current_rss_mb(), 1),
+                "event_loop": monitor.stats() if monitor else None}
+
+    def _ensure_workers(self):
+        if self._workers: return
+        self._cond = asyncio.Condition()
+        self._workers = [asyncio.create_task(self._worker(), name=f"research-worker-{i}") for i in range(self.num_workers)]
+
+    def _notify(self):
+        async def notify():
+            async with self._cond: self._cond.notify()
+        task = asyncio.ensure_future(notify())
+        self._notify_tasks.add(task)
+        task.add_done_callback(self._notify_tasks.discard)
+
+    def _has_memory_headroom(self) -> bool:
+        return self.memory_limit_mb <= 0 or self._running == 0 or current_rss_mb() < self.memory_limit_mb
+
+    def _next_job(self) -> Optional[ResearchJob]:
+        """Pops the next job round-robin across clients."""
+        while self._client_order:
+            client_id = self._client_order.popleft()
+            queue = self._queues.get(client_id)
+            if not queue:
+                self._queues.pop(client_id, None)
+                continue
+            job = self.jobs[queue.popleft()]
+            if queue: self._client_order.append(client_id)
+            else: self._queues.pop(client_id, None)
+            return job
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._cond:
+                while not (any(self._queues.values()) and self._has_memory_headroom()):
+                    try:
+                        # Memory is re-checked periodically since it changes without a notification.
+                        await asyncio.wait_for(self._cond.wait(), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        pass
+                job = self._next_job()
+                if job is None: continue
+                self._running += 1
+            try:
+                await self._run(job)
+            finally:
+                self._running -= 1
+                self._notify()
+
+    async def _run(self, job: ResearchJob):
+        job.status, job.started_at = "running", time.time()
+        log.info(f"Starting job {job.id} ({self._running}/{self.num_workers} workers busy).")
+        try:
+            job.pipeline = ResearchPipeline(job.query, config=job.config, event_sink=job.events.append, narrate=job.narrate,
+                                            report_cache=default_report_cache(), refresh=job.refresh, corpus=default_corpus())
+            job.task = asyncio.create_task(job.pipeline.run())
+            job.report = await job.task
+            self._finish(job, "done")
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling(): raise  # the worker itself is being shut down
+            self._finish(job, "cancelled")
+        except Exception as e:
+            log.error(f"Job {job.id} failed: {e}", exc_info=True)
+            job.error = str(e)
+            self._finish(job, "failed")
+
+    def _finish(self, job: ResearchJob, status: str):
+        if job.pipeline is not None:
+            job.final_progress = job.progress()
+            job.metrics = job.pipeline.metrics.summary()
+        # Drop the pipeline so its knowledge base can be freed; only the report is kept.
+        job.status, job.finished_at, job.pipeline, job.task = status, time.time(), None, None
+        job.done.set()
+        log.info(f"Job {job.id} {status}.")
+
+    def _evict_expired(self):
+        now = time.time()
+        for job_id in [j.id for j in self.jobs.values() if j.finished and now - j.finished_at > self.result_ttl]:
+            del self.jobs[job_id]
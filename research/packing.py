@@ -0,0 +1,139 @@
+# research/packing.py
+import hashlib
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent_config import Settings
+
+log = logging.getLogger("deep-research.packing")
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+# Where a prefix of a text can end: after a sentence or a line.
+_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\s*\n\s*")
+
+
+@lru_cache(maxsize=8)
+def _get_encoder(model: str):
+    """
+    Returns a tiktoken encoder for `model`, or None if no tokenizer is available.
+
+    Azure deployment names are arbitrary, so an unknown name falls back to
+    `Settings.TOKENIZER_ENCODING`. If tiktoken is not installed or its BPE files
+    cannot be loaded (e.g. offline), token counts fall back to a character heuristic.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        log.warning("tiktoken is not installed; estimating token counts from character length.")
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(Settings.TOKENIZER_ENCODING)
+    except Exception as e:
+        log.warning(f"Could not load tokenizer for '{model}' ({e}); estimating token counts from character length.")
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Counts the tokens in `text` using the tokenizer of the given (or default chat) deployment."""
+    if not text: return 0
+    encoder = _get_encoder(model or Settings.AZURE_DEPLOYMENT)
+    if encoder is None:
+        return -(-len(text) // Settings.CHARS_PER_TOKEN_ESTIMATE)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """
+    Trims `text` to at most `max_tokens`, dropping whole trailing sentences (or lines) first.
+
+    The result is a prefix of `text`, so headings, lists and paragraph breaks survive. Only
+    when even the first sentence does not fit is it cut mid-sentence.
+    """
+    if max_tokens <= 0 or not text: return ""
+    if count_tokens(text, model) <= max_tokens: return text
+
+    # Token counts grow with the prefix, so the longest prefix that fits is found by bisection.
+    ends = [m.start() for m in _BOUNDARY.finditer(text) if m.start() > 0]
+    lo, hi = 0, len(ends)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if count_tokens(text[:ends[mid]], model) <= max_tokens: lo = mid + 1
+        else: hi = mid
+    if lo:
+        return text[:ends[lo - 1]]
+
+    encoder = _get_encoder(model or Settings.AZURE_DEPLOYMENT)
+    if encoder is None:
+        return text[:max_tokens * Settings.CHARS_PER_TOKEN_ESTIMATE]
+    return encoder.decode(encoder.encode(text, disallowed_special=())[:max_tokens])
+
+
+def _sentence_key(sentence: str) -> str:
+    normalized = re.sub(r"\W+", " ", sentence.lower()).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def pack_excerpts(excerpts: List[Dict[str, Any]], max_tokens: int, model: Optional[str] = None,
+                  separator: str = "\n\n", already_included: Optional[List[str]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Packs scored excerpts into a prompt block under an explicit token budget.
+
+    Excerpts are taken in descending `score` order. Sentences already included by a
+    higher-scoring excerpt are dropped, and the last excerpt that would overflow the
+    budget is trimmed at a sentence boundary rather than cut off blindly.
+
+    Args:
+        excerpts: Dicts with `text`, `score` and an optional `label` (e.g. "[Source 3]")
+                  that is prefixed to the excerpt as "label: text".
+        max_tokens: Token budget for the whole packed block.
+        model: Deployment whose tokenizer is used for counting.
+        separator: String placed between excerpts.
+        already_included: Text already present elsewhere in the prompt; its sentences are
+                          treated as seen so they are not packed a second time.
+
+    Returns:
+        A tuple of the packed text and the excerpt dicts that made it in (in packed order).
+    """
+    seen_sentences = {_sentence_key(s) for text in (already_included or []) for s in _SENTENCE_SPLIT.split(text) if s}
+    parts, included, used = [], [], 0
+    separator_cost = count_tokens(separator, model)
+
+    for excerpt in sorted(excerpts, key=lambda e: e.get('score', 0.0), reverse=True):
+        if used >= max_tokens: break
+        fresh_sentences, fresh_keys = [], []
+        for sentence in _SENTENCE_SPLIT.split(excerpt.get('text', '').strip()):
+            if not sentence: continue
+            key = _sentence_key(sentence)
+            if key in seen_sentences or key in fresh_keys: continue
+            fresh_sentences.append(sentence)
+            fresh_keys.append(key)
+        if not fresh_sentences: continue
+
+        label = excerpt.get('label')
+        prefix = f"{label}: " if label else ""
+        body = " ".join(fresh_sentences)
+        remaining = max_tokens - used - (separator_cost if parts else 0)
+        cost = count_tokens(prefix + body, model)
+        if cost > remaining:
+            body = truncate_to_tokens(body, remaining - count_tokens(prefix, model), model)
+            if not body: continue
+            cost = count_tokens(prefix + body, model)
+
+        # Only sentences that made it into the prompt count as seen; trimmed ones may still come from a later excerpt.
+        end = -1
+        for sentence, key in zip(fresh_sentences, fresh_keys):
+            end += 1 + len(sentence)
+            if end > len(body): break
+            seen_sentences.add(key)
+        parts.append(prefix + body)
+        included.append(excerpt)
+        used += cost + (separator_cost if len(parts) > 1 else 0)
+
+    if len(included) < len(excerpts):
+        log.debug(f"Packed {len(included)}/{len(excerpts)} excerpts into {used}/{max_tokens} tokens.")
+    return separator.join(parts), included
@@ -0,0 +1,169 @@
+# research/persistence.py
+import json
+import logging
+import os
+import re
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Union
+
+import numpy as np
+
+from agent_helpers import hash_txt
+from research.state import ResearchState
+
+log = logging.getLogger("deep-research.persistence")
+
+STATE_FORMAT_VERSION = 2
+STATE_FILE = "state.json"
+
+
+def report_filename(question: str) -> str:
+    """Builds the report file name for a question: a readable slug plus a short hash."""
+    report_filename_base = re.sub(r'[^\w\s-]', '', question.lower())
+    report_filename_base = re.sub(r'[-\s]+', '_', report_filename_base)[:50]
+    return f"report_{report_filename_base}_{hash_txt(question)[:8]}.md"
+
+
+class StateCheckpointer:
+    """
+    Writes a research state to a directory, atomically and incrementally.
+
+    Layout:
+        state.json                    metadata: outline, sources, chunk texts, sections, title, phase, ...
+        chunks-<id>.npy               float32 chunk embeddings, one append-only segment per save
+        section-queries-<id>.npy      float32 section query embeddings (rewritten each save)
+
+    `state.json` is written last via `os.replace`, so a crash mid-save leaves the previous
+    checkpoint intact; files it no longer references are removed afterwards. Because
+    `all_chunks` only ever grows, each save writes just the rows added since the last one.
+    """
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.segments: List[Dict[str, Any]] = []
+        self.rows_written = 0
+        # Chunk texts of a checkpoint already on disk; its segments are only reused if the state extends it.
+        self._existing_chunk_texts = None
+        manifest = self.path / STATE_FILE
+        if manifest.exists():
+            metadata = json.loads(manifest.read_text(encoding="utf-8"))
+            if metadata.get("format_version") == STATE_FORMAT_VERSION:
+                self.segments = metadata.get("chunk_segments", [])
+                self.rows_written = sum(seg["rows"] for seg in self.segments)
+                self._existing_chunk_texts = [text for text, _ in metadata.get("chunks", [])]
+
+    def save(self, state: ResearchState) -> Path:
+        """Checkpoints `state`. Safe to call after every cycle and every finished section."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        if self._existing_chunk_texts is not None:
+            if self._existing_chunk_texts != [text for text, _ in state.all_chunks[:self.rows_written]]:
+                # A different state is being written over this checkpoint; start the segment list over.
+                self.segments, self.rows_written = [], 0
+            self._existing_chunk_texts = None
+
+        new_chunks = state.all_chunks[self.rows_written:]
+        if new_chunks:
+            segment_file = f"chunks-{uuid.uuid4().hex[:12]}.npy"
+            _atomic_save_matrix(self.path / segment_file, [state.chunk_embedding_cache[hash_txt(text)] for text, _ in new_chunks])
+            self.segments.append({"file": segment_file, "rows": len(new_chunks)})
+            self.rows_written += len(new_chunks)
+
+        section_queries = list(state.section_query_embeddings.keys())
+        section_query_file = f"section-queries-{uuid.uuid4().hex[:12]}.npy"
+        _atomic_save_matrix(self.path / section_query_file, [state.section_query_embeddings[q] for q in section_queries])
+
+        metadata: Dict[str, Any] = {
+            "format_version": STATE_FORMAT_VERSION,
+            "query": state.query,
+            "query_embedding": state.query_embedding,
+            "phase": state.phase,
+            "cycles": state.cycles,
+            "outline": state.outline,
+            "plan": state.plan,
+            "critique_history": state.critique_history,
+            "information_gain_history": [float(g) for g in state.information_gain_history],
+            "last_coverage_vector": state.last_coverage_vector.tolist() if state.last_coverage_vector is not None else None,
+            "results": state.results,
+            "chunks": [[text, source_idx] for text, source_idx in state.all_chunks[:self.rows_written]],
+            "chunk_segments": self.segments,
+            "topic_coverage_history": state.topic_coverage_history,
+            "section_queries": section_queries,
+            "section_query_file": section_query_file,
+            "sections": state.sections,
+            "title": state.title,
+            "abstract": state.abstract,
+        }
+        _atomic_write_text(self.path / STATE_FILE, json.dumps(metadata, ensure_ascii=False))
+
+        referenced = {STATE_FILE, section_query_file} | {seg["file"] for seg in self.segments}
+        for stale in self.path.glob("*.npy"):
+            if stale.name not in referenced: stale.unlink(missing_ok=True)
+        log.debug(f"Checkpointed research state ({self.rows_written} chunks, phase '{state.phase}') to {self.path}")
+        return self.path
+
+
+def save_state(state: ResearchState, path: Union[str, Path]) -> Path:
+    """Saves a research state to a directory (see `StateCheckpointer` for the layout)."""
+    saved = StateCheckpointer(path).save(state)
+    log.info(f"Saved research state ({len(state.all_chunks)} chunks, {len(state.results)} sources) to {saved}")
+    return saved
+
+
+def load_state(path: Union[str, Path]) -> ResearchState:
+    """Loads a research state written by `save_state` or a `StateCheckpointer`."""
+    path = Path(path)
+    metadata = json.loads((path / STATE_FILE).read_text(encoding="utf-8"))
+    if metadata.get("format_version") != STATE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported research state format {metadata.get('format_version')!r} in {path}")
+
+    state = ResearchState(query=metadata["query"])
+    state.query_embedding = metadata.get("query_embedding")
+    state.phase = metadata.get("phase", "research")
+    state.cycles = metadata.get("cycles", 0)
+    state.outline = metadata.get("outline", [])
+    state.plan = metadata.get("plan", {})
+    state.critique_history = metadata.get("critique_history", [])
+    state.information_gain_history = metadata.get("information_gain_history", [])
+    if metadata.get("last_coverage_vector") is not None:
+        state.last_coverage_vector = np.array(metadata["last_coverage_vector"])
+    state.results = metadata.get("results", [])
+    state.url_to_source_index = {res["url"]: i for i, res in enumerate(state.results)}
+    state.topic_coverage_history = metadata.get("topic_coverage_history", {})
+    state.sections = metadata.get("sections", {})
+    state.title, state.abstract = metadata.get("title"), metadata.get("abstract")
+
+    # Segments are memory-mapped, so only the rows being converted are paged in.
+    chunks = metadata.get("chunks", [])
+    row = 0
+    for segment in metadata.get("chunk_segments", []):
+        embeddings = np.load(path / segment["file"], mmap_mode="r")
+        for (text, source_idx), emb in zip(chunks[row:row + segment["rows"]], embeddings):
+            state.all_chunks.append((text, source_idx))
+            state.chunk_embedding_cache[hash_txt(text)] = emb.tolist()
+        row += segment["rows"]
+
+    section_queries = metadata.get("section_queries", [])
+    if section_queries:
+        for focus_query, emb in zip(section_queries, np.load(path / metadata["section_query_file"], mmap_mode="r")):
+            state.section_query_embeddings[focus_query] = emb.tolist()
+    log.info(f"Loaded research state ({len(state.all_chunks)} chunks, {len(state.results)} sources, phase '{state.phase}') from {path}")
+    return state
+
+
+def _atomic_write_text(path: Path, text: str) -> None:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _atomic_save_matrix(path: Path, rows) -> None:
+    matrix = np.asarray(rows, dtype=np.float32) if rows else np.zeros((0, 0), dtype=np.float32)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, matrix)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -1,21 +1,36 @@
 # research/pipeline.py
 import asyncio
+import dataclasses
 import logging
-import numpy as np
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Set
 
-from rich.panel import Panel
-from rich.progress import BarColumn, Progress, SpinnerColumn, TextColumn
+import numpy as np
 
-from agent_config import SCRIPT_VERSION, Settings
-from agent_helpers import a_embed, hash_txt
+from agent_budget import RunBudget, reset_budget, use_budget
+from agent_config import SCRIPT_VERSION, RunConfig, Settings
+from agent_executor import ensure_loop_monitor
+from agent_helpers import hash_txt
+from agent_metrics import MetricsRegistry, reset_metrics, use_metrics
+from agent_routing import reset_routes, use_routes
+from agent_tracing import Tracer, reset_tracer, span, traced, use_tracer
 from research.actions import ActionComponent
 from research.analysis import AnalysisComponent
+from research.corpus import CorpusStore, default_corpus
+from research.persistence import STATE_FILE, StateCheckpointer, load_state
 from research.planning import PlanningComponent
+from research.report_cache import ReportCache, default_report_cache
 from research.state import ResearchState
-from research.synthesis import SynthesisComponent
+from research.synthesis import SynthesisComponent, count_failed_sections
 from research.ui import UIMonitor
 
 
+def is_failed_report(report: str) -> bool:
+    """Whether `ResearchPipeline.run` returned an error message instead of a report."""
+    return report.startswith(("Error:", "# Report Generation Failed"))
+
+
 class ResearchPipeline:
     """
     The main orchestrator for the deep research process.
@@ -24,44 +39,147 @@ class ResearchPipeline:
     agent (UI, State, Planning, Action, Analysis, Synthesis) to execute a research
     task from start to finish.
     """
-    def __init__(self, query: str):
-        self.state = ResearchState(query=query)
+    def __init__(self, query: str, previous_state: Optional[ResearchState] = None, previous_report: Optional[str] = None,
+                 checkpoint_dir: Optional[str] = None, config: Optional[RunConfig] = None,
+                 event_sink: Optional[Callable[[Dict[str, Any]], None]] = None, narrate: Optional[bool] = None,
+                 report_cache: Optional[ReportCache] = None, refresh: bool = False, corpus: Optional[CorpusStore] = None):
+        """
+        Args:
+            query: The research question.
+            previous_state: A state saved from an earlier run (see `research.persistence`). Research
+                            resumes from it, and at synthesis only sections whose retrieved evidence
+                            changed are rewritten; the rest are reused with their citations.
+            previous_report: The earlier run's Markdown report. Its section texts are reused verbatim
+                             for unchanged sections.
+            checkpoint_dir: If set, the state is checkpointed there after every agentic cycle and
+                            every synthesized section; pass the loaded checkpoint as `previous_state`
+                            to resume from the last completed step.
+            config: Settings for this run (models, cycles, thresholds, limits). Defaults to a
+                    `RunConfig` built from the current `Settings`.
+            event_sink: Called with every progress event (see `stream_deep_research`).
+            narrate: Whether to generate the human-readable plan summaries. They cost an LLM call
+                     per cycle and run in the background; by default only the 'summary' console
+                     style, which displays them, asks for them.
+            report_cache: If set, a near-duplicate question answered within the cache's TTL is
+                          served from it. An older match, or any match with `refresh=True`, seeds
+                          this run with its research state instead. Finished reports are added.
+            refresh: Re-research a cached question (starting from its cached state) instead of
+                     serving the cached report.
+            corpus: Cross-run store of processed pages (see `research.corpus`). Relevant, fresh
+                    chunks from it enter the knowledge base before each round of web searches,
+                    and every page this run fetches is added to it.
+        """
+        if previous_state is not None:
+            if previous_state.query != query:
+                previous_state.query, previous_state.query_embedding = query, None
+            self.state = previous_state
+        else:
+            self.state = ResearchState(query=query)
+        self.config = config or RunConfig()
         self.logger = logging.getLogger(f"deep-research.{hash_txt(query)[:6]}")
-        self.ui = UIMonitor(Settings.OUTPUT_STYLE)
+        self.ui = UIMonitor(self.config.output_style)
         
         # Initialize components
-        self.analysis = AnalysisComponent(self.state, self.logger)
-        self.planning = PlanningComponent(self.state, self.analysis, self.logger)
-        self.actions = ActionComponent(self.state, self.analysis, self.logger)
-        self.synthesis = SynthesisComponent(self.state, self.analysis, self.logger)
+        self.analysis = AnalysisComponent(self.state, self.logger, self.config)
+        self.planning = PlanningComponent(self.state, self.analysis, self.logger, self.config)
+        self.actions = ActionComponent(self.state, self.analysis, self.logger, self.config, corpus=corpus)
+        self.synthesis = SynthesisComponent(self.state, self.analysis, self.logger, self.config)
+        if previous_report:
+            self.synthesis.previous_report = SynthesisComponent.parse_report(previous_report)
+        self.checkpointer = StateCheckpointer(checkpoint_dir) if checkpoint_dir else None
+        # Checkpoints are written off the event loop, one at a time.
+        self._checkpoint_lock = asyncio.Lock()
+        self.synthesis.on_section_complete = self._on_section_complete
+        self.event_sink = event_sink
+        self.narrate = self.config.output_style == 'summary' if narrate is None else narrate
+        self._background_tasks: Set["asyncio.Task[None]"] = set()
+        self._sections_finished = 0
+        self.report_cache, self.refresh = report_cache, refresh
+        self._cache_entry_replaced: Optional[str] = None
+        # Deadline, token and fetch limits of this run (see `RunConfig`); the clock starts in `run`.
+        self.budget = RunBudget.from_config(self.config)
+        # Timing spans of this run's phases and external calls, if tracing is on.
+        self.tracer = Tracer(self.state.query) if self.config.trace else None
+        # API calls, tokens, fetches and cache lookups of this run, by phase and call site.
+        self.metrics = MetricsRegistry()
         
         self.logger.info(f"--- Research-Engine v{SCRIPT_VERSION} initialized for query: '{self.state.query}' ---")
 
     async def run(self) -> str:
-        """Executes the entire research pipeline from start to finish."""
+        """Executes the entire research pipeline from start to finish, within the run budget."""
+        self.budget.started_at = time.monotonic()
+        ensure_loop_monitor()  # one per event loop, shared by every pipeline on it
+        # API helpers charge the budget, record metrics, add spans to the tracer and pick the model routes of the run whose task calls them.
+        token, trace_token, metrics_token = use_budget(self.budget), use_tracer(self.tracer), use_metrics(self.metrics)
+        routes_token = use_routes(self.config.model_routes)
+        try:
+            with span("run", query=self.state.query) as run_span:
+                report = await self._run()
+                run_span.set(cycles=self.state.cycles, sources=len(self.state.results), chunks=len(self.state.all_chunks))
+                return report
+        finally:
+            # Narration still pending is only for display; it must not outlive the run on any path.
+            for task in list(self._background_tasks): task.cancel()
+            reset_routes(routes_token)
+            reset_metrics(metrics_token)
+            reset_tracer(trace_token)
+            reset_budget(token)
+            if self.budget.limited:
+                self.logger.info(f"Run budget used: {self.budget.snapshot()}")
+            self._log_metrics()
+            self._export_trace()
+
+    async def _run(self) -> str:
         self.logger.info("--- Starting Research Pipeline ---")
         self.ui.start(self.state.query)
         
-        self.state.query_embedding = await a_embed(self.state.query)
+        is_warm_start = bool(self.state.outline)
+        self._emit("started", query=self.state.query, warm_start=is_warm_start, max_cycles=self.config.max_cycles)
+        if not self.state.query_embedding:
+            self.state.query_embedding = (await self.analysis.embedder.embed([self.state.query]))[0]
         if not self.state.query_embedding:
             self.logger.error("Could not embed initial query. Aborting.")
             return "Error: Could not process the initial query due to an embedding failure."
 
-        await self._initial_setup()
+        if self.report_cache is not None and not is_warm_start:
+            cached_report = self._check_report_cache()
+            if cached_report is not None:
+                self._emit("report", markdown=cached_report, metrics=self.metrics.summary())
+                return cached_report
+            is_warm_start = bool(self.state.outline)
+
+        if is_warm_start:
+            self.logger.info(f"Continuing from previous state: {len(self.state.outline)} outline topics, {len(self.state.all_chunks)} chunks, {self.state.cycles} cycles.")
+        else:
+            await self._initial_setup()
+            await self._checkpoint()
+
+        if self.state.phase == "synthesis":
+            self.logger.info(f"Resuming interrupted synthesis ({len(self.state.sections)} sections already written).")
+            self.ui.start_synthesis()
+            return await self._synthesise()
+        if self.state.phase == "done":
+            # A finished run: its research is complete, so only the report is rebuilt, reusing every
+            # section whose evidence is unchanged (all of them unless the outline was edited).
+            self.logger.info(f"Previous run already finished; re-synthesizing its report ({len(self.state.sections)} sections recorded).")
+            self.ui.start_synthesis()
+            return await self._synthesise()
         
-        main_progress = None
-        if Settings.OUTPUT_STYLE == 'progress':
-            main_progress = Progress(SpinnerColumn(), *Progress.get_default_columns(), BarColumn(), TextColumn("Research Cycles"), console=self.ui.console)
-            main_progress.start()
-            cycle_task = main_progress.add_task("cycles", total=Settings.MAX_CYCLES)
-
-        while self.state.cycles < Settings.MAX_CYCLES:
-            self.logger.info(f"--- Starting Agentic Cycle {self.state.cycles + 1}/{Settings.MAX_CYCLES} ---")
-            self.ui.update_cycle_start(self.state.cycles + 1, Settings.MAX_CYCLES)
+        self.ui.start_cycles(self.config.max_cycles)
+
+        while self.state.cycles < self.config.max_cycles:
+            if self._research_budget_spent(): break
+            if is_warm_start and self.analysis.check_diminishing_returns():
+                self.logger.info("Previous state had already reached diminishing returns. Skipping further research.")
+                break
+            self.logger.info(f"--- Starting Agentic Cycle {self.state.cycles + 1}/{self.config.max_cycles} ---")
+            self.ui.update_cycle_start(self.state.cycles + 1, self.config.max_cycles)
             
             self.ui.start_phase("Planning")
             await self.planning.plan_and_critique()
             self.ui.end_phase()
+            self._emit("plan", cycle=self.state.cycles + 1, critique=self.state.plan.get("critique"),
+                       thought=self.state.plan.get("thought"), actions=self.state.plan.get("plan", []))
 
             if not self.state.plan.get("plan"): 
                 self.logger.info("Planner has concluded the research. Moving to synthesis.")
@@ -80,18 +198,18 @@ class ResearchPipeline:
                                 "topic": new_topic,
                                 "subtopics": action.get("subtopics", [])
                             })
-                            if self.ui._is_active():
-                                self.ui.console.print(Panel(f"New research area added to outline: [bold cyan]{new_topic}[/bold cyan]", title="[bold yellow]🧬 Outline Evolved[/bold yellow]", border_style="yellow"))
+                            self.ui.show_outline_evolved(new_topic)
+                            self._emit("outline", outline=self.state.outline, added_topic=new_topic)
                         else:
                             self.logger.warning(f"Skipping request to add duplicate topic to outline: '{new_topic}'")
                 elif action_type == "SEARCH":
                     search_actions.append(action)
 
-            self.ui.show_agent_plan(await self.planning.generate_agent_summary())
+            if self.narrate: self._narrate_plan()
             
             if search_actions:
                 self.ui.start_phase("Executing Searches & Analyzing with HyDE")
-                newly_added_info, num_new_chunks = await self.actions.act(search_actions)
+                newly_added_info, num_new_chunks = await self._act(search_actions)
                 self.ui.end_phase()
                 self.ui.show_action_summary(newly_added_info, num_new_chunks)
             else:
@@ -99,22 +217,160 @@ class ResearchPipeline:
                 await asyncio.sleep(0.5)
 
             await self.analysis.update_information_gain()
-            
-            if main_progress: main_progress.update(cycle_task, advance=1)
+            self._emit("gain", cycle=self.state.cycles + 1,
+                       gain=float(self.state.information_gain_history[-1]) if self.state.information_gain_history else None,
+                       coverage={topic: history[-1] for topic, history in self.state.topic_coverage_history.items() if history})
+            if self.config.enable_speculative_synthesis and self.budget.pressure() < self.config.budget_degrade_fraction:
+                await self.synthesis.update_speculative_drafts(self.analysis.get_saturated_topics())
+
+            self.ui.advance_cycles()
 
             if self.analysis.check_diminishing_returns():
-                self.ui.show_diminishing_returns(np.mean(self.state.information_gain_history[-Settings.DIMINISHING_RETURNS_WINDOW:]))
+                await self._checkpoint()
+                self.ui.show_diminishing_returns(np.mean(self.state.information_gain_history[-self.config.diminishing_returns_window:]), self.config.diminishing_returns_threshold)
                 self.logger.info("Diminishing returns detected. Concluding research phase.")
                 break
 
             self.state.cycles += 1
-        
-        if main_progress: main_progress.stop()
+            await self._checkpoint()
+
+        self.ui.end_cycles()
         
         self.logger.info("--- Maximum cycles reached or stopping criteria met. Moving to Synthesis. ---")
         self.ui.start_synthesis()
-        return await self.synthesis.synthesise()
+        return await self._synthesise()
+
+    async def _synthesise(self) -> str:
+        """Runs synthesis and marks the state as done once the report is complete."""
+        self._emit("synthesis_started", sections=[block['topic'] for block in self.state.outline if block.get('topic')])
+        report = await self.synthesis.synthesise()
+        self.state.phase = "done"
+        await self._checkpoint()
+        self._store_in_report_cache(report)
+        # The report does not wait for pending narration.
+        for task in list(self._background_tasks): task.cancel()
+        self._emit("report", markdown=report, metrics=self.metrics.summary())
+        return report
+
+    def _log_metrics(self):
+        m = self.metrics.summary()
+        caches = ", ".join(f"{name} {c['hit_ratio']:.0%}" for name, c in m["caches"].items()) or "none"
+        self.logger.info(f"Run metrics: {m['chat']['calls']} chat calls ({m['chat']['prompt_tokens']} prompt + {m['chat']['completion_tokens']} completion tokens), "
+                         f"{m['embedding']['calls']} embedding calls ({m['embedding']['inputs']} inputs, {m['embedding']['tokens']} tokens), "
+                         f"{m['search']['requests']} searches, {m['fetch']['requests']} fetches ({m['fetch']['bytes']} bytes), "
+                         f"{m['retries']} retries; cache hit ratios: {caches}.")
+
+    def _export_trace(self):
+        """Writes the run's Chrome trace to `Settings.TRACE_DIR`, if tracing is on and the directory set."""
+        if self.tracer is None or not Settings.TRACE_DIR: return
+        try:
+            path = self.tracer.export_chrome_trace(Path(Settings.TRACE_DIR) / f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{hash_txt(self.state.query)[:8]}.json")
+            self.logger.info(f"Trace written to {path}")
+        except Exception as e:
+            self.logger.error(f"Failed to write trace to {Settings.TRACE_DIR}: {e}")
+
+    def _research_budget_spent(self) -> bool:
+        """True once the research share of the run budget is used; synthesis then starts from the evidence at hand."""
+        pressure = self.budget.pressure()
+        if pressure < self.config.budget_research_fraction: return False
+        self.logger.warning(f"{pressure:.0%} of the run budget used; concluding research with the evidence gathered so far.")
+        self._emit("budget", **self.budget.snapshot())
+        return True
+
+    def _check_report_cache(self) -> Optional[str]:
+        """
+        Looks the query up in the report cache.
 
+        Returns the cached report if a fresh near-duplicate exists and no refresh was requested.
+        Otherwise a match (stale, or refreshed on request) is loaded into the state as a warm
+        start -- its knowledge base and outline are kept, the cycle budget starts over -- and
+        None is returned.
+        """
+        try:
+            hit = self.report_cache.lookup(self.state.query_embedding, self.analysis.embedding_space)
+            if hit is None: return None
+            if self.report_cache.is_fresh(hit) and not self.refresh:
+                self.logger.info(f"Serving cached report for '{hit.query}' (similarity {hit.similarity:.3f}, {hit.age / 3600:.1f}h old).")
+                self._emit("cache_hit", cached_query=hit.query, similarity=hit.similarity, age_seconds=hit.age)
+                return hit.read_report()
+            cached_state, cached_report = hit.load_state(), hit.read_report()
+        except Exception as e:
+            self.logger.warning(f"Report cache lookup failed ({e}); researching from scratch.")
+            return None
+
+        query, query_embedding = self.state.query, self.state.query_embedding
+        self.state.adopt(cached_state)
+        self.state.query, self.state.query_embedding = query, query_embedding
+        self.state.phase, self.state.cycles, self.state.information_gain_history = "research", 1, []
+        self.synthesis.previous_report = SynthesisComponent.parse_report(cached_report)
+        self._cache_entry_replaced = hit.id
+        reason = "refresh requested" if self.refresh else "cached report expired"
+        self.logger.info(f"Warm-starting from cached research for '{hit.query}' ({reason}; {len(self.state.all_chunks)} chunks).")
+        self._emit("cache_warm_start", cached_query=hit.query, similarity=hit.similarity, age_seconds=hit.age, reason=reason)
+        return None
+
+    def _store_in_report_cache(self, report: str):
+        """Adds a finished report and its state to the report cache. Failures are logged, never fatal."""
+        if self.report_cache is None or is_failed_report(report): return
+        if failed := count_failed_sections(report):
+            # A cached report is served as-is until it expires, so a transient failure would stick.
+            self.logger.warning(f"Not caching the report: {failed} section(s) failed to synthesize.")
+            return
+        try:
+            self.report_cache.store(self.state.query, self.state.query_embedding, self.analysis.embedding_space, report,
+                                    self.state, replaces=self._cache_entry_replaced)
+        except Exception as e:
+            self.logger.error(f"Failed to store report in cache at {self.report_cache.path}: {e}")
+
+    async def _act(self, search_actions):
+        """Runs the action phase, reporting the searches issued and the sources they added."""
+        self._emit("searches", cycle=self.state.cycles + 1, queries=[action.get('query') for action in search_actions if action.get('query')])
+        newly_added_info, num_new_chunks = await self.actions.act(search_actions)
+        self._emit("sources", cycle=self.state.cycles + 1, added={query: titles for query, titles in newly_added_info.items() if titles},
+                   new_chunks=num_new_chunks, total_sources=len(self.state.results), total_chunks=len(self.state.all_chunks))
+        return newly_added_info, num_new_chunks
+
+    def _emit(self, event_type: str, **data):
+        """Sends a progress event to the event sink, if any. A failing sink never breaks the run."""
+        if self.event_sink is None: return
+        try:
+            self.event_sink({"type": event_type, "time": time.time(), **data})
+        except Exception as e:
+            self.logger.warning(f"Event sink failed on '{event_type}' event: {e}")
+
+    def _narrate_plan(self):
+        """Summarizes the current plan for humans in the background; the research loop never waits for it."""
+        cycle, plan = self.state.cycles + 1, self.state.plan
+        async def narrate():
+            summary = await self.planning.generate_agent_summary(plan)
+            self.ui.show_agent_plan(summary)
+            self._emit("narration", cycle=cycle, text=summary)
+        task = asyncio.create_task(narrate())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _on_section_complete(self, block: Dict[str, Any], text: str):
+        """Streams every finished section to the caller and checkpoints after it."""
+        self._sections_finished += 1
+        self._emit("section", topic=block['topic'], markdown=text, citations=self.synthesis._citation_map(text),
+                   index=self._sections_finished, total=len([b for b in self.state.outline if b.get('topic')]))
+        await self._checkpoint()
+
+    async def _checkpoint(self):
+        """
+        Checkpoints the state if checkpointing is enabled. Failures are logged, never fatal.
+
+        A snapshot of the state taken once the previous save has finished is written in a
+        worker thread, so sections still being synthesized keep running meanwhile.
+        """
+        if not self.checkpointer: return
+        try:
+            async with self._checkpoint_lock:
+                await asyncio.to_thread(self.checkpointer.save, self.state.snapshot())
+        except Exception as e:
+            self.logger.error(f"Failed to checkpoint research state to {self.checkpointer.path}: {e}")
+
+    @traced("setup")
     async def _initial_setup(self):
         """Performs the initial search and outline drafting."""
         self.logger.info("--- Performing Initial Setup ---")
@@ -124,7 +380,7 @@ class ResearchPipeline:
         initial_plan_actions = [{"action": "SEARCH", "query": q, "target_outline_topic": self.state.query} for q in boot_queries]
         self.state.plan = {"plan": initial_plan_actions, "thought": "Initial exploratory search.", "critique": "N/A for initial setup."}
         
-        newly_added_info, num_new_chunks = await self.actions.act(initial_plan_actions)
+        newly_added_info, num_new_chunks = await self._act(initial_plan_actions)
         self.state.outline = await self.planning.draft_outline()
         self.logger.info(f"Drafted outline with {len(self.state.outline)} main topics.")
         if not self.state.outline or not any(item.get('topic') for item in self.state.outline):
@@ -132,18 +388,92 @@ class ResearchPipeline:
             self.state.outline = [{"topic": self.state.query, "subtopics": []}]
 
         self.state.cycles = 1 
+        self._emit("outline", outline=self.state.outline)
         
         self.ui.end_phase()
         self.ui.show_action_summary(newly_added_info, num_new_chunks)
 
 # WHAT: The public API function is moved here from main.py.
 # WHY: This function is the primary entry point for using the pipeline. Placing it here alongside the ResearchPipeline class is more logical and makes the package's structure cleaner.
-async def run_deep_research(query: str, output_style: str = "summary") -> str:
+async def run_deep_research(query: str, output_style: Optional[str] = None, previous_state: Optional[ResearchState] = None, previous_report: Optional[str] = None,
+                            checkpoint_dir: Optional[str] = None, resume: bool = False, config: Optional[RunConfig] = None,
+                            use_cache: bool = True, refresh: bool = False) -> str:
     """
     Public API function to run the deep research process.
     Returns a Markdown report as a string.
+
+    Pass a previous run's state (and report) to regenerate the report incrementally;
+    see `ResearchPipeline`. With `checkpoint_dir` the run is checkpointed after every
+    step, and `resume=True` continues from the checkpoint found there, if any.
+
+    `config` sets up this run only (see `RunConfig`); `output_style`, if given, overrides its
+    output style. Nothing process-global is modified, so runs may execute concurrently.
+
+    If `Settings.REPORT_CACHE_DIR` is set and `use_cache` is true, near-duplicate questions are
+    answered from the report cache; `refresh=True` re-researches them from the cached state.
+    With `Settings.CORPUS_DIR` set, pages processed by earlier runs are reused as evidence.
     """
-    Settings.OUTPUT_STYLE = output_style
-    engine = ResearchPipeline(query)
+    config = config or RunConfig()
+    if output_style:
+        config = dataclasses.replace(config, output_style=output_style)
+    if resume and checkpoint_dir and previous_state is None and (Path(checkpoint_dir) / STATE_FILE).exists():
+        previous_state = load_state(checkpoint_dir)
+    engine = ResearchPipeline(query, previous_state=previous_state, previous_report=previous_report, checkpoint_dir=checkpoint_dir, config=config,
+                              report_cache=default_report_cache() if use_cache else None, refresh=refresh, corpus=default_corpus())
     report = await engine.run()
-    return report        
\ No newline at end of file
+    return report        
+
+async def stream_deep_research(query: str, config: Optional[RunConfig] = None, narrate: bool = False,
+                               previous_state: Optional[ResearchState] = None, previous_report: Optional[str] = None,
+                               checkpoint_dir: Optional[str] = None, use_cache: bool = True, refresh: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs the research process and yields structured progress events as they happen.
+
+    Every event is a dict with `type` and `time` plus type-specific fields:
+        started            query, warm_start, max_cycles
+        outline            outline (and added_topic when the planner extends it)
+        plan               cycle, critique, thought, actions
+        narration          cycle, text -- only with `narrate=True`; generated in the background
+        searches           cycle, queries
+        sources            cycle, added ({query: [titles]}), new_chunks, total_sources, total_chunks
+        gain               cycle, gain, coverage ({topic: score})
+        synthesis_started  sections
+        section            topic, markdown (with [n] citations), citations ({n: url}), index, total
+        cache_hit          cached_query, similarity, age_seconds -- the report is served from the report cache
+        cache_warm_start   cached_query, similarity, age_seconds, reason -- research resumes from a cached run
+        budget             elapsed_seconds, chat_tokens, fetches, ... and their limits, pressure -- research
+                           was cut short by the run budget (see `RunConfig.deadline_seconds` and friends)
+        report             markdown, metrics (API calls, tokens, fetches, latencies and cache hit ratios of the
+                           run, by phase and call site; see `agent_metrics.MetricsRegistry.summary`) -- always the last event
+
+    Sections are yielded as soon as each is written, well before the full report. Closing the
+    generator early cancels the run. By default the rich console UI is off (`output_style='detailed'`).
+    """
+    config = config or RunConfig(output_style="detailed")
+    events: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    engine = ResearchPipeline(query, previous_state=previous_state, previous_report=previous_report, checkpoint_dir=checkpoint_dir,
+                              config=config, event_sink=events.put_nowait, narrate=narrate,
+                              report_cache=default_report_cache() if use_cache else None, refresh=refresh, corpus=default_corpus())
+    run_task = asyncio.create_task(engine.run())
+    report_sent = False
+    try:
+        while True:
+            next_event = asyncio.ensure_future(events.get())
+            await asyncio.wait({next_event, run_task}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                next_event.cancel()
+                break
+            event = next_event.result()
+            report_sent = report_sent or event["type"] == "report"
+            yield event
+        while not events.empty():
+            event = events.get_nowait()
+            report_sent = report_sent or event["type"] == "report"
+            yield event
+        report = run_task.result()  # re-raises a failed run
+        if not report_sent:  # runs that stop early (e.g. the query could not be embedded) still end with a report
+            yield {"type": "report", "time": time.time(), "markdown": report}
+    finally:
+        if not run_task.done():
+            run_task.cancel()
+            await asyncio.gather(run_task, return_exceptions=True)
@@ -1,14 +1,16 @@
 # research/planning.py
-import asyncio
 import json
 import logging
 import re
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 import numpy as np
 
-from agent_config import PROMPTS, Settings
+from agent_budget import budget_pressure
+from agent_config import PROMPTS, RunConfig
 from agent_helpers import a_chat, cosine_similarity, extract_json_from_response
+from agent_tracing import traced
+from research.packing import pack_excerpts
 
 # Forward declarations for type hinting
 class ResearchState:
@@ -26,16 +28,17 @@ class PlanningComponent:
     generating search queries, and iteratively refining the research plan based
     on the current state, coverage analysis, and discovered latent topics.
     """
-    def __init__(self, state: 'ResearchState', analysis: 'AnalysisComponent', logger: logging.Logger):
+    def __init__(self, state: 'ResearchState', analysis: 'AnalysisComponent', logger: logging.Logger, config: RunConfig):
         self.state = state
         self.analysis = analysis
         self.logger = logger
+        self.config = config
 
     async def generate_queries(self, topic: str, count: int, purpose: str) -> List[str]:
         """Generates a specified number of search queries for a given topic and purpose."""
         prompt = [{"role": "system", "content": f"You are a research expert. Generate {count} {purpose}. Return a JSON list of strings."},
                   {"role": "user", "content": topic}]
-        raw = await a_chat(prompt, max_tokens=384)
+        raw = await a_chat(prompt, model=self.config.chat_model, max_tokens=384, task="queries")
         try: 
             match = re.search(r"\[.*?\]", raw, re.DOTALL)
             if match:
@@ -48,17 +51,20 @@ class PlanningComponent:
             self.logger.warning(f"Could not parse queries as JSON: {raw}. Falling back to line splitting.")
             return [l.strip("-•* ") for l in raw.splitlines() if l.strip()][:count]
 
+    @traced("outline")
     async def draft_outline(self) -> List[Dict[str, Any]]:
         """Drafts the initial research outline based on the first set of collected chunks."""
         if not self.state.all_chunks:
             self.logger.warning("No chunks available to draft outline. Using default query as single topic.")
             return [{"topic": self.state.query, "subtopics": []}]
         
-        ctx = "\n\n".join(c[0] for c in self.state.all_chunks[:50]) 
+        # Chunks are stored best-first by the action phase, so earlier chunks get the higher packing score.
+        excerpts = [{'text': chunk_text, 'score': -i} for i, (chunk_text, _) in enumerate(self.state.all_chunks[:50])]
+        ctx, _ = pack_excerpts(excerpts, self.config.outline_context_tokens, self.config.chat_model)
         prompt = [{"role": "system", "content": PROMPTS.OUTLINE_DRAFTER},
-                  {"role": "user", "content": f"User's Question: {self.state.query}\n\nContext:\n{ctx[:Settings.MAX_ABSTRACT_CONTEXT_CHARS]}"}] 
+                  {"role": "user", "content": f"User's Question: {self.state.query}\n\nContext:\n{ctx}"}]
         
-        raw_response = await a_chat(prompt, max_tokens=1536) 
+        raw_response = await a_chat(prompt, model=self.config.chat_model, max_tokens=1536, task="outline") 
         
         json_to_parse = extract_json_from_response(raw_response)
         if not json_to_parse:
@@ -93,15 +99,18 @@ class PlanningComponent:
             self.logger.error(f"Failed to draft outline: {e}. Extracted JSON string attempt: >>>{json_to_parse}<<< . Raw response: {raw_response}. Using default.")
             return [{"topic": self.state.query, "subtopics": []}]
 
+    @traced("planning")
     async def plan_and_critique(self):
         """The core planning step that uses the current state to generate the next plan."""
         self.logger.info("--- Agent Step: Planning & Critiquing ---")
         _, coverage_summary = await self.analysis.calculate_topic_coverage()
-        previous_queries = list(set(res['query'] for res in self.state.results if 'reflexion' not in res.get('query', '')))
+        previous_queries = list(dict.fromkeys(res['query'] for res in self.state.results if 'reflexion' not in res.get('query', '')))
         gain_trend = self.analysis.get_gain_trend_description()
         
         latent_topics_summary = "Not run."
-        if Settings.ENABLE_EXPLORATION:
+        if self.config.enable_exploration and budget_pressure() >= self.config.budget_degrade_fraction:
+            self.logger.info("Skipping latent topic discovery to stay within the run budget.")
+        elif self.config.enable_exploration:
             self.logger.info("Exploration enabled. Discovering latent topics...")
             latent_topics = await self.analysis.get_latent_topics()
             if latent_topics:
@@ -109,7 +118,7 @@ class PlanningComponent:
                 outline_topic_texts = [t.get('topic') for t in self.state.outline if isinstance(t, dict) and t.get('topic')]
                 
                 if outline_topic_texts:
-                    hyde_docs_for_outline = await asyncio.gather(*(self.analysis._generate_hypothetical_document(ot) for ot in outline_topic_texts))
+                    hyde_docs_for_outline = await self.analysis.generate_hypothetical_documents(outline_topic_texts)
                     latent_topic_embs_list = await self.analysis._embed_texts_with_cache(latent_topic_labels)
                     outline_topic_embs_list = await self.analysis._embed_texts_with_cache(hyde_docs_for_outline)
                     
@@ -144,7 +153,7 @@ class PlanningComponent:
         Previously Executed Search Queries (last 5): {json.dumps(previous_queries[-5:], indent=2)}
         """
         prompt = [{"role": "system", "content": PROMPTS.PLANNER_CRITIC}, {"role": "user", "content": state_summary}]
-        raw_response = await a_chat(prompt, temp=0.2, max_tokens=1024)
+        raw_response = await a_chat(prompt, model=self.config.chat_model, temp=0.2, max_tokens=1024, task="plan")
         
         json_to_parse = extract_json_from_response(raw_response)
         if not json_to_parse:
@@ -173,11 +182,12 @@ class PlanningComponent:
             self.logger.error(f"Failed to parse Planner/Critic response: {e}. Extracted JSON string attempt: >>>{json_to_parse}<<< . Original Raw: {raw_response}")
             self.state.plan = {"critique": f"Error: {e} during JSON parsing.", "thought": "Failed to generate a valid plan due to parsing error.", "plan": []}
 
-    async def generate_agent_summary(self) -> str:
-        """Generates a human-readable summary of the agent's current plan."""
-        if not self.state.plan: return "No plan available."
-        thought = self.state.plan.get("thought", "N/A")
-        plan_actions = self.state.plan.get("plan", [])
+    async def generate_agent_summary(self, plan: Optional[Dict[str, Any]] = None) -> str:
+        """Generates a human-readable summary of the given plan (by default, the agent's current one)."""
+        plan = plan if plan is not None else self.state.plan
+        if not plan: return "No plan available."
+        thought = plan.get("thought", "N/A")
+        plan_actions = plan.get("plan", [])
         if not plan_actions: return "Research is complete. Preparing to write the final report."
         
         action_summaries = []
@@ -190,5 +200,5 @@ class PlanningComponent:
 
         summary_context = f"Agent's Thought Process: {thought}\nNext Actions: {'; '.join(action_summaries)}"
         prompt = [{"role": "system", "content": PROMPTS.AGENT_SUMMARY},{"role": "user", "content": summary_context}]
-        summary = await a_chat(prompt, model=Settings.AGENT_SUMMARY_MODEL, temp=0.3, max_tokens=256)
+        summary = await a_chat(prompt, model=self.config.agent_summary_model, temp=0.3, max_tokens=256, task="agent_summary")
         return summary.strip()
\ No newline at end of file
@@ -0,0 +1,130 @@
+# research/report_cache.py
+import json
+import logging
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from agent_config import Settings
+from agent_helpers import normalize_rows
+from research.persistence import _atomic_save_matrix, _atomic_write_text, load_state, save_state
+from research.state import ResearchState
+
+log = logging.getLogger("deep-research.report-cache")
+
+INDEX_FILE = "index.json"
+EMBEDDINGS_FILE = "query-embeddings.npy"
+REPORT_FILE = "report.md"
+STATE_DIR = "state"
+
+
+@dataclass
+class CachedReport:
+    """An entry of the report cache matched against a query."""
+    id: str
+    query: str
+    created_at: float
+    similarity: float
+    path: Path
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+    def read_report(self) -> str:
+        return (self.path / REPORT_FILE).read_text(encoding="utf-8")
+
+    def load_state(self) -> ResearchState:
+        return load_state(self.path / STATE_DIR)
+
+
+class ReportCache:
+    """
+    Report-level cache keyed by query embedding.
+
+    A query matches a cached entry when the cosine similarity of their embeddings (made with the
+    same embedding deployment) reaches `similarity_threshold`, so paraphrased questions hit the
+    same entry. Entries younger than `ttl_seconds` are served as-is; older ones, or any entry when
+    a refresh is requested, are used as a warm start: their research state seeds the new run.
+
+    Layout:
+        index.json                metadata of every entry, in insertion order
+        query-embeddings.npy      float32 query embeddings, one row per entry
+        <id>/report.md            the Markdown report
+        <id>/state/               the research state (see `research.persistence`)
+    """
+    def __init__(self, directory: Union[str, Path], similarity_threshold: Optional[float] = None,
+                 ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        self.path = Path(directory)
+        self.similarity_threshold = similarity_threshold or Settings.REPORT_CACHE_SIMILARITY
+        self.ttl_seconds = Settings.REPORT_CACHE_TTL_HOURS * 3600 if ttl_seconds is None else ttl_seconds
+        self.max_entries = max_entries or Settings.REPORT_CACHE_MAX_ENTRIES
+        self.entries: List[Dict[str, Any]] = []
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self._load_index()
+
+    def lookup(self, query_embedding: List[float], embedding_model: Optional[str]) -> Optional[CachedReport]:
+        """Returns the most similar cached entry above the threshold (fresh or not), or None."""
+        self._load_index()
+        rows = [i for i, entry in enumerate(self.entries) if entry.get("embedding_model") == embedding_model]
+        if not rows or not query_embedding or self.embeddings.shape[1] != len(query_embedding): return None
+        sims = self.embeddings[rows] @ normalize_rows(query_embedding)[0]
+        best = int(np.argmax(sims))
+        if sims[best] < self.similarity_threshold: return None
+        entry = self.entries[rows[best]]
+        return CachedReport(id=entry["id"], query=entry["query"], created_at=entry["created_at"],
+                            similarity=float(sims[best]), path=self.path / entry["id"])
+
+    def is_fresh(self, cached: CachedReport) -> bool:
+        return cached.age <= self.ttl_seconds
+
+    def store(self, query: str, query_embedding: List[float], embedding_model: Optional[str], report: str,
+              state: ResearchState, replaces: Optional[str] = None) -> CachedReport:
+        """Adds a finished run to the cache, replacing entry `replaces` (e.g. the one a refresh started from)."""
+        self._load_index()  # pick up entries written by other processes since our last read
+        entry_id = uuid.uuid4().hex[:12]
+        entry_dir = self.path / entry_id
+        save_state(state, entry_dir / STATE_DIR)
+        _atomic_write_text(entry_dir / REPORT_FILE, report)
+
+        # Rows must share one width, so entries made with a different-sized embedding are dropped.
+        same_width = self.embeddings.shape[1] == len(query_embedding)
+        keep = [i for i, entry in enumerate(self.entries) if entry["id"] != replaces and same_width]
+        dropped = [self.entries[i]["id"] for i in range(len(self.entries)) if i not in set(keep)]
+        if len(keep) >= self.max_entries:
+            dropped += [self.entries[i]["id"] for i in keep[:len(keep) - self.max_entries + 1]]
+            keep = keep[len(keep) - self.max_entries + 1:]
+        entries = [self.entries[i] for i in keep]
+        embeddings = [row for row in self.embeddings[keep]] if keep else []
+        entries.append({"id": entry_id, "query": query, "created_at": time.time(), "embedding_model": embedding_model})
+        embeddings.append(normalize_rows(query_embedding)[0])
+
+        _atomic_save_matrix(self.path / EMBEDDINGS_FILE, embeddings)
+        _atomic_write_text(self.path / INDEX_FILE, json.dumps({"entries": entries}, ensure_ascii=False, indent=1))
+        self.entries, self.embeddings = entries, np.asarray(embeddings, dtype=np.float32)
+        for old_id in dropped:
+            shutil.rmtree(self.path / old_id, ignore_errors=True)
+        log.info(f"Cached report for '{query}' as {entry_id} ({len(self.entries)} entries).")
+        return CachedReport(id=entry_id, query=query, created_at=entries[-1]["created_at"], similarity=1.0, path=entry_dir)
+
+    def _load_index(self):
+        index_path = self.path / INDEX_FILE
+        if not index_path.exists(): return
+        entries = json.loads(index_path.read_text(encoding="utf-8")).get("entries", [])
+        embeddings = np.load(self.path / EMBEDDINGS_FILE) if entries else np.zeros((0, 0), dtype=np.float32)
+        if len(embeddings) != len(entries):
+            log.warning(f"Report cache index in {self.path} is inconsistent; ignoring it.")
+            return
+        self.entries, self.embeddings = entries, embeddings
+
+
+@lru_cache(maxsize=1)
+def default_report_cache() -> Optional[ReportCache]:
+    """The process-wide report cache at `Settings.REPORT_CACHE_DIR`, or None if caching is disabled."""
+    return ReportCache(Settings.REPORT_CACHE_DIR) if Settings.REPORT_CACHE_DIR else None
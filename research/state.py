@@ -1,9 +1,13 @@
 # research/state.py
-from dataclasses import dataclass, field
+import copy
+import threading
+from dataclasses import dataclass, field, fields
 from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 
+from agent_helpers import hash_txt
+
 
 @dataclass
 class ResearchState:
@@ -16,6 +20,7 @@ class ResearchState:
     """
     query: str
     query_embedding: Optional[List[float]] = None
+    phase: str = "research"  # 'research', 'synthesis' or 'done'; lets a resumed run continue at the right step
     cycles: int = 0
     outline: List[Dict[str, Any]] = field(default_factory=list)
     plan: Dict[str, Any] = field(default_factory=dict)
@@ -25,4 +30,80 @@ class ResearchState:
     results: List[Dict[str, Any]] = field(default_factory=list)
     all_chunks: List[Tuple[str, int]] = field(default_factory=list)
     chunk_embedding_cache: Dict[str, List[float]] = field(default_factory=dict)
-    url_to_source_index: Dict[str, int] = field(default_factory=dict)
\ No newline at end of file
+    url_to_source_index: Dict[str, int] = field(default_factory=dict)
+    topic_coverage_history: Dict[str, List[float]] = field(default_factory=dict)
+    section_query_embeddings: Dict[str, List[float]] = field(default_factory=dict)
+    # topic -> {'block', 'evidence' (sorted chunk ids), 'citations' ({"n": url}), 'text'} for finished sections.
+    sections: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # Title and abstract of the last report; reused when every section is.
+    title: Optional[str] = None
+    abstract: Optional[str] = None
+    # Guards source registration and chunk commits. Held only for in-memory bookkeeping,
+    # never across I/O, so concurrent sections don't serialize on network round trips.
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Locks cannot be pickled or deep-copied; a copy gets a fresh one.
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def adopt(self, other: "ResearchState"):
+        """Replaces this state's contents with `other`'s in place, so components holding it see the change."""
+        with self._lock:
+            for f in fields(self):
+                if f.name != "_lock": setattr(self, f.name, getattr(other, f.name))
+
+    def snapshot(self) -> "ResearchState":
+        """
+        A copy of the state that stays consistent while this one keeps changing, e.g. for a
+        checkpoint written on another thread. The large append-only containers are copied
+        shallowly (their items are never mutated), everything else deeply.
+        """
+        snapshot = copy.copy(self)
+        with self._lock:
+            for name in ("all_chunks", "results", "chunk_embedding_cache", "url_to_source_index", "section_query_embeddings"):
+                setattr(snapshot, name, copy.copy(getattr(self, name)))
+        for name in ("outline", "plan", "critique_history", "information_gain_history", "last_coverage_vector",
+                     "topic_coverage_history", "sections"):
+            setattr(snapshot, name, copy.deepcopy(getattr(self, name)))
+        return snapshot
+
+    def reserve_source(self, url: str, title: str, query: str) -> Optional[int]:
+        """
+        Atomically registers a new source and returns its index.
+
+        Returns None if the URL was already registered (e.g. by a concurrent section),
+        in which case the caller should not add chunks for it.
+        """
+        with self._lock:
+            if url in self.url_to_source_index: return None
+            source_idx = len(self.results)
+            self.results.append({"url": url, "title": title, "query": query})
+            self.url_to_source_index[url] = source_idx
+            return source_idx
+
+    def commit_chunks(self, chunks: List[Tuple[str, int, List[float]]]) -> int:
+        """
+        Atomically adds embedded chunks to the knowledge base.
+
+        Args:
+            chunks: (chunk_text, source_idx, embedding) tuples; chunks whose text is
+                    already in the knowledge base are skipped.
+
+        Returns:
+            The number of chunks actually added.
+        """
+        added = 0
+        with self._lock:
+            for chunk_text, source_idx, chunk_emb in chunks:
+                chunk_hash = hash_txt(chunk_text)
+                if not chunk_emb or chunk_hash in self.chunk_embedding_cache: continue
+                self.all_chunks.append((chunk_text, source_idx))
+                self.chunk_embedding_cache[chunk_hash] = chunk_emb
+                added += 1
+        return added
@@ -3,16 +3,54 @@ import asyncio
 import json
 import logging
 import re
-from typing import Any, Dict, List, Set, Tuple
+from typing import (Any, Awaitable, Callable, Dict, FrozenSet, List, Optional,
+                    Set, Tuple)
 
 import numpy as np
 
-from agent_config import PROMPTS, Settings
+from agent_budget import budget_pressure, reserve_fetches
+from agent_config import PROMPTS, RunConfig
+from agent_executor import run_cpu
 # WHAT: Added `extract_json_from_response` to the list of imported helper functions.
 # WHY: This function is called within the `_reflexion_pass` method to parse JSON from the LLM's review response. It was missing from the import list, causing the `NameError` you observed.
-from agent_helpers import (a_chat, a_embed, extract_json_from_response,
-                           fetch_clean, hash_txt, searx_search,
+from agent_helpers import (a_chat, cosine_matrix,
+                           extract_json_from_response, fetch_clean, hash_txt,
+                           mmr_select, normalize_rows, searx_search,
                            sentence_chunks)
+from agent_tracing import traced
+from research.packing import pack_excerpts, truncate_to_tokens
+
+# Text of a section whose synthesis call failed; such sections are never reused or cached.
+FAILED_SECTION_PREFIX = "Failed to synthesize section:"
+
+_FAILED_SECTION_LINE = re.compile(rf"^{re.escape(FAILED_SECTION_PREFIX)}", re.MULTILINE)
+
+def is_failed_section(text: str) -> bool:
+    return text.startswith(FAILED_SECTION_PREFIX)
+
+def count_failed_sections(report_md: str) -> int:
+    """Number of sections of a report whose synthesis failed."""
+    return len(_FAILED_SECTION_LINE.findall(report_md))
+
+def _mmr_rank(query_embs: List[List[float]], kb_embs: List[List[float]], top_k: int, candidate_pool: int,
+              mmr_lambda: float) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    MMR-selects up to `top_k` knowledge-base rows per query from its `top_k * candidate_pool`
+    most similar ones. Returns (row indices, similarities) per query. CPU-bound; runs in the
+    compute executor.
+    """
+    kb_matrix = normalize_rows(kb_embs)
+    similarity_matrix = normalize_rows(query_embs) @ kb_matrix.T  # (sections, chunks)
+    pool_size = min(len(kb_matrix), top_k * candidate_pool)
+    ranked = []
+    for sims in similarity_matrix:
+        if pool_size < len(sims):
+            pool = np.argpartition(-sims, pool_size - 1)[:pool_size]
+        else:
+            pool = np.arange(len(sims))
+        picked = pool[mmr_select(sims[pool], kb_matrix[pool], top_k, mmr_lambda)]
+        ranked.append((picked, sims[picked]))
+    return ranked
 
 # Forward declarations for type hinting
 class ResearchState:
@@ -31,36 +69,196 @@ class SynthesisComponent:
     It includes a self-correction (reflexion) mechanism to improve section quality
     and automatically generates a bibliography.
     """
-    def __init__(self, state: 'ResearchState', analysis: 'AnalysisComponent', logger: logging.Logger):
+    def __init__(self, state: 'ResearchState', analysis: 'AnalysisComponent', logger: logging.Logger, config: RunConfig):
         self.state = state
         self.analysis = analysis
         self.logger = logger
-        self.source_lock = asyncio.Lock()
-
+        self.config = config
+        # topic -> {'block', 'evidence' (frozenset of chunk ids), 'task'} for sections drafted during research.
+        self.speculative_drafts: Dict[str, Dict[str, Any]] = {}
+        # Parsed previous report (see `parse_report`) whose unchanged sections are reused verbatim.
+        self.previous_report: Dict[str, Any] = {}
+        # Awaited with (block, text) after every finished section so the pipeline can checkpoint and stream it.
+        self.on_section_complete: Optional[Callable[[Dict[str, Any], str], Awaitable[None]]] = None
+        # Chunks retrieved per section; halved when synthesis starts with the run budget exhausted.
+        self.context_top_k = config.top_k_results_per_section
+
+    @traced("synthesis")
     async def synthesise(self) -> str:
         """Top-level method to generate the full research report."""
         if not self.state.outline or not any(item.get('topic') for item in self.state.outline):
             self.logger.error("Cannot synthesize report: Outline is empty or invalid.")
             return "# Report Generation Failed\n\nThe research outline could not be generated. Please try a different query or check logs."
 
-        section_tasks = [self._synthesise_section_with_citations(block) for block in self.state.outline if block.get('topic')]
+        # Sections recorded by an interrupted synthesis of this same run are trusted as-is on resume.
+        resuming = self.state.phase == "synthesis"
+        self.state.phase = "synthesis"
+        if budget_pressure() >= 1.0:
+            self.context_top_k = max(1, self.config.top_k_results_per_section // 2)
+            self.logger.warning(f"Run budget exhausted; writing sections from {self.context_top_k} chunks each, without reflexion.")
+        valid_outline_blocks = [block for block in self.state.outline if block.get('topic')]
+        section_contexts = await self._retrieve_section_contexts(valid_outline_blocks)
+        section_tasks, num_reused = [], 0
+        for block, chunks in zip(valid_outline_blocks, section_contexts):
+            previous_text = self._reusable_previous_section(block, chunks, trust_recorded=resuming)
+            if previous_text is not None:
+                num_reused += 1
+                section_tasks.append(self._finish_section(block, chunks, asyncio.sleep(0, result=previous_text)))
+                continue
+            draft_task = self._reusable_speculative_draft(block, chunks)
+            section = self._draft_or_synthesis(block, chunks, draft_task) if draft_task else self._synthesise_section_with_citations(block, chunks)
+            section_tasks.append(self._finish_section(block, chunks, section))
         section_texts = await asyncio.gather(*section_tasks)
-        
+        self.cancel_speculative_drafts()
+        if num_reused:
+            self.logger.info(f"Reused {num_reused}/{len(valid_outline_blocks)} sections from the previous run.")
+        # Reflexion may have grown the knowledge base, so evidence is recorded against the final one.
+        # Every embedding is cached by now, making this a pure matrix operation.
+        final_contexts = await self._retrieve_section_contexts(valid_outline_blocks)
+        for block, chunks, text in zip(valid_outline_blocks, final_contexts, section_texts):
+            self._record_section(block, chunks, text)
+
         section_md_parts = []
-        valid_outline_blocks = [block for block in self.state.outline if block.get('topic')]
         for i, text in enumerate(section_texts):
             if i < len(valid_outline_blocks):
                  section_md_parts.append(f"## {valid_outline_blocks[i]['topic']}\n\n{text}")
         section_md = "\n\n".join(section_md_parts)
 
-        title_task = a_chat([{"role": "system", "content": "Create a concise, formal research report title for a report on the following topic. The title should be engaging and accurately reflect the core subject."}, {"role": "user", "content": self.state.query}], max_tokens=64, temp=0.3)
-        abstract_task = a_chat([{"role": "system", "content": "Write a 200-250 word academic abstract for the report. Summarize the key findings and conclusions based on the provided section content."}, {"role": "user", "content": section_md[:Settings.MAX_ABSTRACT_CONTEXT_CHARS]}], max_tokens=400, temp=0.3)
+        # With every section reused the report's content is unchanged, so are its title and abstract.
+        previous_title = self.previous_report.get('title') or self.state.title
+        previous_abstract = self.previous_report.get('abstract') or self.state.abstract
+        if num_reused == len(valid_outline_blocks) and previous_title and previous_abstract:
+            self.state.title, self.state.abstract = previous_title, previous_abstract
+            bibliography = self._make_bibliography(section_md)
+            return f"# {previous_title}\n\n## Abstract\n\n{previous_abstract}\n\n{section_md}\n\n{bibliography}"
+
+        title_task = a_chat([{"role": "system", "content": "Create a concise, formal research report title for a report on the following topic. The title should be engaging and accurately reflect the core subject."}, {"role": "user", "content": self.state.query}], model=self.config.chat_model, max_tokens=64, temp=0.3, task="title")
+        abstract_task = a_chat([{"role": "system", "content": "Write a 200-250 word academic abstract for the report. Summarize the key findings and conclusions based on the provided section content."}, {"role": "user", "content": truncate_to_tokens(section_md, self.config.abstract_context_tokens, self.config.chat_model)}], model=self.config.chat_model, max_tokens=400, temp=0.3, task="abstract")
         
         title, abstract = await asyncio.gather(title_task, abstract_task)
+        # A failed call's error text is not worth keeping; the next synthesis asks again.
+        self.state.title, self.state.abstract = (title, abstract) if not (title.startswith("Error:") or abstract.startswith("Error:")) else (None, None)
         
         bibliography = self._make_bibliography(section_md)
         return f"# {title}\n\n## Abstract\n\n{abstract}\n\n{section_md}\n\n{bibliography}"
 
+    @staticmethod
+    def parse_report(report_md: str) -> Dict[str, Any]:
+        """
+        Splits a report produced by `synthesise` back into its parts.
+
+        Returns a dict with `title`, `abstract` and `sections` (topic -> section text).
+        """
+        parsed: Dict[str, Any] = {'title': None, 'abstract': None, 'sections': {}}
+        title_match = re.match(r'#\s+(.+)', report_md.strip())
+        if title_match: parsed['title'] = title_match.group(1).strip()
+        for match in re.finditer(r'^## (.+?)\n\n(.*?)(?=^## |\Z)', report_md, re.MULTILINE | re.DOTALL):
+            heading, body = match.group(1).strip(), match.group(2).strip()
+            if heading == "Abstract": parsed['abstract'] = body
+            elif heading != "Bibliography": parsed['sections'][heading] = body
+        return parsed
+
+    def _citation_map(self, text: str) -> Dict[str, str]:
+        """Maps every `[n]` citation in `text` to the URL of source n."""
+        return {n: self.state.results[int(n) - 1]['url'] for n in sorted(set(re.findall(r'\[(\d+)\]', text)), key=int)
+                if 0 < int(n) <= len(self.state.results)}
+
+    def _record_section(self, block: Dict[str, Any], chunks: Optional[List[Dict[str, Any]]], text: str):
+        """Stores a finished section with its evidence set and citation mapping for later incremental runs."""
+        if not chunks: return
+        self.state.sections[block['topic']] = {
+            'block': dict(block),
+            'evidence': sorted(chunk['chunk_id'] for chunk in chunks),
+            'citations': self._citation_map(text),
+            'text': text,
+        }
+
+    async def _finish_section(self, block: Dict[str, Any], chunks: Optional[List[Dict[str, Any]]], section: Awaitable[str]) -> str:
+        """Awaits a section, records it on the state and hands it to the pipeline (checkpoint, events)."""
+        text = await section
+        self._record_section(block, chunks, text)
+        if self.on_section_complete: await self.on_section_complete(block, text)
+        return text
+
+    def _reusable_previous_section(self, block: Dict[str, Any], chunks: Optional[List[Dict[str, Any]]], trust_recorded: bool = False) -> Optional[str]:
+        """
+        Returns a previous run's text for `block` if it can be reused verbatim.
+
+        That requires the same outline block, exactly the same retrieved evidence (chunk ids),
+        and citations that still point at the same sources. Text from a supplied previous
+        report takes precedence over the text stored in the state. With `trust_recorded`
+        (resuming an interrupted synthesis) the evidence check is skipped, since the record
+        was written by this same run before other sections' reflexion grew the knowledge base.
+        """
+        record = self.state.sections.get(block.get('topic'))
+        if not record or not chunks or record.get('block') != block: return None
+        if not trust_recorded and record.get('evidence') != sorted(chunk['chunk_id'] for chunk in chunks): return None
+        text = self.previous_report.get('sections', {}).get(block['topic'], record.get('text'))
+        if not text or is_failed_section(text) or self._citation_map(text) != record.get('citations'): return None
+        return text
+
+    @staticmethod
+    def _evidence_overlap(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+        """Jaccard overlap between two sets of retrieved chunk ids."""
+        if not a and not b: return 1.0
+        return len(a & b) / len(a | b)
+
+    @traced("speculative_drafts")
+    async def update_speculative_drafts(self, saturated_topics: List[str]):
+        """
+        Drafts saturated sections in the background while research continues.
+
+        A section is drafted once its topic saturates. On later cycles its evidence is
+        re-retrieved (cheap: the query embedding is cached) and the draft is only
+        cancelled and redone if the retrieved chunk set changed significantly.
+        """
+        blocks = [block for block in self.state.outline
+                  if block.get('topic') and (block['topic'] in saturated_topics or block['topic'] in self.speculative_drafts)]
+        if not blocks or not self.state.all_chunks: return
+
+        for block, chunks in zip(blocks, await self._retrieve_section_contexts(blocks)):
+            if not chunks: continue
+            topic_str = block['topic']
+            evidence = frozenset(chunk['chunk_id'] for chunk in chunks)
+            draft = self.speculative_drafts.get(topic_str)
+            if draft and draft['block'] == block and self._evidence_overlap(draft['evidence'], evidence) >= self.config.speculative_min_evidence_overlap:
+                continue
+            if draft:
+                draft['task'].cancel()
+                self.logger.info(f"Speculative draft for '{topic_str}' invalidated by new evidence. Redrafting.")
+            else:
+                self.logger.info(f"Topic '{topic_str}' has saturated. Drafting its section in the background.")
+            self.speculative_drafts[topic_str] = {
+                'block': dict(block),
+                'evidence': evidence,
+                'task': asyncio.create_task(self._synthesise_section_with_citations(block, chunks)),
+            }
+
+    def _reusable_speculative_draft(self, block: Dict[str, Any], chunks: Optional[List[Dict[str, Any]]]) -> Optional["asyncio.Task[str]"]:
+        """Returns the background draft task for `block` if its evidence still matches the final retrieval."""
+        draft = self.speculative_drafts.get(block.get('topic'))
+        if not draft or not chunks or draft['block'] != block: return None
+        task = draft['task']
+        if task.cancelled() or (task.done() and (task.exception() is not None or is_failed_section(task.result()))): return None
+        evidence = frozenset(chunk['chunk_id'] for chunk in chunks)
+        if self._evidence_overlap(draft['evidence'], evidence) < self.config.speculative_min_evidence_overlap: return None
+        self.logger.info(f"Reusing speculative draft for section '{block['topic']}'.")
+        return task
+
+    async def _draft_or_synthesis(self, block: Dict[str, Any], chunks: Optional[List[Dict[str, Any]]], draft: "asyncio.Task[str]") -> str:
+        """The speculative draft's text once it finishes, or a fresh synthesis of the section if the draft failed."""
+        await asyncio.wait({draft})
+        if not draft.cancelled() and draft.exception() is None and not is_failed_section(draft.result()):
+            return draft.result()
+        self.logger.warning(f"Speculative draft for section '{block['topic']}' failed. Synthesizing it again.")
+        return await self._synthesise_section_with_citations(block, chunks)
+
+    def cancel_speculative_drafts(self):
+        """Cancels any background drafts still running and forgets all drafts."""
+        for draft in self.speculative_drafts.values():
+            if not draft['task'].done(): draft['task'].cancel()
+        self.speculative_drafts.clear()
+
     def _clean_section_text(self, text: str) -> str:
         """Removes hallucinated 'References' or 'Bibliography' sections from LLM output."""
         cleaned_text = re.sub(
@@ -73,82 +271,116 @@ class SynthesisComponent:
             self.logger.info("Cleaned a hallucinated bibliography from a generated section.")
         return cleaned_text.strip()
 
-    async def _synthesise_section_with_citations(self, block: Dict[str, Any]) -> str:
-        """Synthesizes a single section of the report based on a topic block from the outline."""
+    def _section_focus_query(self, block: Dict[str, Any]) -> str:
+        """Builds the retrieval query for a section from its topic and subtopics."""
+        section_focus_query = f"{block.get('topic')}"
+        subtopics_str = ", ".join(block.get('subtopics', []))
+        if subtopics_str:
+            section_focus_query += f": {subtopics_str}"
+        return section_focus_query
+
+    @traced("synthesis.retrieve")
+    async def _retrieve_section_contexts(self, blocks: List[Dict[str, Any]]) -> List[Optional[List[Dict[str, Any]]]]:
+        """
+        Retrieves diverse top-k context chunks for every section in one batched pass.
+
+        All section HyDE documents are embedded together, scored against the whole
+        knowledge base with a single matrix product, and each section's context is
+        then picked with maximal-marginal-relevance to avoid near-duplicate excerpts.
+
+        Returns:
+            One list of chunk dicts (`text`, `source_idx`, `similarity`, `chunk_id`) per block, in
+            order, or None for a block whose query could not be embedded.
+        """
+        if not blocks or not self.state.all_chunks:
+            return [[] for _ in blocks]
+
+        focus_queries = [self._section_focus_query(block) for block in blocks]
+        # Section query embeddings are cached on the state so repeated retrievals (speculative drafts,
+        # final synthesis) rank against the same HyDE vector and their evidence sets stay comparable.
+        missing_queries = [q for q in dict.fromkeys(focus_queries) if q not in self.state.section_query_embeddings]
+        if missing_queries:
+            hyde_docs = await self.analysis.generate_hypothetical_documents(missing_queries)
+            for focus_query, emb in zip(missing_queries, await self.analysis._embed_texts_with_cache(list(hyde_docs))):
+                if emb: self.state.section_query_embeddings[focus_query] = emb
+        query_embs = [self.state.section_query_embeddings.get(q) for q in focus_queries]
+
+        kb_texts, kb_sources, kb_embs = [], [], []
+        for chunk_text, source_idx in self.state.all_chunks:
+            chunk_emb = self.state.chunk_embedding_cache.get(hash_txt(chunk_text))
+            if chunk_emb:
+                kb_texts.append(chunk_text)
+                kb_sources.append(source_idx)
+                kb_embs.append(chunk_emb)
+        if not kb_embs:
+            return [[] for _ in blocks]
+
+        embedded_rows = [i for i, emb in enumerate(query_embs) if emb]
+        results: List[Optional[List[Dict[str, Any]]]] = [None] * len(blocks)
+        if not embedded_rows:
+            return results
+
+        ranked = await run_cpu("compute", _mmr_rank, [query_embs[i] for i in embedded_rows], kb_embs,
+                               self.context_top_k, self.config.mmr_candidate_pool, self.config.mmr_lambda)
+        for block_idx, (picked, sims) in zip(embedded_rows, ranked):
+            results[block_idx] = [{'text': kb_texts[j], 'source_idx': kb_sources[j], 'similarity': float(sim), 'chunk_id': hash_txt(kb_texts[j])} for j, sim in zip(picked, sims)]
+        self.logger.info(f"Retrieved MMR context for {len(embedded_rows)}/{len(blocks)} sections from {len(kb_texts)} chunks.")
+        return results
+
+    @traced("synthesis.section")
+    async def _synthesise_section_with_citations(self, block: Dict[str, Any], top_k_chunks_data: Optional[List[Dict[str, Any]]]) -> str:
+        """Synthesizes a single section of the report from its pre-retrieved context chunks."""
         topic_str = block.get('topic')
         if not topic_str:
             self.logger.warning("Skipping synthesis for block with no topic.")
             return ""
 
         self.logger.info(f"Synthesizing section: '{topic_str}'")
-        
         subtopics_str = ", ".join(block.get('subtopics', []))
-        section_focus_query = f"{topic_str}"
-        if subtopics_str:
-            section_focus_query += f": {subtopics_str}"
 
         if not self.state.all_chunks:
             return f"No information found in the knowledge base for the topic: {topic_str}."
 
-        hyde_section_query_doc = await self.analysis._generate_hypothetical_document(section_focus_query)
-        query_emb_list = await a_embed(hyde_section_query_doc)
-
-        if not query_emb_list:
+        if top_k_chunks_data is None:
             self.logger.warning(f"Could not embed query for section '{topic_str}'. Skipping synthesis.")
             return f"Could not process query for section: {topic_str}."
-        query_emb_np = np.array(query_emb_list)
-
-        chunk_data_for_section = []
-        for chunk_text, source_idx in self.state.all_chunks:
-            chunk_hash = hash_txt(chunk_text)
-            chunk_emb = self.state.chunk_embedding_cache.get(chunk_hash)
-            if chunk_emb:
-                chunk_data_for_section.append({'text': chunk_text, 'emb': np.array(chunk_emb), 'source_idx': source_idx})
-        
-        if not chunk_data_for_section:
-            return f"No embedded chunks available for synthesizing section: {topic_str}."
-
-        for chunk_item in chunk_data_for_section:
-            chunk_item['similarity'] = (np.dot(query_emb_np, chunk_item['emb']) / 
-                                       (np.linalg.norm(query_emb_np) * np.linalg.norm(chunk_item['emb'])))
-        
-        chunk_data_for_section.sort(key=lambda x: x['similarity'], reverse=True)
-        top_k_chunks_data = chunk_data_for_section[:Settings.TOP_K_RESULTS_PER_SECTION]
 
         if not top_k_chunks_data:
             return f"No relevant information found for section: {topic_str} after similarity ranking."
 
-        context_for_llm = ""
-        initial_source_indices = set()
-        for chunk_item in top_k_chunks_data:
-            source_id = chunk_item['source_idx']
-            initial_source_indices.add(source_id)
-            context_for_llm += f"[Source {source_id + 1}]: {chunk_item['text']}\n\n"
-        
+        excerpts = [{'text': item['text'], 'score': item['similarity'], 'label': f"[Source {item['source_idx'] + 1}]", 'source_idx': item['source_idx']}
+                    for item in top_k_chunks_data]
+        context_for_llm, packed_excerpts = pack_excerpts(excerpts, self.config.synthesis_context_tokens, self.config.chat_model)
+        initial_source_indices = {excerpt['source_idx'] for excerpt in packed_excerpts}
+
         if not context_for_llm.strip():
              return f"No relevant context constructed for section: {topic_str}."
 
         prompt = [{"role": "system", "content": PROMPTS.SECTION_SYNTHESIZER}, 
                   {"role": "user", "content": f"Topic: {topic_str}\nSubtopics to consider: {subtopics_str}\n\nExcerpts:\n{context_for_llm}"}]
         
-        raw_section = await a_chat(prompt, max_tokens=1500, temp=0.4) 
+        raw_section = await a_chat(prompt, model=self.config.chat_model, max_tokens=1500, temp=0.4, task="section") 
         if raw_section.startswith("Error:"):
             self.logger.error(f"LLM failed to synthesize section '{topic_str}': {raw_section}")
-            return f"Failed to synthesize section: {topic_str}. LLM Error."
+            return f"{FAILED_SECTION_PREFIX} {topic_str}. LLM Error."
 
         cleaned_section = self._clean_section_text(raw_section)
         final_section = await self._reflexion_pass(block, cleaned_section, context_for_llm, initial_source_indices)
         final_section = re.sub(r'\[[Ss]ource\s*(\d+)\]', r'[\1]', final_section)
         return final_section
 
-    async def _search_and_fetch_for_reflexion(self, query: str, existing_source_urls: set, topic: str) -> Tuple[str, Set[str]]:
-        """Performs a targeted web search during the reflexion pass to fill knowledge gaps."""
+    async def _search_and_fetch_for_reflexion(self, query: str, existing_source_urls: set, topic: str) -> Tuple[List[Dict[str, Any]], Set[str]]:
+        """
+        Performs a targeted web search during the reflexion pass to fill knowledge gaps.
+
+        Returns the new sources' chunks as excerpts scored by similarity to `query`
+        (ready for `pack_excerpts`), and the set of newly added URLs.
+        """
         self.logger.info(f"Reflexion: Searching for '{query}' to enhance topic '{topic}'")
         hits = await searx_search(query, limit=2) 
         
-        newly_added_urls = set()
         urls_to_fetch = []
-        
+
         for hit in hits:
             url = hit.get('url')
             if url and url not in self.state.url_to_source_index and url not in existing_source_urls:
@@ -156,56 +388,64 @@ class SynthesisComponent:
         
         if not urls_to_fetch:
             self.logger.info("Reflexion search: No new, unique URLs found.")
-            return "", set()
+            return [], set()
             
+        urls_to_fetch = urls_to_fetch[:reserve_fetches(len(urls_to_fetch))]
+        if not urls_to_fetch:
+            self.logger.info(f"Reflexion: fetch budget exhausted; no pages fetched for '{query}'.")
+            return [], set()
         fetched_contents_tasks = [fetch_clean(url) for url in urls_to_fetch]
         fetched_contents = await asyncio.gather(*fetched_contents_tasks)
-        
-        new_context_str = ""
-        
-        relevant_hits_info = [h for h in hits if h.get('url') in urls_to_fetch]
-
-        for url, content, hit_info in zip(urls_to_fetch, fetched_contents, relevant_hits_info): 
-            if content and len(content) > 100: 
-                source_idx = -1
-                async with self.source_lock: 
-                    if url not in self.state.url_to_source_index: 
-                        source_idx = len(self.state.results)
-                        self.state.results.append({"url": url, "title": hit_info.get('title', "Untitled Reflexion Source"), "query": f"reflexion: {query}"})
-                        self.state.url_to_source_index[url] = source_idx
-                        
-                        new_source_chunks = sentence_chunks(content)
-                        new_source_chunk_embeddings = await self.analysis._embed_texts_with_cache(new_source_chunks)
-                        
-                        for chunk_text, chunk_emb in zip(new_source_chunks, new_source_chunk_embeddings):
-                            if chunk_emb:
-                                chunk_hash = hash_txt(chunk_text)
-                                self.state.all_chunks.append((chunk_text, source_idx))
-                                self.state.chunk_embedding_cache[chunk_hash] = chunk_emb
-                        
-                        self.logger.info(f"Reflexion: Added {len(new_source_chunks)} chunks from new source: {url}")
-
-                if source_idx != -1: 
-                    new_context_str += f"\n[Source {source_idx + 1}]: {content[:1000]}...\n" 
-                    newly_added_urls.add(url)
+
+        titles_by_url = {h.get('url'): h.get('title', "Untitled Reflexion Source") for h in hits}
+        reserved_sources = []
+        for url, content in zip(urls_to_fetch, fetched_contents):
+            if content and len(content) > 100:
+                # Reserve the index under the state's short lock; another section may have claimed this URL meanwhile.
+                source_idx = self.state.reserve_source(url, titles_by_url.get(url) or "Untitled Reflexion Source", f"reflexion: {query}")
+                if source_idx is not None:
+                    reserved_sources.append((url, source_idx, await run_cpu("compute", sentence_chunks, content, self.config.chunk_sentences)))
             else:
                 self.logger.info(f"Reflexion: No useful content fetched from {url}")
 
-        return new_context_str, newly_added_urls
+        if not reserved_sources:
+            return [], set()
+
+        # Embed outside any lock. The query rides along in the same batch so the new chunks can be ranked for packing.
+        flat_chunks = [(chunk_text, source_idx) for _, source_idx, chunks in reserved_sources for chunk_text in chunks]
+        query_emb, *chunk_embeddings = await self.analysis._embed_texts_with_cache([query] + [chunk_text for chunk_text, _ in flat_chunks])
+        self.state.commit_chunks([(chunk_text, source_idx, chunk_emb) for (chunk_text, source_idx), chunk_emb in zip(flat_chunks, chunk_embeddings)])
 
+        embedded = [(chunk_text, source_idx, chunk_emb) for (chunk_text, source_idx), chunk_emb in zip(flat_chunks, chunk_embeddings) if chunk_emb]
+        scores = cosine_matrix([query_emb], [chunk_emb for _, _, chunk_emb in embedded])[0] if query_emb and embedded else [0.0] * len(embedded)
+        new_excerpts: List[Dict[str, Any]] = [{'text': chunk_text, 'score': float(score), 'label': f"[Source {source_idx + 1}]"}
+                                              for (chunk_text, source_idx, _), score in zip(embedded, scores)]
+
+        newly_added_urls = set()
+        for url, source_idx, chunks in reserved_sources:
+            self.logger.info(f"Reflexion: Added {len(chunks)} chunks from new source: {url}")
+            newly_added_urls.add(url)
+
+        return new_excerpts, newly_added_urls
+
+    @traced("reflexion")
     async def _reflexion_pass(self, block: Dict[str, Any], initial_text: str, context: str, initial_source_indices: set) -> str:
         """Performs a self-correction loop on a synthesized section of text."""
         current_text, current_context = initial_text, context
+        new_evidence_excerpts: List[Dict[str, Any]] = []
         all_source_urls_for_section = {self.state.results[i]['url'] for i in initial_source_indices if i < len(self.state.results)}
         
         topic_str = block.get('topic', "Current Section")
 
-        for i in range(Settings.MAX_REFLEXION_LOOPS):
-            self.logger.info(f"Reflexion Pass {i+1}/{Settings.MAX_REFLEXION_LOOPS} for section '{topic_str}'")
+        for i in range(self.config.max_reflexion_loops):
+            if budget_pressure() >= self.config.budget_degrade_fraction:
+                self.logger.info(f"Skipping further reflexion for '{topic_str}' to stay within the run budget.")
+                return current_text
+            self.logger.info(f"Reflexion Pass {i+1}/{self.config.max_reflexion_loops} for section '{topic_str}'")
             review_prompt = [{"role": "system", "content": PROMPTS.REFLEXION_REVIEWER}, 
                              {"role": "user", "content": f"Topic: {topic_str}\n\nText to Review:\n{current_text}"}]
             
-            raw_review = await a_chat(review_prompt, temp=0.4, max_tokens=512)
+            raw_review = await a_chat(review_prompt, model=self.config.chat_model, temp=0.4, max_tokens=512, task="review")
             if raw_review.startswith("Error:"):
                 self.logger.error(f"Reflexion reviewer LLM failed: {raw_review}. Aborting reflexion for this section.")
                 return current_text 
@@ -242,9 +482,13 @@ class SynthesisComponent:
                         self.logger.warning("Could not re-parse review JSON for SEARCH query, reflexion_query remains None.")
 
                 if reflexion_query:
-                    new_evidence_context, newly_fetched_urls = await self._search_and_fetch_for_reflexion(reflexion_query, all_source_urls_for_section, topic_str)
+                    found_excerpts, newly_fetched_urls = await self._search_and_fetch_for_reflexion(reflexion_query, all_source_urls_for_section, topic_str)
+                    new_evidence_context = ""
+                    if found_excerpts:
+                        new_evidence_excerpts.extend(found_excerpts)
+                        new_evidence_context, _ = pack_excerpts(new_evidence_excerpts, self.config.reflexion_evidence_tokens, self.config.chat_model, already_included=[context])
                     if new_evidence_context:
-                        current_context += "\n--- NEW EVIDENCE (from Reflexion Search) ---\n" + new_evidence_context
+                        current_context = context + "\n\n--- NEW EVIDENCE (from Reflexion Search) ---\n" + new_evidence_context
                         all_source_urls_for_section.update(newly_fetched_urls)
                         critique += "\n(Note: New evidence has been found and added to the context for revision.)"
                     else:
@@ -256,12 +500,12 @@ class SynthesisComponent:
                                   {"role": "user", "content": f"Topic: {topic_str}\n\nFull Context (Original + New Evidence if any):\n{current_context}\n\nFlawed Draft:\n{current_text}\n\nReviewer's Feedback:\n{critique}\n\nRevised Section:"}]
             
             previous_text = current_text
-            current_text = await a_chat(resynthesis_prompt, max_tokens=1500, temp=0.4) 
+            current_text = await a_chat(resynthesis_prompt, model=self.config.chat_model, max_tokens=1500, temp=0.4, task="revision") 
             if current_text.startswith("Error:"):
                 self.logger.error(f"Reflexion rewriter LLM failed: {current_text}. Returning text from before this failed rewrite.")
                 return previous_text
         
-        self.logger.info(f"Finished reflexion for '{topic_str}' after {Settings.MAX_REFLEXION_LOOPS} loops.")
+        self.logger.info(f"Finished reflexion for '{topic_str}' after {self.config.max_reflexion_loops} loops.")
         return current_text
 
     def _make_bibliography(self, full_text: str) -> str:
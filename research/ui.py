@@ -2,26 +2,35 @@
 from pathlib import Path
 from typing import Dict, List
 
-from rich.console import Console
-from rich.panel import Panel
-from rich.progress import Progress, SpinnerColumn, TextColumn
-from rich.table import Table
-
-from agent_config import SCRIPT_VERSION, Settings
+from agent_config import SCRIPT_VERSION
 
 
 class UIMonitor:
-    """Handles all user-facing, non-detailed logging using the `rich` library."""
+    """
+    Handles all user-facing, non-detailed logging using the `rich` library.
+
+    `rich` is imported on first output, so runs in the 'detailed' style (the library and MCP
+    default) or the 'quiet' style (batch mode) never load it.
+    """
     def __init__(self, output_style: str):
         self.style = output_style
-        self.console = Console()
+        self._console = None
         self.live_progress = None
+        self.cycle_progress = None
+
+    @property
+    def console(self):
+        if self._console is None:
+            from rich.console import Console
+            self._console = Console()
+        return self._console
 
     def _is_active(self) -> bool:
         return self.style in ["summary", "progress"]
 
     def start(self, query: str):
         if not self._is_active(): return
+        from rich.panel import Panel
         self.console.print(Panel(
             f"[bold magenta]🔬 Starting Deep Research[/bold magenta]\n[cyan]Query:[/] \"{query}\"",
             title=f"[bold green]Research Engine v{SCRIPT_VERSION}[/bold green]",
@@ -30,6 +39,7 @@ class UIMonitor:
 
     def start_phase(self, text: str):
         if self.style != 'summary': return
+        from rich.progress import Progress, SpinnerColumn, TextColumn
         self.live_progress = Progress(SpinnerColumn(), TextColumn(f"[bold blue]{text}..."), console=self.console)
         self.live_progress.start()
     
@@ -38,12 +48,29 @@ class UIMonitor:
             self.live_progress.stop()
             self.live_progress = None
 
+    def start_cycles(self, max_cycles: int):
+        """Shows the research-cycle progress bar of the 'progress' style."""
+        if self.style != 'progress': return
+        from rich.progress import BarColumn, Progress, SpinnerColumn, TextColumn
+        self.cycle_progress = Progress(SpinnerColumn(), *Progress.get_default_columns(), BarColumn(), TextColumn("Research Cycles"), console=self.console)
+        self.cycle_progress.start()
+        self.cycle_progress.add_task("cycles", total=max_cycles)
+
+    def advance_cycles(self):
+        if self.cycle_progress: self.cycle_progress.update(self.cycle_progress.task_ids[0], advance=1)
+
+    def end_cycles(self):
+        if self.cycle_progress:
+            self.cycle_progress.stop()
+            self.cycle_progress = None
+
     def update_cycle_start(self, cycle: int, max_cycles: int):
         if self.style == 'summary':
             self.console.print(f"\n[bold]🔄 Cycle {cycle}/{max_cycles}: Planning next steps...[/bold]")
     
     def show_agent_plan(self, summary: str):
         if self.style == 'summary':
+            from rich.panel import Panel
             self.console.print(Panel(summary, title="[bold yellow]🧠 Agent Plan[/bold yellow]", border_style="yellow"))
 
     def show_action_summary(self, newly_added_info: Dict[str, List[str]], num_new_chunks: int):
@@ -52,6 +79,7 @@ class UIMonitor:
         if num_new_chunks == 0:
             self.console.print("[yellow]⚠️ No new information was added in this cycle.[/yellow]")
             return
+        from rich.table import Table
         table = Table(title=f"[bold green]📚 Added {num_new_chunks} new info snippets from {total_sources} source(s)[/bold green]", show_header=True, header_style="bold cyan")
         table.add_column("Search Query", style="dim", width=40)
         table.add_column("Found Source Title")
@@ -61,16 +89,23 @@ class UIMonitor:
                 table.add_row(f'"{query}"' if i == 0 else "", f"• {title}")
         self.console.print(table)
 
-    def show_diminishing_returns(self, gain: float):
+    def show_diminishing_returns(self, gain: float, threshold: float):
+        if not self._is_active(): return
+        self.console.print(f"[bold yellow]⚠️ Diminishing returns detected (avg. gain {gain:.4f} < {threshold}). Moving to synthesis.[/bold yellow]")
+
+    def show_outline_evolved(self, topic: str):
         if not self._is_active(): return
-        self.console.print(f"[bold yellow]⚠️ Diminishing returns detected (avg. gain {gain:.4f} < {Settings.DIMINISHING_RETURNS_THRESHOLD}). Moving to synthesis.[/bold yellow]")
+        from rich.panel import Panel
+        self.console.print(Panel(f"New research area added to outline: [bold cyan]{topic}[/bold cyan]", title="[bold yellow]🧬 Outline Evolved[/bold yellow]", border_style="yellow"))
 
     def start_synthesis(self):
         if not self._is_active(): return
+        from rich.panel import Panel
         self.console.print(Panel("[bold blue]✍️ All research cycles complete. Synthesizing final report...[/bold blue]", border_style="blue"))
 
     def end(self, report_path: Path):
         if not self._is_active(): return
+        from rich.panel import Panel
         self.console.print(Panel(
             f"[bold green]🎉 Report Finished![/bold green]\n[cyan]Full report saved to:[/] {report_path.resolve()}",
             title="[bold green]Synthesis Complete[/bold green]",
@@ -0,0 +1,92 @@
+"""
+Tests of multi-item prompt batching, offline: `parse_batch` on the answer formats models produce,
+and `a_chat_batch` with the chat call replaced by a scripted one.
+
+    python -m pytest test_batching.py
+"""
+import asyncio
+
+import pytest
+
+import agent_batching
+from agent_batching import ITEM_MARKER, a_chat_batch, format_batch, parse_batch
+
+
+@pytest.mark.parametrize("raw", [
+    "### ITEM 1\nfirst answer\n\n### ITEM 2\nsecond answer\n",
+    "**ITEM 1:**\nfirst answer\n**ITEM 2:**\nsecond answer",
+    "ITEM 1\nfirst answer\n## item 2:\nsecond answer",
+])
+def test_item_headers(raw):
+    assert parse_batch(raw, 2) == {0: "first answer", 1: "second answer"}
+
+
+def test_answers_keep_their_own_lines():
+    raw = "### ITEM 1\nline one\nline two\n### ITEM 2\n- a\n- b"
+    assert parse_batch(raw, 2) == {0: "line one\nline two", 1: "- a\n- b"}
+
+
+def test_out_of_range_duplicate_and_empty_items_are_dropped():
+    raw = "### ITEM 0\nzero\n### ITEM 1\nfirst\n### ITEM 1\nagain\n### ITEM 2\n\n### ITEM 4\nfourth"
+    assert parse_batch(raw, 3) == {0: "first"}
+
+
+def test_json_list():
+    assert parse_batch('```json\n["a", "b", "c"]\n```', 3) == {0: "a", 1: "b", 2: "c"}
+
+
+def test_json_list_of_the_wrong_length_is_ignored():
+    assert parse_batch('["a", "b"]', 3) == {}
+
+
+def test_json_dict_keyed_by_item_number():
+    assert parse_batch('{"2": "second", "1": "first", "7": "out of range", "x": "not an item"}', 3) == {0: "first", 1: "second"}
+
+
+def test_unparseable_response_yields_nothing():
+    assert parse_batch("Sorry, I can only answer one question at a time.", 2) == {}
+    assert parse_batch("{not json", 2) == {}
+
+
+def test_format_batch_numbers_the_items():
+    messages = format_batch("Summarize.", ["x", "y"])
+    assert "2 numbered items" in messages[0]["content"]
+    assert messages[1]["content"] == f"{ITEM_MARKER} 1\nx\n\n{ITEM_MARKER} 2\ny"
+
+
+@pytest.fixture
+def scripted_chat(monkeypatch):
+    """Replaces the chat call: batched requests get `batch_answer`, single ones echo their item."""
+    calls = []
+
+    def install(batch_answer):
+        async def a_chat(messages, **kwargs):
+            calls.append(messages[-1]["content"])
+            return batch_answer if ITEM_MARKER in messages[-1]["content"] else f"answer to {messages[-1]['content']}"
+        monkeypatch.setattr(agent_batching, "a_chat", a_chat)
+        return calls
+    return install
+
+
+def test_complete_batch_is_one_request(scripted_chat):
+    calls = scripted_chat("### ITEM 1\nA\n### ITEM 2\nB\n### ITEM 3\nC")
+    assert asyncio.run(a_chat_batch("Summarize.", ["x", "y", "z"], max_tokens=100, batch_size=3)) == ["A", "B", "C"]
+    assert len(calls) == 1
+
+
+def test_items_missing_from_the_batch_are_asked_one_by_one(scripted_chat):
+    calls = scripted_chat("### ITEM 2\nB")
+    assert asyncio.run(a_chat_batch("Summarize.", ["x", "y", "z"], max_tokens=100, batch_size=3)) == ["answer to x", "B", "answer to z"]
+    assert calls[1:] == ["x", "z"]
+
+
+def test_failed_batch_falls_back_for_every_item(scripted_chat):
+    calls = scripted_chat("Error: Could not get response from language model.")
+    assert asyncio.run(a_chat_batch("Summarize.", ["x", "y"], max_tokens=100, batch_size=2)) == ["answer to x", "answer to y"]
+    assert len(calls) == 3
+
+
+def test_batches_are_split_by_size_and_keep_order(scripted_chat):
+    calls = scripted_chat("### ITEM 1\nA\n### ITEM 2\nB")
+    assert asyncio.run(a_chat_batch("Summarize.", ["w", "x", "y", "z", "v"], max_tokens=100, batch_size=2)) == ["A", "B", "A", "B", "answer to v"]
+    assert len(calls) == 3
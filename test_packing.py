@@ -0,0 +1,114 @@
+"""
+Tests of prompt packing under a token budget (`truncate_to_tokens`, `pack_excerpts`), with a real
+tokenizer, a word-level one and the character-length estimate used when none can be loaded.
+
+    python -m pytest test_packing.py
+"""
+import re
+
+import pytest
+
+import research.packing
+from research.packing import count_tokens, pack_excerpts, truncate_to_tokens
+
+
+class _WordEncoder:
+    """One token per word with its leading whitespace, so decoding a token prefix gives a text prefix."""
+    def encode(self, text, disallowed_special=()):
+        return re.findall(r"\s*\S+|\s+", text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+@pytest.fixture(params=["tiktoken", "words", "chars"])
+def tokenizer(request, monkeypatch):
+    if request.param == "tiktoken":
+        tiktoken = pytest.importorskip("tiktoken")
+        try:
+            encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:  # the BPE file is downloaded on first use
+            pytest.skip(f"tiktoken encoding unavailable: {e}")
+    else:
+        encoder = _WordEncoder() if request.param == "words" else None
+    monkeypatch.setattr(research.packing, "_get_encoder", lambda model: encoder)
+    return request.param
+
+
+REPORT = (
+    "## Storage\n\n"
+    "Batteries shift solar output into the evening peak. Pumped hydro still holds most of the capacity.\n\n"
+    "- Lithium-ion: four hours or less.\n"
+    "- Flow batteries: longer durations, lower density.\n\n"
+    "## Markets\n\n"
+    "Capacity payments reward firm power! Do they reward storage fairly? Regulators disagree."
+)
+
+
+def test_text_within_budget_is_returned_unchanged(tokenizer):
+    assert truncate_to_tokens(REPORT, count_tokens(REPORT)) == REPORT
+    assert truncate_to_tokens(REPORT, 0) == ""
+
+
+@pytest.mark.parametrize("fraction", [0.15, 0.3, 0.5, 0.8, 0.95])
+def test_truncation_is_a_prefix_within_budget(tokenizer, fraction):
+    budget = max(1, int(count_tokens(REPORT) * fraction))
+    truncated = truncate_to_tokens(REPORT, budget)
+    assert truncated and REPORT.startswith(truncated)
+    assert count_tokens(truncated) <= budget
+
+
+def test_truncation_ends_at_a_sentence_or_line(tokenizer):
+    truncated = truncate_to_tokens(REPORT, count_tokens(REPORT) // 2)
+    assert truncated.endswith((".", "!", "?")) or REPORT[len(truncated)] == "\n"
+
+
+def test_first_sentence_that_does_not_fit_is_cut(tokenizer):
+    sentence = "A single long sentence about grid storage without any boundary to stop at"
+    truncated = truncate_to_tokens(sentence, 5)
+    assert truncated and sentence.startswith(truncated) and count_tokens(truncated) <= 5
+
+
+def test_duplicate_sentences_are_packed_once(tokenizer):
+    excerpts = [{'text': "Batteries shift solar output. Hydro holds most capacity.", 'score': 2.0, 'label': "[Source 1]"},
+                {'text': "Hydro holds most capacity. Flow batteries last longer.", 'score': 1.0, 'label': "[Source 2]"}]
+    packed, included = pack_excerpts(excerpts, 1000)
+    assert packed.count("Hydro holds most capacity.") == 1
+    assert "[Source 2]: Flow batteries last longer." in packed
+    assert included == excerpts
+
+
+def test_already_included_text_is_not_repeated(tokenizer):
+    excerpts = [{'text': "Batteries shift solar output. Hydro holds most capacity.", 'score': 2.0},
+                {'text': "Capacity payments reward firm power.", 'score': 1.0}]
+    packed, included = pack_excerpts(excerpts, 1000, already_included=["Intro. Capacity payments reward firm power."])
+    assert "Capacity payments" not in packed
+    assert included == excerpts[:1]
+
+
+def test_sentence_left_out_of_the_budget_is_not_marked_seen(tokenizer):
+    sentence = "Pumped hydro still holds most of the storage capacity worldwide."
+    budget = count_tokens(sentence) + 2
+    # The first excerpt's label alone exhausts the budget, so its sentence is not packed...
+    excerpts = [{'text': sentence, 'score': 2.0, 'label': f"[Source 1, on: {sentence}]"},
+                {'text': sentence, 'score': 1.0}]
+    packed, included = pack_excerpts(excerpts, budget)
+    # ...and must still be packed from the next excerpt that has it.
+    assert packed == sentence
+    assert included == excerpts[1:]
+
+
+def test_trimmed_excerpt_keeps_whole_sentences(tokenizer):
+    text = "Batteries shift solar output. Pumped hydro still holds most of the storage capacity worldwide."
+    packed, included = pack_excerpts([{'text': text, 'score': 1.0}], count_tokens("Batteries shift solar output.") + 1)
+    assert packed == "Batteries shift solar output."
+    assert len(included) == 1
+
+
+@pytest.mark.parametrize("budget", [10, 40, 80, 160])
+def test_packed_block_stays_within_budget(tokenizer, budget):
+    paragraphs = [p for p in REPORT.split("\n\n") if not p.startswith("#")]
+    excerpts = [{'text': p, 'score': float(-i), 'label': f"[Source {i + 1}]"} for i, p in enumerate(paragraphs * 2)]
+    packed, included = pack_excerpts(excerpts, budget)
+    assert count_tokens(packed) <= budget
+    assert all(excerpt in excerpts for excerpt in included)
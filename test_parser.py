@@ -1,57 +1,58 @@
+"""
+Regression tests of page parsing, offline: HTML and PDF pages of the benchmark's fixture corpus
+are served by the local stand-in web server and go through `fetch_clean`, as in a research run.
+
+    python -m pytest test_parser.py
+"""
 import asyncio
-from pathlib import Path
-
-# Important: This imports the functions from your main script
-from research_engine_R1_01 import _parse_pdf_bytes, fetch_clean, log
-
-# We need a dummy URL to use the cache key mechanism in fetch_clean
-# The file path will be used to read the bytes directly.
-TEXT_PDF_PATH = Path("./test_assets/text_based.pdf")
-SCANNED_PDF_PATH = Path("./test_assets/scanned.pdf")
-HTML_TEST_URL = "https://www.w3.org/TR/html52/" # A simple HTML page for regression testing
-
-async def test_pdf_parsing(pdf_path: Path):
-    """Reads a local PDF and runs it through the parsing logic."""
-    log.info(f"--- TESTING PDF: {pdf_path.name} ---")
-    if not pdf_path.exists():
-        log.error(f"Test file not found: {pdf_path.resolve()}")
-        return
-
-    # Read the local PDF file as bytes
-    pdf_bytes = pdf_path.read_bytes()
-
-    # Call the core parsing function directly
-    extracted_text = await _parse_pdf_bytes(pdf_bytes)
-
-    print("\n--- EXTRACTED TEXT (first 500 chars) ---")
-    print(extracted_text[:500])
-    print("-------------------------------------------\n")
-
-async def test_html_parsing(url: str):
-    """Tests the standard HTML fetching to ensure it wasn't broken."""
-    log.info(f"--- TESTING HTML URL: {url} ---")
-    
-    # Use fetch_clean which handles both HTML and remote PDFs
-    extracted_text = await fetch_clean(url)
-
-    print("\n--- EXTRACTED TEXT (first 500 chars) ---")
-    print(extracted_text[:500])
-    print("-------------------------------------------\n")
-
-
-async def main():
-    # --- Test Case 1: Standard Text-Based PDF ---
-    # EXPECTED: PyMuPDF succeeds, no fallback to GPT-4o.
-    await test_pdf_parsing(TEXT_PDF_PATH)
-
-    # --- Test Case 2: Scanned/Image-Based PDF ---
-    # EXPECTED: PyMuPDF extracts little/no text, triggers the GPT-4o fallback.
-    await test_pdf_parsing(SCANNED_PDF_PATH)
-    
-    # --- Test Case 3: Standard HTML Page (Regression Test) ---
-    # EXPECTED: BeautifulSoup succeeds, no PDF logic is triggered.
-    await test_html_parsing(HTML_TEST_URL)
-
-
-if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+import re
+
+import pytest
+
+from agent_executor import shutdown_executors
+from agent_helpers import close_http_session, fetch_clean, parse_pdf_bytes
+from bench.fake_servers import FakeServerConfig, FakeServers
+from bench.fixtures import build_corpus
+
+CORPUS = build_corpus(pages=12, pdf_fraction=0.5, seed=1)
+
+
+@pytest.fixture(scope="module")
+def servers():
+    servers = FakeServers(CORPUS, FakeServerConfig(page_latency_ms=0.0)).start()
+    yield servers
+    servers.stop()
+    shutdown_executors(wait=False)
+
+
+def _normalized(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+async def _fetch(url: str) -> str:
+    try:
+        return await fetch_clean(url)
+    finally:
+        await close_http_session()
+
+
+@pytest.mark.parametrize("kind", ["html", "pdf"])
+def test_fetch_clean_extracts_page_text(servers, kind):
+    page = next(page for page in CORPUS if page.kind == kind)
+    text = _normalized(asyncio.run(_fetch(servers.base_url + page.path)))
+    for paragraph in page.text.split("\n\n"):
+        # PDF lines are wrapped, so compare word sequences rather than raw paragraphs.
+        assert _normalized(paragraph)[:80] in text
+    for boilerplate in ("var tracking", "Copyright fixture corpus", "About"):
+        assert boilerplate not in text
+
+
+def test_parse_pdf_bytes_keeps_all_pages_text():
+    page = next(page for page in CORPUS if page.kind == "pdf")
+    text = _normalized(asyncio.run(parse_pdf_bytes(page.body())))
+    assert page.title in text
+    assert _normalized(page.text.split("\n\n")[-1])[-60:] in text
+
+
+def test_missing_page_yields_no_text(servers):
+    assert asyncio.run(_fetch(servers.base_url + "/pages/missing.html")) == ""